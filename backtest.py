@@ -1,18 +1,34 @@
+import csv
 import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
 from datetime import datetime
-from langgraphPipe import graph
+from langgraphPipe import (graph, llm_cache, llm_gateway, decision_log, relevance_gate_report, cascade_report,
+                           use_point_in_time_index, get_market_index, stage_cache)
 from pprint import pprint
 import asyncio
 import time
+import rateLimit
+from cassette import cassette, DEFAULT_CASSETTE_PATH
+from tradeLog import CSV_FIELDS, rotate_stale_csv
 
 
-def load_tweets(filename):
-    """Load tweets from JSON file"""
+def load_tweet_file(filename):
+    """Load (account, tweets) from a scraper JSON dump"""
     with open(filename, 'r', encoding='utf-8') as f:
         data = json.load(f)
-    return data['tweets']
+    return data.get('username', ''), data['tweets']
+
+def load_tweets(filename):
+    """Load tweets from JSON file"""
+    return load_tweet_file(filename)[1]
 
-def prepare_tweet_state(tweet, index):
+def prepare_tweet_state(tweet, index, account=''):
     """Prepare tweet state for pipeline processing"""
     print(f"\n--- Processing tweet {index} ---")
     print(f"ID: {tweet['id']}")
@@ -43,33 +59,9 @@ def prepare_tweet_state(tweet, index):
         "selected_id": "",
         "token_id": "",
         "date": parsed_date.isoformat(),
+        "account": tweet.get('username') or account,
     }
 
-async def process_tweet_batch(tweets_batch, batch_num):
-    """Process a batch of tweets concurrently"""
-    print(f"\n🚀 Starting batch {batch_num} with {len(tweets_batch)} tweets")
-    batch_start = time.time()
-    
-    # Create tasks for concurrent processing
-    tasks = []
-    for i, tweet in enumerate(tweets_batch):
-        tweet_index = (batch_num - 1) * 10 + i + 1
-        initial_state = prepare_tweet_state(tweet, tweet_index)
-        task = asyncio.create_task(process_single_tweet(initial_state, tweet_index))
-        tasks.append(task)
-    
-    # Wait for all tweets in batch to complete
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    batch_time = time.time() - batch_start
-    success_count = sum(1 for r in results if not isinstance(r, Exception))
-    error_count = len(results) - success_count
-    
-    print(f"✅ Batch {batch_num} completed in {batch_time:.2f}s")
-    print(f"   Success: {success_count}, Errors: {error_count}")
-    
-    return results
-
 async def process_single_tweet(initial_state, tweet_index):
     """Process a single tweet through the pipeline"""
     try:
@@ -80,39 +72,323 @@ async def process_single_tweet(initial_state, tweet_index):
         print(f"❌ Tweet {tweet_index} error: {e}")
         return e
 
-async def backtest_tweets():
-    """Run backtest on Elon Musk tweets with concurrent batching"""
-    tweets = load_tweets('elonmusk_tweets.json')
+class Progress:
+    """Live throughput / ETA readout for a running backtest"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.start = time.time()
+
+    def update(self, ok):
+        self.done += 1
+        if not ok:
+            self.errors += 1
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        print(f"⏱️  {self.done}/{self.total} done ({self.errors} errors) | {rate:.2f} tweets/s | ETA {eta:.0f}s")
+
+async def run_bounded(tweets, concurrency=10, account='', indices=None, on_result=None):
+    """Sliding-window runner: `concurrency` workers, a new tweet starts as soon as any finishes.
+
+    `indices` are the tweets' positions in the full corpus (1-based, default 1..n);
+    `on_result(index, tweet, result)` is called as each tweet finishes.
+    """
+    queue = asyncio.Queue()
+    for position, tweet in enumerate(tweets):
+        queue.put_nowait((position, indices[position] if indices else position + 1, tweet))
+    results = [None] * len(tweets)
+    progress = Progress(len(tweets))
+
+    async def worker():
+        while True:
+            try:
+                position, index, tweet = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            initial_state = prepare_tweet_state(tweet, index, account)
+            result = await process_single_tweet(initial_state, index)
+            results[position] = result
+            if on_result is not None:
+                on_result(index, tweet, result)
+            progress.update(not isinstance(result, Exception))
+
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, len(tweets)) or 1)])
+    return results
+
+def configure_run(rate_limits=None, io_mode=None, cassette_path=None, point_in_time=False, rate_share=1.0,
+                  memoize=False):
+    """Apply per-run options in this process; `rate_share` splits rate limits across shard processes"""
+    if memoize:
+        stage_cache.enable()
+        print(f"🧊 Stage outputs memoized in {stage_cache.path}")
+    if point_in_time:
+        use_point_in_time_index()
+        print("🕰️  Retrieval limited to markets live at each tweet's date")
+    if io_mode:
+        cassette.configure(io_mode, cassette_path or DEFAULT_CASSETTE_PATH)
+    if cassette.mode != "off":
+        print(f"📼 External I/O mode: {cassette.mode} ({cassette.path})")
+        if stage_cache.enabled:
+            print("🧊 Stage cache bypassed while the cassette is active (every node's I/O must be recorded)")
+    
+    # Optional per-service limits, e.g. {"tavily": (2, None)} -> 2 requests/s
+    for service, (rate, burst) in (rate_limits or {}).items():
+        rate, burst = rate * rate_share, max(1.0, burst * rate_share) if burst else None
+        rateLimit.configure(service, rate, burst)
+        print(f"🚧 Rate limit {service}: {rate:g}/s" + (f" (burst {burst:g})" if burst else ""))
+
+def load_corpus(filename, limit):
+    account, tweets = load_tweet_file(filename)
     
     # Process subset for testing - adjust as needed
-    tweets = tweets[:50]  # Process first 50 tweets
+    if limit:
+        tweets = tweets[:limit]
+    return account, tweets
+
+async def backtest_tweets(filename='elonmusk_tweets.json', limit=50, concurrency=10, rate_limits=None,
+                         io_mode=None, cassette_path=None, point_in_time=False, memoize=False):
+    """Run backtest on Elon Musk tweets with bounded concurrency"""
+    configure_run(rate_limits, io_mode, cassette_path, point_in_time, memoize=memoize)
+    account, tweets = load_corpus(filename, limit)
     
     print(f"🎯 Starting concurrent backtest with {len(tweets)} tweets")
-    print(f"📦 Processing in batches of 10")
+    print(f"📦 Up to {concurrency} tweets in flight")
     
     total_start = time.time()
-    
-    # Split tweets into batches of 10
-    batch_size = 10
-    total_batches = (len(tweets) + batch_size - 1) // batch_size
-    
-    for batch_num in range(1, total_batches + 1):
-        start_idx = (batch_num - 1) * batch_size
-        end_idx = min(start_idx + batch_size, len(tweets))
-        tweets_batch = tweets[start_idx:end_idx]
-        
-        # Process batch
-        await process_tweet_batch(tweets_batch, batch_num)
-        
-        # Add small delay between batches to avoid overwhelming the system
-        if batch_num < total_batches:
-            print("⏸️  2 second pause between batches...")
-            await asyncio.sleep(2)
+    results = await run_bounded(tweets, concurrency, account)
     
     total_time = time.time() - total_start
-    print(f"\n🏁 All batches completed in {total_time:.2f}s")
-    print(f"📊 Average time per tweet: {total_time/len(tweets):.2f}s")
+    errors = sum(1 for r in results if isinstance(r, Exception))
+    print(f"\n🏁 All tweets completed in {total_time:.2f}s ({len(results) - errors} ok, {errors} errors)")
+    print(f"📊 Average time per tweet: {total_time/max(len(tweets), 1):.2f}s")
+    gate = relevance_gate_report()
+    print(f"🚦 Relevance gate: {gate['filtered']}/{gate['checked']} tweets filtered ({gate['filtered_fraction']:.0%}), ~{gate['est_seconds_saved']:.1f}s saved")
+    llm_stats = llm_gateway.report()
+    print(f"🧠 LLM gateway: {llm_stats['dispatched']} calls ({llm_stats['deduped']} deduped) | "
+          f"avg queue {llm_stats['avg_queue_seconds']:.2f}s | avg generation {llm_stats['avg_generation_seconds']:.2f}s")
+    cascade = cascade_report()
+    for decision, stats in cascade["decisions"].items():
+        failed = f", {stats['failed_escalations']} escalations failed" if stats.get('failed_escalations') else ""
+        print(f"🪜 {decision}: {stats['escalated']}/{stats['calls']} escalated ({stats['escalation_rate']:.0%}){failed}")
+    for tier, stats in cascade["tiers"].items():
+        print(f"🪜 {tier} tier: {stats['calls']} calls, avg {stats['avg_seconds']:.2f}s")
+    if point_in_time:
+        index_stats = get_market_index().report()
+        print(f"🕰️  Point-in-time index: {index_stats['markets']} markets, {index_stats['slices']} slices "
+              f"(avg {index_stats['avg_slice_size']:.0f} markets per slice)")
+    for node, stats in stage_cache.report().items():
+        print(f"🧊 {node}: {stats['hits']} reused, {stats['misses']} computed")
+    if cassette.mode != "off":
+        print(f"📼 Cassette: {cassette.hits} replayed, {cassette.recorded} recorded")
+    decision_log.close()  # flush queued trade decisions before reporting
+    print(f"📝 Decisions logged: {decision_log.written}")
+    if llm_cache is not None:
+        cache_stats = llm_cache.stats()
+        print(f"🗄️  LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+
+# --- Sharded runs ---
+# Each shard is a separate process with its own event loop, models and connections.
+# Tweets are dealt round-robin, results stream to per-shard files and are merged by index.
+
+def summarize_result(index, tweet, result) -> dict:
+    """One JSON-serializable line of a shard's results file"""
+    row = {"index": index, "tweet_id": tweet.get('id'), "timestamp": tweet.get('timestamp')}
+    if isinstance(result, Exception):
+        row.update({"ok": False, "error": f"{type(result).__name__}: {result}"})
+        return row
+    row.update({
+        "ok": True,
+        "relevance_score": result.get("relevance_score"),
+        "selected_id": result.get("selected_id") or None,
+        "token_id": result.get("token_id") or None,
+        "skip_reason": result.get("skip_reason") or None,
+    })
+    return row
+
+def run_shard(shard, shards, filename, limit, concurrency, out_dir, rate_limits=None,
+              io_mode=None, cassette_path=None, point_in_time=False, memoize=False):
+    """Process entrypoint: run every `shards`-th tweet starting at `shard`"""
+    shard_dir = os.path.join(out_dir, f"shard-{shard:02d}")
+    os.makedirs(shard_dir, exist_ok=True)
+    decision_log.redirect(os.path.join(shard_dir, "trades.csv"), decision_log.parquet_dir)  # Parquet parts are unique per process
+    configure_run(rate_limits, io_mode, cassette_path, point_in_time, rate_share=1.0 / shards, memoize=memoize)
+
+    account, tweets = load_corpus(filename, limit)
+    indices = list(range(shard + 1, len(tweets) + 1, shards))
+    started = time.time()
+    results_path = os.path.join(shard_dir, "results.jsonl")
+    with open(results_path, 'w', encoding='utf-8') as out:
+        def on_result(index, tweet, result):
+            out.write(json.dumps(summarize_result(index, tweet, result), default=str) + "\n")
+            out.flush()
+        results = asyncio.run(run_bounded([tweets[i - 1] for i in indices], concurrency, account, indices, on_result))
+    decision_log.close()
+
+    llm_stats = llm_gateway.report()
+    return {
+        "shard": shard,
+        "tweets": len(indices),
+        "errors": sum(1 for r in results if isinstance(r, Exception)),
+        "seconds": time.time() - started,
+        "decisions": decision_log.written,
+        "llm_calls": llm_stats["dispatched"],
+        "filtered": relevance_gate_report()["filtered"],
+        "results_path": results_path,
+        "trades_path": decision_log.csv_path,
+    }
+
+def merge_shards(shard_stats, out_dir, trades_csv):
+    """Merge shard results (ordered by corpus index) and append shard decisions (ordered by date) to `trades_csv`"""
+    rows = []
+    for stats in shard_stats:
+        with open(stats["results_path"], 'r', encoding='utf-8') as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    rows.sort(key=lambda row: row["index"])
+    merged_path = os.path.join(out_dir, "results.jsonl")
+    with open(merged_path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+    decisions = []
+    for stats in shard_stats:
+        if os.path.exists(stats["trades_path"]):
+            with open(stats["trades_path"], 'r', newline='', encoding='utf-8') as f:
+                decisions.extend(csv.DictReader(f))
+    decisions.sort(key=lambda row: row.get('date') or '')
+    rotate_stale_csv(trades_csv)
+    file_exists = os.path.exists(trades_csv) and os.path.getsize(trades_csv) > 0
+    with open(trades_csv, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(decisions)
+    return merged_path, len(rows), len(decisions)
+
+def backtest_sharded(filename='elonmusk_tweets.json', limit=50, concurrency=10, shards=None, out_dir=None,
+                     rate_limits=None, io_mode=None, cassette_path=None, point_in_time=False, memoize=False):
+    """Run the backtest across `shards` processes (default: one per core) and merge the results"""
+    shards = shards or os.cpu_count() or 1
+    out_dir = out_dir or os.path.join("backtest_runs", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(out_dir, exist_ok=True)
+    _, tweets = load_corpus(filename, limit)
+    shards = max(1, min(shards, len(tweets)))
+    print(f"🎯 Sharded backtest: {len(tweets)} tweets over {shards} processes, {concurrency} in flight each")
+    print(f"📁 Shard output in {out_dir}")
+
+    total_start = time.time()
+    shard_stats = []
+    # spawn, not fork: the parent already has threads (decision log, gateway) and model state
+    with ProcessPoolExecutor(max_workers=shards, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(run_shard, shard, shards, filename, limit, concurrency, out_dir,
+                        rate_limits, io_mode, cassette_path, point_in_time, memoize)
+            for shard in range(shards)
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            shard_stats.append(stats)
+            print(f"🧩 Shard {stats['shard']}: {stats['tweets']} tweets in {stats['seconds']:.1f}s "
+                  f"({stats['errors']} errors, {stats['filtered']} filtered, {stats['llm_calls']} LLM calls)")
+    shard_stats.sort(key=lambda stats: stats["shard"])
+
+    trades_csv = os.getenv("TRADE_LOG_CSV", "trades.csv")
+    merged_path, merged_rows, merged_decisions = merge_shards(shard_stats, out_dir, trades_csv)
+    total_time = time.time() - total_start
+    errors = sum(stats["errors"] for stats in shard_stats)
+    print(f"\n🏁 All tweets completed in {total_time:.2f}s ({merged_rows - errors} ok, {errors} errors) | "
+          f"{merged_rows / total_time if total_time > 0 else 0.0:.2f} tweets/s")
+    print(f"🔀 Merged results: {merged_path}")
+    print(f"📝 Decisions appended to {trades_csv}: {merged_decisions}")
+
+# --- Replay check ---
+# Records the corpus with whatever local caches exist, then replays it in a fresh process whose
+# LLM cache, price store and stage cache point at an empty directory. Matching decisions prove
+# the cassette alone reproduces the run (a gap shows up as CassetteMiss errors / missing rows).
+
+def read_decisions(path: str) -> Counter:
+    if not os.path.exists(path):
+        return Counter()
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        return Counter(
+            (row.get('date', ''), row.get('tweet', ''), row.get('action', ''), row.get('market_id', ''), row.get('token_id', ''))
+            for row in csv.DictReader(f)
+        )
+
+def check_replay(filename, limit, concurrency, cassette_path=None, point_in_time=False) -> bool:
+    """Record, replay against empty caches, and compare the two decision logs"""
+    cassette_path = os.path.abspath(cassette_path or DEFAULT_CASSETTE_PATH)
+    work_dir = tempfile.mkdtemp(prefix="replay-check-")
+    empty_caches = os.path.join(work_dir, "empty-caches")
+    os.makedirs(empty_caches)
+
+    def run(mode, trades_csv, extra_env=None):
+        command = [sys.executable, os.path.abspath(__file__), '--file', filename, '--limit', str(limit),
+                   '--concurrency', str(concurrency), '--io-mode', mode, '--cassette', cassette_path]
+        if point_in_time:
+            command.append('--point-in-time')
+        env = dict(os.environ, TRADE_LOG_CSV=trades_csv, TRADE_LOG_PARQUET_DIR="", **(extra_env or {}))
+        print(f"\n📼 Replay check: {mode} run -> {trades_csv}")
+        return subprocess.run(command, env=env).returncode
+
+    recorded_csv = os.path.join(work_dir, "record.csv")
+    replayed_csv = os.path.join(work_dir, "replay.csv")
+    if run("record", recorded_csv) != 0:
+        print("❌ Replay check: record run failed")
+        return False
+    run("replay", replayed_csv, {
+        "LLM_CACHE_PATH": os.path.join(empty_caches, "llm_cache.sqlite"),
+        "PRICE_STORE_DIR": os.path.join(empty_caches, "price_history"),
+        "STAGE_CACHE": "0",
+    })
+
+    recorded, replayed = read_decisions(recorded_csv), read_decisions(replayed_csv)
+    missing, extra = recorded - replayed, replayed - recorded
+    if not missing and not extra:
+        print(f"✅ Replay check: {sum(recorded.values())} decisions reproduced from the cassette with empty caches")
+        return True
+    print(f"❌ Replay check: {sum(missing.values())} recorded decisions not reproduced, {sum(extra.values())} unexpected")
+    for label, rows in (("missing", missing), ("unexpected", extra)):
+        for date, tweet, action, market_id, token_id in list(rows)[:10]:
+            print(f"   {label}: {date} {action} market={market_id or '-'} token={token_id or '-'} | {tweet[:60]}")
+    print(f"   Logs kept in {work_dir}")
+    return False
+
+def main():
+    """CLI entrypoint for running a backtest."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Backtest the tweet pipeline on a tweet dump.")
+    parser.add_argument('--file', default='elonmusk_tweets.json', help='Tweets JSON file ({"tweets": [...]})')
+    parser.add_argument('--limit', type=int, default=50, help='Number of tweets to process (0 = all)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Tweets processed concurrently')
+    parser.add_argument('--rate', action='append', default=[], metavar='SERVICE=PER_SEC[:BURST]',
+                        help='Rate limit for an external service (tavily, ollama, polymarket); repeatable')
+    parser.add_argument('--io-mode', choices=['off', 'record', 'replay', 'auto'], default=None,
+                        help='Record external responses to a cassette, or replay them with no network')
+    parser.add_argument('--cassette', default=None, help=f'Cassette file (default {DEFAULT_CASSETTE_PATH})')
+    parser.add_argument('--point-in-time', action='store_true',
+                        help='Only match markets that were listed and not yet expired at each tweet\'s date')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Worker processes (0 = one per core); >1 runs a sharded backtest')
+    parser.add_argument('--out-dir', default=None, help='Directory for per-shard and merged results')
+    parser.add_argument('--stage-cache', action='store_true',
+                        help='Memoize node outputs so reruns only recompute stages whose inputs or config changed')
+    parser.add_argument('--check-replay', action='store_true',
+                        help='Record the corpus, replay it with empty local caches and compare decisions')
+    args = parser.parse_args()
+    if args.check_replay:
+        ok = check_replay(args.file, args.limit, args.concurrency, args.cassette, args.point_in_time)
+        sys.exit(0 if ok else 1)
+    if args.shards != 1:
+        backtest_sharded(args.file, args.limit, args.concurrency, args.shards or None, args.out_dir,
+                         rateLimit.parse_rate_specs(args.rate), args.io_mode, args.cassette, args.point_in_time,
+                         args.stage_cache)
+        return
+    asyncio.run(backtest_tweets(args.file, args.limit, args.concurrency, rateLimit.parse_rate_specs(args.rate),
+                                args.io_mode, args.cassette, args.point_in_time, args.stage_cache))
 
 if __name__ == "__main__":
-    asyncio.run(backtest_tweets())
+    main()
 
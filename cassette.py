@@ -0,0 +1,124 @@
+# cassette.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+DEFAULT_CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "backtest.sqlite")
+MODES = ("off", "record", "replay", "auto")
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"Cannot record {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    return obj
+
+
+class Cassette:
+    """Record-and-replay store for external I/O (Tavily, Ollama, /prices-history, Postgres reads).
+
+    Responses are stored in one SQLite file keyed by (service, sha256 of the request).
+      off    - pass through
+      record - call the service and store the response
+      replay - serve from the store only; a miss raises CassetteMiss (no network)
+      auto   - serve recorded responses, record the rest
+    """
+
+    def __init__(self, path: str = DEFAULT_CASSETTE_PATH, mode: str = "off"):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.recorded = 0
+        self.configure(mode, path)
+
+    def configure(self, mode: str = None, path: str = None):
+        mode = (mode or "off").lower()
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected one of {', '.join(MODES)})")
+        with self._lock:
+            self.mode = mode
+            if path and (self._conn is None or path != self.path):
+                self.path = path
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            if self.mode != "off" and self._conn is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS cassette (
+                        service TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        request TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        recorded_at REAL NOT NULL,
+                        PRIMARY KEY (service, key)
+                    )
+                """)
+                self._conn.commit()
+
+    @property
+    def offline(self) -> bool:
+        """True when nothing may touch the network (skip side effects like DB writes and broadcasts)"""
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(request) -> str:
+        return hashlib.sha256(json.dumps(request, sort_keys=True, default=_encode).encode("utf-8")).hexdigest()
+
+    def call(self, service: str, request, fn, decode=None):
+        """Return fn()'s result, recording or replaying it according to the mode"""
+        if self.mode == "off":
+            return fn()
+        key = self.make_key(request)
+        if self.mode in ("replay", "auto"):
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT response FROM cassette WHERE service = ? AND key = ?", (service, key)
+                ).fetchone()
+            if row is not None:
+                self.hits += 1
+                value = json.loads(row[0], object_hook=_decode)
+                return decode(value) if decode else value
+            if self.mode == "replay":
+                raise CassetteMiss(f"No recorded {service} response for request {key[:12]}")
+        result = fn()
+        payload = json.dumps(result, default=_encode)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cassette (service, key, request, response, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (service, key, json.dumps(request, sort_keys=True, default=_encode), payload, time.time())
+            )
+            self._conn.commit()
+            self.recorded += 1
+        # Hand back what a replay would produce so record and replay runs see identical values
+        value = json.loads(payload, object_hook=_decode)
+        return decode(value) if decode else value
+
+
+# Process-wide cassette; IO_MODE / CASSETTE_PATH configure it, backtest.py --io-mode overrides
+cassette = Cassette(os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH), os.getenv("IO_MODE", "off"))
@@ -0,0 +1,195 @@
+# catalogRefresher.py
+
+import asyncio
+import csv
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import httpx
+from dotenv import load_dotenv
+from dbConnect import create_tables_async
+from newfile import fetch_active_markets, connect_clob_client, get_asyncpg_pool, close_asyncpg_pool
+
+load_dotenv()
+REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "900"))   # seconds between cycles
+RETENTION_DAYS = float(os.getenv("CATALOG_RETENTION_DAYS", "30"))        # pruned rows kept for point-in-time backtests
+INDEX_LOG_PATH = os.getenv("CATALOG_INDEX_LOG", "catalog_index_size.csv")
+VECTOR_DELETE_CHUNK = 500
+MAX_CLOSED_FRACTION = 0.5  # a crawl that would close more than this share of live markets is not trusted
+
+INDEX_LOG_FIELDS = [
+    "timestamp", "live_markets", "vector_index_size", "expired_pruned", "closed_pruned",
+    "rows_deleted", "markets_changed", "tokens_updated", "sync_seconds", "prune_seconds",
+]
+
+
+def webhook_url() -> str:
+    return os.getenv("WEBHOOK_URL", "http://twitter-webhook:8000")
+
+
+# --- Postgres ---
+async def select_expired(conn, now):
+    rows = await conn.fetch(
+        "SELECT id FROM markets WHERE pruned_at IS NULL AND expiry_date <= $1 ORDER BY id", now
+    )
+    return [row['id'] for row in rows]
+
+
+async def select_closed(conn, now, active_ids):
+    """Unexpired live markets that a complete Gamma crawl no longer lists as active"""
+    rows = await conn.fetch("""
+        SELECT id FROM markets
+        WHERE pruned_at IS NULL
+          AND (expiry_date IS NULL OR expiry_date > $1)
+          AND NOT (id = ANY($2::text[]))
+        ORDER BY id
+    """, now, list(active_ids))
+    return [row['id'] for row in rows]
+
+
+async def count_live_markets(conn) -> int:
+    return await conn.fetchval("SELECT COUNT(*) FROM markets WHERE pruned_at IS NULL")
+
+
+async def mark_pruned(conn, market_ids, now):
+    await conn.execute(
+        "UPDATE markets SET pruned_at = $2, updated_at = now() AT TIME ZONE 'utc' WHERE id = ANY($1::text[])",
+        list(market_ids), now
+    )
+
+
+async def delete_pruned_rows(conn, cutoff) -> int:
+    """Drop markets pruned before `cutoff` (their tokens go with them via ON DELETE CASCADE)"""
+    return await conn.fetchval("""
+        WITH gone AS (DELETE FROM markets WHERE pruned_at < $1 RETURNING 1)
+        SELECT COUNT(*) FROM gone
+    """, cutoff)
+
+
+# --- Vector index (the webhook owns the Chroma events collection) ---
+async def remove_from_vector_index(client, pool, market_ids, now) -> int:
+    """Delete markets from Chroma in chunks, marking each chunk pruned only once the webhook confirms it"""
+    removed = 0
+    for start in range(0, len(market_ids), VECTOR_DELETE_CHUNK):
+        chunk = market_ids[start:start + VECTOR_DELETE_CHUNK]
+        resp = await client.post(f"{webhook_url()}/poly/delete", json={"ids": chunk})
+        resp.raise_for_status()
+        async with pool.acquire() as conn:
+            await mark_pruned(conn, chunk, now)
+        removed += len(chunk)
+    return removed
+
+
+async def vector_index_size(client):
+    try:
+        resp = await client.get(f"{webhook_url()}/poly/count")
+        resp.raise_for_status()
+        return resp.json().get("count")
+    except Exception as e:
+        print(f"[refresher] Could not read vector index size: {e}")
+        return None
+
+
+def append_index_log(path: str, row: dict):
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=INDEX_LOG_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+# --- Cycle ---
+async def prune(pool, client, active_ids=None, retention_days=RETENTION_DAYS):
+    """Remove expired markets (and, after a complete crawl, closed ones) from the vector index.
+
+    Rows stay in Postgres, flagged pruned_at, for retention_days so point-in-time
+    backtests still see them; after that they are deleted in one statement.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    async with pool.acquire() as conn:
+        expired = await select_expired(conn, now)
+        closed = await select_closed(conn, now, active_ids) if active_ids else []
+        live = await count_live_markets(conn)
+    if closed and len(closed) > MAX_CLOSED_FRACTION * max(live - len(expired), 1):
+        print(f"[refresher] Crawl would close {len(closed)}/{live} live markets; not pruning closed markets this cycle")
+        closed = []
+
+    expired_pruned = await remove_from_vector_index(client, pool, expired, now)
+    closed_pruned = await remove_from_vector_index(client, pool, closed, now)
+    async with pool.acquire() as conn:
+        rows_deleted = await delete_pruned_rows(conn, now - timedelta(days=retention_days))
+    return {"expired_pruned": expired_pruned, "closed_pruned": closed_pruned, "rows_deleted": rows_deleted}
+
+
+async def refresh_once(pool, clob_client, incremental=True, retention_days=RETENTION_DAYS, log_path=INDEX_LOG_PATH):
+    """Sync from Gamma, prune the index down to live markets and log its size"""
+    started = time.perf_counter()
+    result = await fetch_active_markets(pool=pool, clob_client=clob_client, incremental=incremental)
+    sync_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        # Closed markets are only inferred from a crawl that saw every active event
+        pruned = await prune(pool, client, result["active_ids"] if result.get("complete") else None, retention_days)
+        index_size = await vector_index_size(client)
+    prune_seconds = time.perf_counter() - started
+    async with pool.acquire() as conn:
+        live = await count_live_markets(conn)
+
+    row = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "live_markets": live,
+        "vector_index_size": index_size,
+        **pruned,
+        "markets_changed": result.get("markets_changed", 0),
+        "tokens_updated": result.get("tokens_updated", 0),
+        "sync_seconds": round(sync_seconds, 2),
+        "prune_seconds": round(prune_seconds, 2),
+    }
+    if log_path:
+        append_index_log(log_path, row)
+    print(f"[refresher] {live} live markets | index {index_size} | pruned {pruned['expired_pruned']} expired, "
+          f"{pruned['closed_pruned']} closed | deleted {pruned['rows_deleted']} rows | "
+          f"sync {sync_seconds:.1f}s, prune {prune_seconds:.1f}s")
+    return row
+
+
+async def run_refresher(interval=REFRESH_INTERVAL, retention_days=RETENTION_DAYS, log_path=INDEX_LOG_PATH,
+                        incremental=True, once=False):
+    """Long-running service: one refresh cycle every `interval` seconds (a failed cycle is retried next time)"""
+    pool = await get_asyncpg_pool()
+    clob_client = connect_clob_client()
+    async with pool.acquire() as conn:
+        await create_tables_async(conn)
+    print(f"Catalog refresher running every {interval:.0f}s (retention {retention_days:g} days, log {log_path})")
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                await refresh_once(pool, clob_client, incremental, retention_days, log_path)
+            except Exception as e:
+                print(f"[refresher] Cycle failed: {type(e).__name__}: {e}")
+            if once:
+                break
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        await close_asyncpg_pool()
+
+
+def main():
+    """CLI entrypoint: keep markets synced from Gamma and the vector index sized to live markets."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Periodically sync markets and prune expired/closed ones.")
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL, help='Seconds between refresh cycles')
+    parser.add_argument('--retention-days', type=float, default=RETENTION_DAYS,
+                        help='Days pruned markets stay in Postgres for backtests before deletion')
+    parser.add_argument('--log', default=INDEX_LOG_PATH, help='CSV that records index size after every cycle')
+    parser.add_argument('--full', action='store_true', help='Re-fetch every event instead of an incremental sync')
+    parser.add_argument('--once', action='store_true', help='Run a single cycle and exit')
+    args = parser.parse_args()
+    asyncio.run(run_refresher(args.interval, args.retention_days, args.log, not args.full, args.once))
+
+
+if __name__ == "__main__":
+    main()
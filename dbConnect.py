@@ -31,7 +31,32 @@ async def create_tables_async(conn):
             CREATE TABLE IF NOT EXISTS markets (
                 id TEXT PRIMARY KEY,
                 title TEXT,
-                expiry_date TIMESTAMP
+                expiry_date TIMESTAMP,
+                listed_at TIMESTAMP,
+                content_hash TEXT,
+                pruned_at TIMESTAMP,
+                updated_at TIMESTAMP
+            );
+        """)
+        # Listing time for point-in-time backtests and the content hash used by incremental sync
+        # (tables created before the columns existed)
+        await conn.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS listed_at TIMESTAMP;")
+        await conn.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+        # Set by catalogRefresher once an expired/closed market is removed from the vector index
+        await conn.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS pruned_at TIMESTAMP;")
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS markets_live_expiry ON markets (expiry_date) WHERE pruned_at IS NULL;
+        """)
+        # Bumped (UTC) whenever ingestion or the refresher writes a market; MarketCatalog polls it
+        await conn.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;")
+        await conn.execute("CREATE INDEX IF NOT EXISTS markets_updated_at ON markets (updated_at);")
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                last_synced_at TIMESTAMP NOT NULL,
+                events_seen INT,
+                markets_changed INT,
+                tokens_updated INT
             );
         """)
         await conn.execute("""
@@ -71,9 +96,21 @@ def create_markets_and_tokens_tables(conn):
                 CREATE TABLE IF NOT EXISTS markets (
                     id TEXT PRIMARY KEY,
                     title TEXT,
-                    expiry_date TIMESTAMP
+                    expiry_date TIMESTAMP,
+                    listed_at TIMESTAMP,
+                    content_hash TEXT,
+                    pruned_at TIMESTAMP,
+                    updated_at TIMESTAMP
                 );
             """)
+            cursor.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS listed_at TIMESTAMP;")
+            cursor.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+            cursor.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS pruned_at TIMESTAMP;")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS markets_live_expiry ON markets (expiry_date) WHERE pruned_at IS NULL;
+            """)
+            cursor.execute("ALTER TABLE markets ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;")
+            cursor.execute("CREATE INDEX IF NOT EXISTS markets_updated_at ON markets (updated_at);")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS tokens (
                     id TEXT PRIMARY KEY,
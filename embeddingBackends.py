@@ -0,0 +1,171 @@
+# embeddingBackends.py
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_REPO = f"sentence-transformers/{MODEL_NAME}"
+MAX_SEQ_LENGTH = 256  # same truncation as the sentence-transformers model config
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class OnnxMiniLMEmbeddings:
+    """all-MiniLM-L6-v2 served through onnxruntime on CPU.
+
+    Uses the ONNX export published in the model repo, optionally dynamically
+    quantized to int8, with batched inference, mean pooling and L2 normalization
+    so vectors line up with the torch/sentence-transformers path.
+    Implements the LangChain Embeddings interface (embed_documents / embed_query).
+    """
+
+    def __init__(self, quantize: bool = False, batch_size: int = 32, threads: int = None, cache_dir: str = None):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        model_path = hf_hub_download(MODEL_REPO, "onnx/model.onnx")
+        tokenizer_path = hf_hub_download(MODEL_REPO, "tokenizer.json")
+        if quantize:
+            model_path = self._quantized_model(model_path, cache_dir)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    @staticmethod
+    def _quantized_model(model_path: str, cache_dir: str = None) -> str:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "onnx_minilm")
+        os.makedirs(cache_dir, exist_ok=True)
+        quantized_path = os.path.join(cache_dir, f"{MODEL_NAME}-int8.onnx")
+        if not os.path.exists(quantized_path):
+            print(f"[OnnxMiniLMEmbeddings] Quantizing {model_path} -> {quantized_path}")
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def _embed(self, texts):
+        import numpy as np
+
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = self.tokenizer.encode_batch(list(texts[start:start + self.batch_size]))
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean pooling over real tokens, then L2 normalize (sentence-transformers Normalize layer)
+            mask = attention_mask[..., None].astype(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed(texts)
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def create_embedding_model(backend: str = None):
+    """Embedding model for EMBEDDING_BACKEND: torch (default), onnx, or onnx-int8"""
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if backend == "onnx":
+        return OnnxMiniLMEmbeddings(quantize=False, batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+    if backend in ("onnx-int8", "int8"):
+        return OnnxMiniLMEmbeddings(quantize=True, batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+    if backend != "torch":
+        print(f"Unknown EMBEDDING_BACKEND '{backend}', using torch")
+    from langchain.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=MODEL_NAME)
+
+
+# --- Benchmark ---
+SAMPLE_TEXTS = [
+    "Will 8+ Fed rate cuts happen in 2025?",
+    "Zohran Mamdani drops 15 points in latest NYC mayoral poll",
+    "Apple announces Tim Cook will retire next year.",
+    "Will Bitcoin reach $150k by December 31?",
+    "Tesla to unveil robotaxi service in Austin this summer",
+    "Who will win the 2025 NBA Finals?",
+    "SpaceX Starship completes first orbital flight",
+    "Will the US government shut down before October?",
+]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def _measure(backend: str, texts, repeats: int):
+    base_rss = _rss_mb()
+    model = create_embedding_model(backend)
+    model.embed_documents(texts[:2])  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        vectors = model.embed_documents(texts)
+    elapsed = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "ms_per_text": elapsed / (repeats * len(texts)) * 1000,
+        "rss_mb": _rss_mb() - base_rss,
+        "vectors": vectors,
+    }
+
+
+def benchmark(backends=BACKENDS, texts=None, repeats: int = 20):
+    """Per-text latency, memory and agreement with the torch vectors, one subprocess per backend"""
+    texts = texts or SAMPLE_TEXTS * 4
+    results = {}
+    for backend in backends:
+        # Separate processes so each backend's import/model memory is measured on its own
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", backend, "--repeats", str(repeats)],
+            input=json.dumps(texts), capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{backend}: failed\n{proc.stderr[-2000:]}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    reference = results.get("torch", {}).get("vectors")
+    print(f"{'backend':<10} {'ms/text':>8} {'rss MB':>8} {'min cos vs torch':>17}")
+    for backend, result in results.items():
+        agreement = ""
+        if reference and backend != "torch":
+            agreement = f"{min(sum(a * b for a, b in zip(u, v)) for u, v in zip(reference, result['vectors'])):.5f}"
+        print(f"{backend:<10} {result['ms_per_text']:>8.2f} {result['rss_mb']:>8.1f} {agreement:>17}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark MiniLM embedding backends (torch vs ONNX vs ONNX int8).")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends to compare")
+    parser.add_argument("--repeats", type=int, default=20, help="Passes over the sample texts per backend")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_measure(args.child, json.loads(sys.stdin.read()), args.repeats)))
+    else:
+        benchmark(args.backends.split(","), repeats=args.repeats)
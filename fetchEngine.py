@@ -0,0 +1,94 @@
+# fetchEngine.py
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+import rateLimit
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Retry-After header (seconds or HTTP date) -> seconds to wait, or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedFetcher:
+    """Shared GET path for crawls: global concurrency cap, per-service token bucket, retries.
+
+    Every request takes a token from the service's bucket in rateLimit (unlimited unless
+    configured) and a slot from one semaphore. A 429 (or 503) pauses that service's bucket
+    for Retry-After so all in-flight workers back off together; transient network errors
+    and 5xx responses are retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, concurrency: int = 16, max_retries: int = 4, backoff: float = 0.5):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._slots = asyncio.Semaphore(concurrency)
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "failed": 0, "seconds": 0.0}
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def get(self, url: str, service: str, params=None) -> httpx.Response:
+        """GET with rate limiting and retries; returns the final response (raises after repeated network errors)"""
+        for attempt in range(self.max_retries + 1):
+            await rateLimit.acquire_async(service)
+            started = time.perf_counter()
+            try:
+                async with self._slots:
+                    response = await self.client.get(url, params=params)
+            except httpx.TransportError as e:
+                self.stats["requests"] += 1
+                if attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    raise
+                self.stats["retries"] += 1
+                print(f"[fetch] {service} network error ({type(e).__name__}), retry {attempt + 1}/{self.max_retries}")
+                await asyncio.sleep(self._delay(attempt))
+                continue
+            finally:
+                self.stats["seconds"] += time.perf_counter() - started
+
+            self.stats["requests"] += 1
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                if response.status_code in RETRY_STATUSES:
+                    self.stats["failed"] += 1
+                return response
+
+            self.stats["retries"] += 1
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code == 429 or retry_after is not None:
+                self.stats["throttled"] += 1
+                delay = retry_after if retry_after is not None else self._delay(attempt)
+                print(f"[fetch] {service} throttled (HTTP {response.status_code}), waiting {delay:.1f}s")
+                limiter = rateLimit.get_limiter(service)
+                if limiter is not None:
+                    limiter.pause(delay)  # everyone waiting on this service backs off, including this retry
+                    continue
+            else:
+                delay = self._delay(attempt)
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url: str, service: str, params=None):
+        response = await self.get(url, service, params)
+        response.raise_for_status()
+        return response.json()
+
+    def report(self) -> dict:
+        stats = dict(self.stats)
+        stats["avg_seconds"] = stats["seconds"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
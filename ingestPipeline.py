@@ -0,0 +1,324 @@
+# ingestPipeline.py
+
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+import httpx
+from dbConnect import create_tables_async
+from fetchEngine import RateLimitedFetcher
+from newfile import (
+    gamma_host, FETCH_CONCURRENCY, PRICE_CONCURRENCY, configure_ingest_rates, connect_clob_client,
+    get_asyncpg_pool, build_market_record, filter_markets, price_markets, push_markets_to_chromadb,
+    bulk_upsert_markets, bulk_upsert_tokens, load_unchanged_events, load_sync_watermark, save_sync_watermark,
+)
+
+# Workers per stage; override with INGEST_STAGE_CONCURRENCY="enrich=32,sql=4" or --stage-concurrency
+DEFAULT_STAGE_CONCURRENCY = {"enrich": FETCH_CONCURRENCY, "price": PRICE_CONCURRENCY, "sql": 2, "vector": 1}
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))  # items (or batches) buffered in front of each stage
+REPORT_INTERVAL = float(os.getenv("INGEST_REPORT_INTERVAL", "10"))
+
+_DONE = object()  # end-of-stream marker, passed from stage to stage
+
+
+class StageError(Exception):
+    """Raised by a handler that dropped `count` items (after emitting whatever did succeed)"""
+
+    def __init__(self, message: str, count: int = 1):
+        super().__init__(message)
+        self.count = count
+
+
+def parse_stage_concurrency(specs=None) -> dict:
+    """['enrich=32', 'sql=4'] -> defaults with those stages overridden"""
+    concurrency = dict(DEFAULT_STAGE_CONCURRENCY)
+    env = os.getenv("INGEST_STAGE_CONCURRENCY")
+    for spec in (env.split(",") if env else []) + list(specs or []):
+        name, _, value = spec.partition("=")
+        name = name.strip()
+        if name not in concurrency:
+            raise ValueError(f"Unknown stage '{name}' (expected one of {', '.join(concurrency)})")
+        concurrency[name] = max(1, int(value))
+    return concurrency
+
+
+class StageStats:
+    """Counters for one stage; busy time excludes time spent blocked on a full downstream queue"""
+
+    def __init__(self, name: str, concurrency: int = 1, inbox: asyncio.Queue = None):
+        self.name = name
+        self.concurrency = concurrency
+        self.inbox = inbox
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def report(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "stage": self.name,
+            "workers": self.concurrency,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "per_second": self.items_in / elapsed,
+            "backlog": self.inbox.qsize() if self.inbox is not None else 0,
+            "utilization": self.busy_seconds / (elapsed * self.concurrency),  # share of worker time doing work
+        }
+
+
+class Stage:
+    """`concurrency` workers pulling from a bounded inbox and emitting into the next stage's inbox.
+
+    handler(item, emit) may emit any number of outputs. With batch_size > 1 the handler
+    receives a list of up to batch_size items (whatever is queued, waiting at most `linger`
+    seconds to fill it). A handler error is counted and the item dropped; handlers that
+    lose part of their input raise StageError so the loss is counted too.
+    """
+
+    def __init__(self, name: str, handler, concurrency: int = 1, batch_size: int = 1,
+                 queue_size: int = QUEUE_SIZE, linger: float = 0.05):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.linger = linger
+        self.inbox = asyncio.Queue(maxsize=queue_size)
+        self.stats = StageStats(name, concurrency, self.inbox)
+
+    async def _next(self):
+        item = await self.inbox.get()
+        if item is _DONE or self.batch_size == 1:
+            return item
+        batch = [item]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                item = self.inbox.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.inbox.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is _DONE:
+                await self.inbox.put(_DONE)  # finish this batch; the marker is seen on the next read
+                break
+            batch.append(item)
+        return batch
+
+    async def _worker(self, emit):
+        while True:
+            item = await self._next()
+            if item is _DONE:
+                await self.inbox.put(_DONE)  # let sibling workers see it too
+                return
+            self.stats.items_in += len(item) if self.batch_size > 1 else 1
+            started = time.perf_counter()
+            blocked_before = emit.blocked
+            try:
+                await self.handler(item, emit)
+            except Exception as e:
+                self.stats.errors += e.count if isinstance(e, StageError) else 1
+                print(f"ERROR: [{self.name}] {type(e).__name__}: {e}")
+            finally:
+                self.stats.busy_seconds += time.perf_counter() - started - (emit.blocked - blocked_before)
+
+    async def run(self, downstream=None):
+        emit = make_emit(self.stats, downstream)
+        await asyncio.gather(*(self._worker(emit) for _ in range(self.concurrency)))
+        if downstream is not None:
+            await downstream.inbox.put(_DONE)
+
+
+def make_emit(stats: StageStats, downstream: Stage = None):
+    """emit(item) for a stage: counts outputs and blocks while the next stage's inbox is full"""
+    async def emit(item):
+        stats.items_out += 1
+        if downstream is not None:
+            started = time.perf_counter()
+            await downstream.inbox.put(item)
+            emit.blocked += time.perf_counter() - started
+    emit.blocked = 0.0
+    return emit
+
+
+def format_stage_reports(reports) -> str:
+    return " | ".join(
+        f"{r['stage']} {r['items_in']} in ({r['per_second']:.1f}/s, backlog {r['backlog']}, busy {r['utilization']:.0%})"
+        for r in reports
+    )
+
+
+async def stream_active_events(limit=None, batch_size=50, pool=None, clob_client=None, incremental=False,
+                               concurrency=None, report_interval=REPORT_INTERVAL):
+    """Ingest active Gamma events as a streaming pipeline of independent stages.
+
+    fetch -> enrich -> price -> sql -> vector, connected by bounded queues, so each stage
+    works as soon as its input arrives: the slowest stage sets the pace (instead of the sum
+    of all of them per page) and at most QUEUE_SIZE items wait in front of any stage.
+    Returns the same summary as fetch_active_events_optimized, plus per-stage reports.
+    """
+    concurrency = concurrency or parse_stage_concurrency()
+    sync_stats = {"markets_changed": 0, "tokens_updated": 0, "events_unchanged": 0, "batch_errors": 0}
+    totals = {"processed": 0, "stored": 0, "skipped": 0}
+    active_ids = set()
+    fetch_failed = False
+
+    if pool is None:
+        pool = await get_asyncpg_pool()
+    if clob_client is None:
+        clob_client = connect_clob_client()
+    async with pool.acquire() as conn:
+        await create_tables_async(conn)
+    now = datetime.now(timezone.utc)
+    if incremental:
+        async with pool.acquire() as conn:
+            watermark = await load_sync_watermark(conn)
+        print(f"Incremental sync - last successful sync: {watermark.isoformat() if watermark else 'never'}")
+
+    limit_param = min(limit, batch_size) if limit else batch_size
+    configure_ingest_rates()
+
+    async with httpx.AsyncClient(timeout=30.0, verify=False) as client, \
+            httpx.AsyncClient(timeout=30.0, verify=False) as webhook_client:
+        fetcher = RateLimitedFetcher(client, concurrency=FETCH_CONCURRENCY)
+
+        # --- Stage handlers ---
+        async def enrich(item, emit):
+            event, stored_tokens = item
+            record = await build_market_record(event, fetcher, stored_tokens)
+            if record is None:
+                raise StageError(f"event {event.get('id')} could not be enriched")
+            await emit(record)
+
+        async def price(records, emit):
+            valid_markets = filter_markets(records)
+            totals["skipped"] += len(records) - len(valid_markets)
+            if valid_markets:
+                await emit(await price_markets(valid_markets, clob_client))
+
+        async def persist_sql(batch, emit):
+            market_data, token_data, market_hashes = batch
+            try:
+                async with pool.acquire() as conn:
+                    changed_market_ids = await bulk_upsert_markets(conn, [
+                        (market_id, title, expiry_date, listed_at, market_hashes.get(market_id))
+                        for market_id, title, expiry_date, listed_at in market_data
+                    ])
+                    changed_token_ids = await bulk_upsert_tokens(conn, token_data) if token_data else []
+            except Exception:
+                sync_stats["batch_errors"] += 1
+                raise
+            sync_stats["markets_changed"] += len(changed_market_ids)
+            sync_stats["tokens_updated"] += len(changed_token_ids)
+            totals["stored"] += len(market_data)
+            changed = set(changed_market_ids)
+            for market_id, title, _, _ in market_data:
+                if market_id in changed:
+                    await emit((market_id, title))
+
+        async def persist_vector(markets, emit):
+            failed = []
+            await push_markets_to_chromadb(markets, webhook_client, failed)
+            for _ in range(len(markets) - len(failed)):
+                await emit(None)
+            if failed:
+                raise StageError(f"{len(failed)}/{len(markets)} vector pushes failed", len(failed))
+
+        stages = [
+            Stage("enrich", enrich, concurrency["enrich"]),
+            Stage("price", price, concurrency["price"], batch_size=batch_size),
+            Stage("sql", persist_sql, concurrency["sql"], queue_size=max(1, QUEUE_SIZE // batch_size)),
+            Stage("vector", persist_vector, concurrency["vector"], batch_size=batch_size),
+        ]
+        fetch_stats = StageStats("fetch")
+
+        # --- Source: pages from Gamma (next page requested while this one is emitted) ---
+        async def fetch_events():
+            nonlocal fetch_failed
+            emit = make_emit(fetch_stats, stages[0])
+
+            def page(offset):
+                url = f"{gamma_host}/events?active=true&closed=false&limit={limit_param}&offset={offset}"
+                return asyncio.create_task(fetcher.get_json(url, "gamma"))
+
+            offset = 0
+            next_page = page(offset)
+            try:
+                while next_page is not None:
+                    started = time.perf_counter()
+                    blocked_before = emit.blocked
+                    payload = await next_page
+                    next_page = None
+                    events = payload if isinstance(payload, list) else payload.get("data", [])
+                    if not events:
+                        break
+                    if limit:
+                        events = events[:limit - totals["processed"]]
+                    fetch_stats.items_in += len(events)
+                    totals["processed"] += len(events)
+                    offset += len(events)
+                    if len(events) >= limit_param and not (limit and totals["processed"] >= limit):
+                        next_page = page(offset)
+
+                    active_events = [e for e in events if e.get('active', True) and not e.get('closed', False)]
+                    totals["skipped"] += len(events) - len(active_events)
+                    active_ids.update(str(event.get('id')) for event in active_events)
+                    unchanged_tokens = {}
+                    if incremental and active_events:
+                        async with pool.acquire() as conn:
+                            unchanged_tokens = await load_unchanged_events(conn, active_events)
+                        sync_stats["events_unchanged"] += len(unchanged_tokens)
+                    for event in active_events:
+                        await emit((event, unchanged_tokens.get(str(event.get('id')))))
+                    fetch_stats.busy_seconds += time.perf_counter() - started - (emit.blocked - blocked_before)
+            except Exception as e:
+                print(f"ERROR: Error fetching events: {type(e).__name__}: {e}")
+                fetch_stats.errors += 1
+                fetch_failed = True
+            finally:
+                if next_page is not None:
+                    next_page.cancel()
+                await stages[0].inbox.put(_DONE)
+
+        async def report_progress():
+            while True:
+                await asyncio.sleep(report_interval)
+                print(f"[ingest] {format_stage_reports([fetch_stats.report()] + [s.stats.report() for s in stages])}")
+
+        print(f"Streaming ingestion: {', '.join(f'{s.name} x{s.concurrency}' for s in stages)} "
+              f"(batch {batch_size}, queue {QUEUE_SIZE})")
+        reporter = asyncio.create_task(report_progress())
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(
+                fetch_events(),
+                *(stage.run(stages[i + 1] if i + 1 < len(stages) else None) for i, stage in enumerate(stages))
+            )
+        finally:
+            reporter.cancel()
+        elapsed = time.perf_counter() - started
+        crawl = fetcher.report()
+
+    reports = [fetch_stats.report()] + [stage.stats.report() for stage in stages]
+    # Watermark only moves forward after a complete pass in which no stage dropped anything
+    complete = not fetch_failed and not any(r["errors"] for r in reports) and not limit
+    if complete:
+        async with pool.acquire() as conn:
+            await save_sync_watermark(conn, now.replace(tzinfo=None), dict(sync_stats, processed=totals["processed"]))
+
+    bottleneck = max(reports, key=lambda r: r["utilization"])
+    print(f"\nStreaming ingestion finished in {elapsed:.1f}s")
+    for r in reports:
+        print(f"  {r['stage']:<7} x{r['workers']:<3} in {r['items_in']:>7} | out {r['items_out']:>7} | "
+              f"{r['per_second']:>8.1f}/s | busy {r['utilization']:>4.0%} | errors {r['errors']}")
+    print(f"Bottleneck: {bottleneck['stage']} ({bottleneck['utilization']:.0%} busy) | "
+          f"crawl {crawl['requests']} requests, {crawl['throttled']} throttled")
+    print(f"Processed: {totals['processed']} | Stored: {totals['stored']} | Skipped: {totals['skipped']} | "
+          f"Markets written: {sync_stats['markets_changed']} | Token prices updated: {sync_stats['tokens_updated']}")
+    return {**totals, **sync_stats, "complete": complete, "active_ids": active_ids, "stages": reports}
@@ -0,0 +1,263 @@
+# jobQueue.py
+
+import asyncio
+import json
+import os
+import socket
+import time
+import asyncpg
+from dotenv import load_dotenv
+
+CHANNEL = "pipeline_jobs"
+VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "600"))  # seconds before a running job is reclaimed
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+HEARTBEAT_INTERVAL = VISIBILITY_TIMEOUT / 3  # a running job's lease is renewed this often
+
+
+async def get_queue_connection():
+    """asyncpg connection for the job queue, configured like the rest of the services"""
+    load_dotenv()
+    return await asyncpg.connect(
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        database=os.getenv("POSTGRES_DB")
+    )
+
+
+async def create_job_table(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            payload JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 3,
+            run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+            locked_by TEXT,
+            locked_until TIMESTAMPTZ,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ,
+            last_error TEXT
+        );
+    """)
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS pipeline_jobs_claimable
+        ON pipeline_jobs (id) WHERE status IN ('queued', 'running');
+    """)
+
+
+async def enqueue_job(conn, payload: dict, max_attempts: int = 3) -> int:
+    """Insert a job and wake listening workers in the same transaction"""
+    async with conn.transaction():
+        job_id = await conn.fetchval(
+            "INSERT INTO pipeline_jobs (payload, max_attempts) VALUES ($1::jsonb, $2) RETURNING id",
+            json.dumps(payload), max_attempts
+        )
+        await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, str(job_id))
+    return job_id
+
+
+async def claim_job(conn, worker_id: str):
+    """Claim the oldest ready job (or one whose lease expired with attempts left) without blocking other workers"""
+    row = await conn.fetchrow("""
+        UPDATE pipeline_jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_by = $1,
+            locked_until = now() + make_interval(secs => $2)
+        WHERE id = (
+            SELECT id FROM pipeline_jobs
+            WHERE (status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, payload, attempts, max_attempts
+    """, worker_id, VISIBILITY_TIMEOUT)
+    if row is None:
+        return None
+    payload = row["payload"]
+    return {
+        "id": row["id"],
+        "payload": json.loads(payload) if isinstance(payload, str) else payload,
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+    }
+
+
+async def fail_expired_jobs(conn) -> int:
+    """Mark jobs whose lease expired on their last attempt as failed (their worker died mid-run)"""
+    rows = await conn.fetch("""
+        UPDATE pipeline_jobs
+        SET status = 'failed', finished_at = now(), locked_until = NULL,
+            last_error = COALESCE(last_error || '; ', '') || 'lease expired on final attempt (worker died?)'
+        WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+        RETURNING id
+    """)
+    return len(rows)
+
+
+async def extend_lease(conn, job_id: int, worker_id: str) -> bool:
+    """Push the lease forward while the job runs; False if another worker has taken it over"""
+    row = await conn.fetchrow("""
+        UPDATE pipeline_jobs SET locked_until = now() + make_interval(secs => $3)
+        WHERE id = $1 AND locked_by = $2 AND status = 'running'
+        RETURNING id
+    """, job_id, worker_id, VISIBILITY_TIMEOUT)
+    return row is not None
+
+
+async def complete_job(conn, job_id: int, worker_id: str) -> bool:
+    """Mark done if this worker still holds the lease; False if it was reclaimed meanwhile"""
+    row = await conn.fetchrow(
+        """UPDATE pipeline_jobs SET status = 'done', finished_at = now(), locked_until = NULL
+           WHERE id = $1 AND locked_by = $2 AND status = 'running'
+           RETURNING id""",
+        job_id, worker_id
+    )
+    return row is not None
+
+
+async def fail_job(conn, job: dict, error: str, worker_id: str) -> bool:
+    """Requeue with exponential backoff, or mark failed once attempts are used up (only while holding the lease)"""
+    if job["attempts"] >= job["max_attempts"]:
+        row = await conn.fetchrow(
+            """UPDATE pipeline_jobs SET status = 'failed', finished_at = now(), last_error = $2, locked_until = NULL
+               WHERE id = $1 AND locked_by = $3 AND status = 'running'
+               RETURNING id""",
+            job["id"], error, worker_id
+        )
+    else:
+        row = await conn.fetchrow(
+            """UPDATE pipeline_jobs
+               SET status = 'queued', last_error = $2, locked_until = NULL,
+                   run_after = now() + make_interval(secs => $3)
+               WHERE id = $1 AND locked_by = $4 AND status = 'running'
+               RETURNING id""",
+            job["id"], error, float(2 ** job["attempts"]), worker_id
+        )
+    return row is not None
+
+
+async def backlog_stats(conn) -> dict:
+    """Job counts by status plus the age of the oldest queued job"""
+    rows = await conn.fetch("SELECT status, COUNT(*) AS count FROM pipeline_jobs GROUP BY status")
+    oldest = await conn.fetchval(
+        "SELECT EXTRACT(EPOCH FROM now() - MIN(created_at)) FROM pipeline_jobs WHERE status = 'queued'"
+    )
+    stats = {row["status"]: row["count"] for row in rows}
+    stats["oldest_queued_seconds"] = float(oldest) if oldest is not None else 0.0
+    return stats
+
+
+async def run_job(payload: dict):
+    """Run one pipeline job - the same graph the webhook used to run inline"""
+    from langgraphTester import make_initial_state
+    from langgraphPipe import get_graph
+    # The as-of date was fixed at receive time, so a retried or reclaimed job sees the same markets
+    state = make_initial_state(payload["tweet_text"], payload.get("date"), payload.get("username") or '')
+    return await get_graph().ainvoke(state)
+
+
+async def heartbeat(conn, job_id: int, worker_id: str, done: asyncio.Event):
+    """Renew the lease every HEARTBEAT_INTERVAL until `done` is set (only this task uses conn meanwhile)"""
+    while True:
+        try:
+            await asyncio.wait_for(done.wait(), timeout=HEARTBEAT_INTERVAL)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            if not await extend_lease(conn, job_id, worker_id):
+                print(f"[{worker_id}] Lost the lease on job {job_id}; its result will be discarded")
+                return
+        except Exception as e:
+            print(f"[{worker_id}] Heartbeat for job {job_id} failed: {type(e).__name__}: {e}")
+
+
+async def worker_loop(worker_id: str, wakeup: asyncio.Event):
+    conn = await get_queue_connection()
+    try:
+        while True:
+            expired = await fail_expired_jobs(conn)
+            if expired:
+                print(f"[{worker_id}] Marked {expired} jobs failed after their final lease expired")
+            wakeup.clear()  # before claiming, so a NOTIFY that lands mid-claim still wakes the wait below
+            job = await claim_job(conn, worker_id)
+            if job is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            started = time.perf_counter()
+            print(f"[{worker_id}] Running job {job['id']} (attempt {job['attempts']}/{job['max_attempts']})")
+            done = asyncio.Event()
+            lease = asyncio.create_task(heartbeat(conn, job["id"], worker_id, done))
+            error = None
+            try:
+                await run_job(job["payload"])
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                done.set()
+                await lease  # the heartbeat finishes any in-flight renewal before conn is reused
+            if error is None:
+                if await complete_job(conn, job["id"], worker_id):
+                    print(f"[{worker_id}] Job {job['id']} done in {time.perf_counter() - started:.2f}s")
+                else:
+                    print(f"[{worker_id}] Job {job['id']} finished after its lease was reclaimed; not marking it done")
+            else:
+                print(f"[{worker_id}] Job {job['id']} failed: {error}")
+                if not await fail_job(conn, job, error, worker_id):
+                    print(f"[{worker_id}] Job {job['id']} was reclaimed by another worker; failure not recorded")
+    finally:
+        await conn.close()
+
+
+async def run_worker(concurrency: int = 1):
+    """Standalone pipeline worker: N claim loops woken by LISTEN/NOTIFY, polling as a fallback"""
+    from langgraphPipe import start_warmup
+    start_warmup()
+
+    listener = await get_queue_connection()
+    await create_job_table(listener)
+    wakeup = asyncio.Event()
+    await listener.add_listener(CHANNEL, lambda *_: wakeup.set())
+    print(f"Pipeline worker listening on '{CHANNEL}' with concurrency {concurrency}")
+
+    worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        await asyncio.gather(*[worker_loop(f"{worker_prefix}-{i}", wakeup) for i in range(concurrency)])
+    finally:
+        await listener.close()
+
+
+async def print_status():
+    conn = await get_queue_connection()
+    try:
+        await create_job_table(conn)
+        print(json.dumps(await backlog_stats(conn), indent=2))
+    finally:
+        await conn.close()
+
+
+def main():
+    """CLI entrypoint: `worker` runs pipeline jobs, `status` shows the backlog."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Postgres-backed pipeline job queue.")
+    parser.add_argument('command', choices=['worker', 'status'])
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")),
+                        help='Jobs processed concurrently by this worker')
+    args = parser.parse_args()
+    if args.command == 'worker':
+        asyncio.run(run_worker(args.concurrency))
+    else:
+        asyncio.run(print_status())
+
+
+if __name__ == "__main__":
+    main()
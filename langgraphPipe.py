@@ -1,11 +1,10 @@
 # prediction_agent.py
 
-from typing import TypedDict
+from typing import Optional, TypedDict
 from langgraph.graph import StateGraph, END
 from langchain_core.runnables import Runnable
 from langchain_community.vectorstores import Chroma
 from langchain_ollama import OllamaEmbeddings
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain_tavily import TavilySearch
 from langchain_community.llms import Ollama
 from langchain_ollama import ChatOllama
@@ -17,16 +16,53 @@ import os
 import json
 from pydantic import BaseModel
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.messages import AIMessage
+from langchain_core.documents import Document
 from datetime import datetime
+from llmCache import LLMCache
+from marketCatalog import catalog as market_catalog
+from marketIndex import PointInTimeMarketIndex
+from priceStore import PriceHistoryStore
+from tradeLog import DecisionLogWriter, clean_tweet_text
+from embeddingBackends import create_embedding_model
+from stageCache import StageCache
+import rateLimit
+from cassette import cassette
 
 import requests
 import csv
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 url = os.getenv("WEBHOOK_URL", "http://twitter-webhook:8000")
-embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")  # 384-dimensional
+
+# --- Lazy Resources ---
+# Models, Chroma and the compiled graph are created on first use (not at import), so
+# importing this module from the webhook is cheap. start_warmup() loads them in the background.
+_resources = {}
+_resources_lock = threading.RLock()
+
+def _resource(name: str, factory):
+    value = _resources.get(name)
+    if value is None:
+        with _resources_lock:
+            value = _resources.get(name)
+            if value is None:
+                value = factory()
+                _resources[name] = value
+    return value
+
+def get_embedding_model():
+    # all-MiniLM-L6-v2, 384-dimensional; EMBEDDING_BACKEND=torch|onnx|onnx-int8
+    return _resource("embedding_model", create_embedding_model)
 
 # --- Dashboard Broadcasting ---
 async def broadcast_trade_event(event_type: str, data: dict):
     """Send trade events to dashboard webhook - async HTTP call"""
+    if cassette.offline:
+        return  # replayed backtests run with no services
     try:
         import aiohttp
         payload = {
@@ -63,26 +99,306 @@ def get_db_connection():
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 # ✅ Ensure path and collection match FastAPI setup
 chroma_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma")
-vectorstore = Chroma(
-    persist_directory=chroma_path,
-    collection_name="events",
-    embedding_function=embedding_model
-)
+
+def get_vectorstore():
+    return _resource("vectorstore", lambda: Chroma(
+        persist_directory=chroma_path,
+        collection_name="events",
+        embedding_function=get_embedding_model()
+    ))
+
+class MarketRetriever:
+    """Vector search over the events collection that returns market ids with scores and metadata.
+
+    Queries the underlying Chroma collection directly so a single round trip yields
+    (Document, distance) pairs whose Document.id is the market id - no second lookup by name.
+    """
+
+    def __init__(self, store, embeddings):
+        self.store = store
+        self.embeddings = embeddings
+
+    def search(self, query: str, k: int = 5):
+        result = self.store._collection.query(
+            query_embeddings=[self.embeddings.embed_query(query)],
+            n_results=k,
+            include=["documents", "metadatas", "distances"]
+        )
+        ids = result["ids"][0] if result.get("ids") else []
+        documents = result["documents"][0] if result.get("documents") else [None] * len(ids)
+        metadatas = result["metadatas"][0] if result.get("metadatas") else [None] * len(ids)
+        distances = result["distances"][0] if result.get("distances") else [None] * len(ids)
+        return [
+            (Document(id=market_id, page_content=document or "", metadata=metadata or {}), distance)
+            for market_id, document, metadata, distance in zip(ids, documents, metadatas, distances)
+        ]
+
+def get_market_retriever():
+    return _resource("market_retriever", lambda: MarketRetriever(get_vectorstore(), get_embedding_model()))
+
+# Backtests can restrict retrieval to markets that were live at the tweet's date
+# (POINT_IN_TIME_INDEX=1 or backtest.py --point-in-time); live runs search the current collection.
+POINT_IN_TIME = os.getenv("POINT_IN_TIME_INDEX", "0") != "0"
+
+def get_market_index():
+    return _resource("market_index", lambda: PointInTimeMarketIndex(get_vectorstore(), get_embedding_model()))
+
+def use_point_in_time_index(enabled: bool = True):
+    global POINT_IN_TIME
+    POINT_IN_TIME = enabled
+
 load_dotenv()
-llm = ChatOllama(
-    model="tinyllama:1.1b",  # Ultra-fast lightweight model
-    temperature=0,
-    base_url="http://ollama:11434"  # Use Docker service name instead of localhost
-)
+LLM_MODEL = "tinyllama:1.1b"  # Ultra-fast lightweight model
+
+def get_llm(model: str = LLM_MODEL):
+    return _resource(f"llm:{model}", lambda: ChatOllama(
+        model=model,
+        temperature=0,
+        base_url="http://ollama:11434"  # Use Docker service name instead of localhost
+    ))
+
+# temperature=0 -> identical prompts give identical answers, so responses are cached on disk.
+# Set LLM_CACHE=0 to always hit Ollama.
+llm_cache = LLMCache(os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite"))) \
+    if os.getenv("LLM_CACHE", "1") != "0" else None
+
 
 
+# Node outputs memoized for parameter sweeps (STAGE_CACHE=1, or sweep.py / backtest.py --stage-cache)
+stage_cache = StageCache(
+    os.getenv("STAGE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_cache.sqlite")),
+    enabled=os.getenv("STAGE_CACHE", "0") != "0"
+)
 
 #structured output for interm step
+@stage_cache.register_model
 class MarketChoice(BaseModel):
     selected_number: int
     reasoning: str
+    confidence: Optional[float] = None  # self-reported certainty, 0-100
+
+def get_structured_llm(model: str = LLM_MODEL):
+    return _resource(f"model_with_structure:{model}", lambda: get_llm(model).with_structured_output(MarketChoice))
+
+# --- LLM Gateway ---
+class LLMGateway:
+    """Front door for every Ollama request made by the pipeline.
+
+    Requests for the same model are collected for `window` seconds and then dispatched
+    together onto a per-model pool sized to the server's parallel slots
+    (OLLAMA_NUM_PARALLEL), so many in-flight tweets don't pile up on the single Ollama
+    instance. Identical prompts already in flight share one Future instead of being
+    sent twice. Queue time (waiting for a slot) and generation time are tracked apart.
+    """
+
+    def __init__(self, slots: int = None, window: float = None):
+        self.slots = slots or int(os.getenv("OLLAMA_NUM_PARALLEL", "2"))
+        self.window = window if window is not None else float(os.getenv("LLM_BATCH_WINDOW_MS", "20")) / 1000
+        self._lock = threading.Lock()
+        self._executors = {}  # model -> ThreadPoolExecutor
+        self._pending = {}    # model -> [(key, fn, future, enqueued_at)]
+        self._timers = {}     # model -> threading.Timer
+        self._inflight = {}   # request key -> Future
+        self.stats = {
+            "requests": 0,
+            "deduped": 0,
+            "dispatched": 0,
+            "batches": 0,
+            "queue_seconds": 0.0,
+            "generation_seconds": 0.0,
+        }
+
+    def submit(self, model: str, key: str, fn) -> Future:
+        with self._lock:
+            self.stats["requests"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["deduped"] += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+            self._pending.setdefault(model, []).append((key, fn, future, time.perf_counter()))
+            if model not in self._timers:
+                timer = threading.Timer(self.window, self._dispatch, args=(model,))
+                timer.daemon = True
+                self._timers[model] = timer
+                timer.start()
+        return future
+
+    def call(self, model: str, key: str, fn):
+        return self.submit(model, key, fn).result()
+
+    def _dispatch(self, model: str):
+        with self._lock:
+            batch = self._pending.pop(model, [])
+            self._timers.pop(model, None)
+            executor = self._executors.get(model)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix=f"ollama-{model}")
+                self._executors[model] = executor
+            self.stats["batches"] += 1
+        for item in batch:
+            executor.submit(self._run, *item)
+
+    def _run(self, key, fn, future, enqueued_at):
+        rateLimit.acquire("ollama")  # optional per-service limit (backtest --rate ollama=N)
+        started = time.perf_counter()
+        try:
+            result = fn()
+            error = None
+        except BaseException as e:
+            result, error = None, e
+        finished = time.perf_counter()
+        with self._lock:
+            self._inflight.pop(key, None)
+            self.stats["dispatched"] += 1
+            self.stats["queue_seconds"] += started - enqueued_at
+            self.stats["generation_seconds"] += finished - started
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        dispatched = stats["dispatched"] or 1
+        stats["avg_queue_seconds"] = stats["queue_seconds"] / dispatched
+        stats["avg_generation_seconds"] = stats["generation_seconds"] / dispatched
+        return stats
+
+llm_gateway = LLMGateway()
+
+# --- Cached LLM Calls ---
+# The cassette wraps the response cache, not the other way round: a record run stores cache
+# hits too, and a replay never depends on what happens to be in the local cache.
+def invoke_llm(prompt: str, model: str = LLM_MODEL) -> str:
+    """Run a plain-text prompt through the LLM, served from the response cache when possible"""
+    def generate():
+        if llm_cache is not None:
+            cached = llm_cache.get(model, prompt)
+            if cached is not None:
+                return cached
+        key = LLMCache.make_key(model, prompt)
+        content = llm_gateway.call(model, key, lambda: get_llm(model).invoke(prompt).content)
+        if llm_cache is not None:
+            llm_cache.set(model, prompt, content)
+        return content
+
+    return cassette.call("ollama", {"model": model, "prompt": prompt}, generate)
+
+def invoke_structured(prompt: str, model: str = LLM_MODEL) -> MarketChoice:
+    """Run a prompt through the structured-output model, cached as MarketChoice JSON"""
+    kind = MarketChoice.__name__
+    def generate():
+        if llm_cache is not None:
+            cached = llm_cache.get(model, prompt, kind=kind)
+            if cached is not None:
+                return MarketChoice.model_validate_json(cached)
+        key = LLMCache.make_key(model, prompt, kind=kind)
+        result = llm_gateway.call(model, key, lambda: get_structured_llm(model).invoke(prompt))
+        if llm_cache is not None and result is not None:
+            llm_cache.set(model, prompt, result.model_dump_json(), kind=kind)
+        return result
+
+    return cassette.call(
+        "ollama", {"model": model, "prompt": prompt, "kind": kind}, generate,
+        decode=lambda value: MarketChoice.model_validate(value) if value is not None else None
+    )
 
-model_with_structure = llm.with_structured_output(MarketChoice)
+# --- Model Cascade ---
+# The small model answers first with a self-reported confidence. Decisions below
+# CONFIDENCE_THRESHOLD, or high-stakes ones (a significance call that would trade),
+# are re-asked to the next tier. Routing is per decision; a single tier disables escalation.
+MODEL_TIERS = {
+    "small": LLM_MODEL,
+    "large": os.getenv("OLLAMA_LARGE_MODEL", "llama3.2:3b"),
+}
+DECISION_ROUTING = {
+    "summary": ["small"],
+    "market_choice": ["small", "large"],
+    "token_choice": ["small", "large"],
+    "significance": ["small", "large"],
+}
+CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "70")) / 100
+ESCALATE_TRADES = os.getenv("CASCADE_ESCALATE_TRADES", "1") != "0"
+
+CONFIDENCE_INSTRUCTION = "\nOn a second line write your confidence from 0 to 100 as: CONFIDENCE: <number>\n"
+
+cascade_stats = {"decisions": {}, "tiers": {}}
+_cascade_lock = threading.Lock()
+
+def normalize_confidence(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return max(0.0, min(value / 100 if value > 1 else value, 1.0))
+
+# Only a line that is exactly "CONFIDENCE: n" counts, so reasoning that mentions confidence is kept
+_CONFIDENCE_LINE = re.compile(r"^[ \t]*CONFIDENCE[ \t]*:[ \t]*(\d+(?:\.\d+)?)[ \t]*%?[ \t]*$", re.MULTILINE | re.IGNORECASE)
+
+def split_confidence(text: str):
+    """Split an answer from its 'CONFIDENCE: n' line (the last one) -> (answer, confidence in [0, 1] or None)"""
+    matches = list(_CONFIDENCE_LINE.finditer(text))
+    if not matches:
+        return text.strip(), None
+    match = matches[-1]
+    return (text[:match.start()] + text[match.end():]).strip(), normalize_confidence(match.group(1))
+
+# The first standalone 1 or 2, so digits elsewhere in the reply (e.g. an inline "CONFIDENCE: 72") don't count
+_TOKEN_CHOICE = re.compile(r"\b([12])\b")
+
+def parse_token_choice(answer: str) -> int:
+    """'1'/'2' answer -> index into the token pair (0 when neither appears)"""
+    match = _TOKEN_CHOICE.search(answer or "")
+    return 1 if match and match.group(1) == "2" else 0
+
+def run_cascade(decision: str, attempt, high_stakes=None):
+    """Ask each tier routed for `decision` until one is confident; attempt(model) -> (answer, confidence)"""
+    tiers = DECISION_ROUTING.get(decision) or ["small"]
+    answer = None
+    answered_level = 0    # tier whose answer is returned
+    failed_escalation = False
+    for level, tier in enumerate(tiers):
+        started = time.perf_counter()
+        try:
+            answer, confidence = attempt(MODEL_TIERS[tier])
+        except Exception as e:
+            if level == 0:
+                raise
+            print(f"[cascade] {decision}: {tier} tier failed ({e}), keeping previous answer")
+            failed_escalation = True
+            break
+        finally:
+            with _cascade_lock:
+                tier_stats = cascade_stats["tiers"].setdefault(tier, {"calls": 0, "seconds": 0.0})
+                tier_stats["calls"] += 1
+                tier_stats["seconds"] += time.perf_counter() - started
+        answered_level = level
+        stakes = bool(high_stakes and high_stakes(answer))
+        if level == len(tiers) - 1 or (confidence is not None and confidence >= CONFIDENCE_THRESHOLD and not stakes):
+            break
+        print(f"[cascade] {decision}: escalating past {tier} (confidence {confidence}, high stakes {stakes})")
+    with _cascade_lock:
+        decision_stats = cascade_stats["decisions"].setdefault(
+            decision, {"calls": 0, "escalated": 0, "failed_escalations": 0}
+        )
+        decision_stats["calls"] += 1
+        # Only calls answered by a larger tier count as escalated; a failed escalation keeps the small answer
+        decision_stats["escalated"] += 1 if answered_level > 0 else 0
+        decision_stats["failed_escalations"] += 1 if failed_escalation else 0
+    return answer
+
+def cascade_report() -> dict:
+    """Escalation rate per decision and average latency per tier"""
+    with _cascade_lock:
+        report = {
+            "decisions": {name: dict(stats, escalation_rate=stats["escalated"] / stats["calls"] if stats["calls"] else 0.0)
+                          for name, stats in cascade_stats["decisions"].items()},
+            "tiers": {name: dict(stats, avg_seconds=stats["seconds"] / stats["calls"] if stats["calls"] else 0.0)
+                      for name, stats in cascade_stats["tiers"].items()},
+        }
+    return report
 
 # --- Prompt Template ---
 prompt = PromptTemplate.from_template("""
@@ -103,12 +419,16 @@ Respond confidently and quickly.
 """)
 
 # --- Helper Functions ---
-def get_top_k_markets(headline: str, k=5):
+TOP_K = int(os.getenv("TOP_K_MARKETS", "5"))  # candidates retrieved for the LLM to choose from
+
+def get_top_k_markets(headline: str, k=5, as_of=None):
     # If headline is an AIMessage, extract .content
     if hasattr(headline, "content"):
         headline = headline.content
 
-    return vectorstore.similarity_search_with_score(headline, k=k)
+    if POINT_IN_TIME and as_of:
+        return get_market_index().search(headline, as_of, k=k)
+    return get_market_retriever().search(headline, k=k)
 
 def format_market_choices(results):
     return "\n".join([f"{i+1}. {doc.metadata['name']}" for i, (doc, _) in enumerate(results)])
@@ -116,7 +436,7 @@ def format_market_choices(results):
 def make_llm_decision(headline: str, results):
     market_text = format_market_choices(results)
     prompt_input = prompt.format(headline=headline, markets=market_text)
-    return llm.invoke(prompt_input)
+    return AIMessage(content=invoke_llm(prompt_input))
 
 def make_llm_structured_decision(headline: str, markets, context):
     market_text = format_market_choices(markets)
@@ -129,24 +449,30 @@ A headline reads:
 You also have access to the following relevant context:
 "{context}"
 
-Here are 5 active prediction markets:
+Here are {len(markets)} active prediction markets:
 {market_text}
 
 Which market’s odds would change the most in response to this headline?
-Pick only one number (1–5).
+Pick only one number (1–{len(markets)}).
 
 Respond in JSON with:
 {{
-  "selected_number": <1-5>,
-  "reasoning": "...brief explanation..."
+  "selected_number": <1-{len(markets)}>,
+  "reasoning": "...brief explanation...",
+  "confidence": <0-100>
 }}
 """
-    return model_with_structure.invoke(input_prompt)
+    def attempt(model):
+        structured = invoke_structured(input_prompt, model=model)
+        return structured, normalize_confidence(structured.confidence)
+    return run_cascade("market_choice", attempt)
 
 def search_web_context(query: str, date: str):
-    search = TavilySearch(api_key=tavily_api_key, end_date=date)
+    def search():
+        rateLimit.acquire("tavily")
+        return TavilySearch(api_key=tavily_api_key, end_date=date).invoke({"query": query})
 
-    return search.invoke({"query": query})
+    return cassette.call("tavily", {"query": query, "end_date": date}, search)
 
 def summarize_headline_with_context(headline: str, context: str) -> str:
     prompt = f"""
@@ -157,114 +483,147 @@ Context: \"{context}\"
 
 Write a clear, neutral summary in 1-2 sentences. Focus on facts only. No analysis, questions, or extra formatting.
 """
-    return llm.invoke(prompt).content
+    return run_cascade("summary", lambda model: (invoke_llm(prompt, model=model), None))
 
 
 def get_market_tokens(market_id: str):
     try:
-        print(f"[get_market_tokens] Connecting to PostgreSQL")
-        conn = get_db_connection()
-        print("[get_market_tokens] PostgreSQL connection successful")
-        
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, name FROM tokens
-            WHERE market_id = %s
-            LIMIT 2
-            """,
-            (market_id,)
-        )
-        rows = cursor.fetchall()
-        tokens = [{"id": row[0], "name": row[1]} for row in rows]
-
-        cursor.close()
-        conn.close()
-        return tokens
+        tokens = market_catalog.get_tokens(market_id)[:2]
+        return [{"id": token["id"], "name": token["name"]} for token in tokens]
     except Exception as e:
         print(f"[get_market_tokens] Error fetching tokens: {e}")
         print(f"[get_market_tokens] Error type: {type(e).__name__}")
         return []
 
+# --- Speculative Candidate Prefetch ---
+# As soon as retrieval returns the top-k markets, tokens, titles and top-of-book quotes for
+# every candidate are loaded in the background while the LLM picks one. Later steps read the
+# preloaded data instead of doing their own DB/price round trips. Entries expire after
+# PREFETCH_TTL_SECONDS so a long-running worker never serves stale quotes for a repeated set.
+_prefetch_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PREFETCH_WORKERS", "4")), thread_name_prefix="prefetch")
+_prefetch_futures = OrderedDict()  # candidate ids -> (created_at, Future)
+_prefetch_lock = threading.Lock()
+_PREFETCH_KEEP = 256
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "60"))
+
+CLOB_PRICES_URL = "https://clob.polymarket.com/prices"
+QUOTE_TIMEOUT_SECONDS = float(os.getenv("QUOTE_TIMEOUT_SECONDS", "3"))
+
+def fetch_live_quotes(token_ids):
+    """{token_id: (bid, ask)} from a single CLOB /prices request covering every candidate token"""
+    if not token_ids:
+        return {}
+    params = [{"token_id": token_id, "side": side} for token_id in sorted(token_ids) for side in ("BUY", "SELL")]
+    def fetch():
+        rateLimit.acquire("polymarket")
+        response = requests.post(CLOB_PRICES_URL, json=params, timeout=QUOTE_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+    prices = cassette.call("polymarket_quotes", {"params": params}, fetch) or {}
+    as_float = lambda value: float(value) if value not in (None, "") else None
+    # Same side mapping as ingestion: BUY -> bid_price, SELL -> ask_price
+    return {token_id: (as_float(sides.get("BUY")), as_float(sides.get("SELL"))) for token_id, sides in prices.items()}
+
+def load_candidate_data(market_ids):
+    """Tokens, titles and bid/ask for a set of candidate markets.
+
+    Quotes come from one live CLOB request for all candidate tokens; if that fails the
+    last-ingest snapshot from the tokens table is used. quote_source says which one it is.
+    """
+    candidates = {}
+    for market_id in market_ids:
+        candidates[market_id] = {
+            "title": market_catalog.get_title(market_id),
+            "tokens": [{"id": token["id"], "name": token["name"], "bid": None, "ask": None, "quote_source": None}
+                       for token in market_catalog.get_tokens(market_id)[:2]]
+        }
+    tokens = [token for candidate in candidates.values() for token in candidate["tokens"]]
+    quotes, source = {}, None
+    try:
+        quotes, source = fetch_live_quotes([token["id"] for token in tokens]), "clob_live"
+    except Exception as e:
+        print(f"[prefetch] Live quotes unavailable ({e}); using last-ingest quotes")
+        try:
+            quotes, source = market_catalog.get_last_quotes(market_ids), "last_ingest"
+        except Exception as e:
+            print(f"[prefetch] Error fetching quotes: {e}")
+    for token in tokens:
+        if token["id"] in quotes:
+            token["bid"], token["ask"] = quotes[token["id"]]
+            token["quote_source"] = source
+    return candidates
+
+def prefetch_candidates(market_ids):
+    """Start (or reuse a fresh) background load for these candidates and return its Future"""
+    key = tuple(sorted(market_id for market_id in market_ids if market_id))
+    now = time.monotonic()
+    with _prefetch_lock:
+        while _prefetch_futures:
+            oldest_key, (created_at, _) = next(iter(_prefetch_futures.items()))
+            if now - created_at <= PREFETCH_TTL_SECONDS and len(_prefetch_futures) <= _PREFETCH_KEEP:
+                break
+            del _prefetch_futures[oldest_key]
+        entry = _prefetch_futures.get(key)
+        if entry is None:
+            entry = (now, _prefetch_pool.submit(load_candidate_data, key))
+            _prefetch_futures[key] = entry
+        return entry[1]
+
+def get_candidate(state: dict, market_id: str = None):
+    """Preloaded {title, tokens} for the selected market, falling back to the catalog"""
+    market_id = market_id or state.get("selected_id")
+    candidate_ids = [doc.id for doc, _ in state.get("top_k") or []]
+    if market_id in candidate_ids:
+        try:
+            candidate = prefetch_candidates(candidate_ids).result().get(market_id)
+            if candidate is not None:
+                return candidate
+        except Exception as e:
+            print(f"[prefetch] Falling back to catalog for {market_id}: {e}")
+    return {"title": market_catalog.get_title(market_id), "tokens": get_market_tokens(market_id)}
+
+# Local per-token price history; /prices-history is only hit for ranges not stored yet
+price_store = PriceHistoryStore(os.getenv("PRICE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_history")))
+
 def get_historical_price(token_id: str, start_timestamp: int, end_timestamp: int):
     """
-    Fetch historical price data from Polymarket API
+    Last price in [start, end] from the local price store, which fetches missing ranges from
     GET https://clob.polymarket.com/prices-history?market=TOKEN_ID&startTs=START&endTs=END&fidelity=1
     """
     try:
-        url = f"https://clob.polymarket.com/prices-history"
-        params = {
-            "market": token_id,
-            "startTs": start_timestamp,
-            "endTs": end_timestamp,
-            "fidelity": 1
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        if data and len(data) > 0:
-            # Return the last price in the time range
-            return float(data[-1].get('price', 0))
-        return None
-        
+        return price_store.price_at(token_id, start_timestamp, end_timestamp)
     except Exception as e:
         print(f"Error fetching historical price for {token_id}: {e}")
         return None
 
+# Decisions are logged by a single background writer; the pipeline only enqueues records
+decision_log = DecisionLogWriter(
+    csv_path=os.getenv("TRADE_LOG_CSV", "trades.csv"),
+    parquet_dir=os.getenv("TRADE_LOG_PARQUET_DIR") or None,
+    flush_interval=float(os.getenv("TRADE_LOG_FLUSH_SECONDS", "2")),
+    resolve_market_name=lambda market_id: market_catalog.get_title(market_id)
+)
+
 def write_action_to_csv(action: str, state: dict, trade_data: dict = None):
-    """Write trade or skip action to CSV file"""
-    csv_filename = 'trades.csv'
-    file_exists = os.path.exists(csv_filename)
-    
-    # Clean tweet text - extract just the text content
-    tweet_text = state.get('headline', '')
-    if isinstance(tweet_text, str) and tweet_text.startswith("{'id':"):
-        try:
-            # Extract text from tweet dict string
-            import ast
-            tweet_dict = ast.literal_eval(tweet_text)
-            tweet_text = tweet_dict.get('text', tweet_text)[:200]  # Limit length
-        except:
-            pass
-    
-    # Base data from state
-    csv_data = {
+    """Queue a trade or skip action for the decision log (trades.csv + optional Parquet)"""
+    record = {
         'date': state.get('date', ''),
-        'tweet': tweet_text,
-        'market_name': '',
+        'tweet': state.get('headline', ''),
+        'market_id': state.get('selected_id'),
         'token_name': '',
         'action': action,
         'purchase_price': None,
         'price_24h': None,
         'profit_loss_pct': None,
         'reasoning': state.get('enriched_headline', '')[:300] if state.get('enriched_headline') else '',  # Limit length
-        'skip_reason': ''
+        'skip_reason': '',
+        'token_id': state.get('token_id') or '',
+        'account': state.get('account') or ''
     }
     
-    # Get market name from selected_id
-    if state.get('selected_id') and state['selected_id'] != 'unknown_market_0':
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT title FROM markets WHERE id = %s", (state['selected_id'],))
-            market_row = cursor.fetchone()
-            if market_row:
-                csv_data['market_name'] = market_row[0][:100]  # Limit length
-            else:
-                csv_data['market_name'] = "No matching market found"
-            cursor.close()
-            conn.close()
-        except Exception as e:
-            print(f"Error getting market name for CSV: {e}")
-            csv_data['market_name'] = "Database error"
-    else:
-        csv_data['market_name'] = "No relevant markets found"
-    
     # Add trade-specific data if provided
     if trade_data:
-        csv_data.update({
+        record.update({
             'token_name': trade_data.get('token_name', ''),
             'purchase_price': trade_data.get('purchase_price'),
             'price_24h': trade_data.get('current_price'),
@@ -273,16 +632,9 @@ def write_action_to_csv(action: str, state: dict, trade_data: dict = None):
     
     # Add skip reason for skipped actions
     if action == 'SKIP':
-        csv_data['skip_reason'] = 'Low market impact - tweet not significant enough'
+        record['skip_reason'] = state.get('skip_reason') or 'Low market impact - tweet not significant enough'
     
-    with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['date', 'tweet', 'market_name', 'token_name', 'action', 'purchase_price', 'price_24h', 'profit_loss_pct', 'reasoning', 'skip_reason']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(csv_data)
+    decision_log.submit(record)
 
 def write_backtest_result(csv_filename: str, trade_data: dict):
     """Write backtest results to CSV file - legacy function"""
@@ -321,52 +673,24 @@ Reasoning: "{reasoning}"
 Which token should be bought in response to this reasoning?
 
 Respond with just the number: 1 or 2.
-"""
+""" + CONFIDENCE_INSTRUCTION
 
-    result = llm.invoke(prompt).content.strip()
+    result = run_cascade("token_choice", lambda model: split_confidence(invoke_llm(prompt, model=model)))
     print (tokens)
-    if "2" in result:
-        return tokens[1]["id"]
-    else:
-        return tokens[0]["id"]
+    return tokens[parse_token_choice(result)]["id"]
 
 
 
 def execute_trade_on_token(token_id: str, headline: str, buffHeadline: str, trade_date: str = None):
     try:
-        print(f"[execute_trade_on_token] Connecting to PostgreSQL")
-        conn = get_db_connection()
-        print("[execute_trade_on_token] PostgreSQL connection successful")
-        
-        cursor = conn.cursor()
-
-        # Fetch token name and market ID
-        cursor.execute(
-            """
-            SELECT name, market_id FROM tokens
-            WHERE id = %s
-            """,
-            (token_id,)
-        )
-        token_row = cursor.fetchone()
-        if not token_row:
+        # Token name, market ID and market name come from the in-memory catalog
+        token = market_catalog.get_token(token_id)
+        if not token:
             print(f"Token with ID {token_id} not found.")
-            cursor.close()
-            conn.close()
             return
 
-        token_name, market_id = token_row
-
-        # Fetch market name
-        cursor.execute(
-            """
-            SELECT title FROM markets
-            WHERE id = %s
-            """,
-            (market_id,)
-        )
-        market_row = cursor.fetchone()
-        market_name = market_row[0] if market_row else "Unknown Market"
+        token_name, market_id = token["name"], token["market_id"]
+        market_name = market_catalog.get_title(market_id) or "Unknown Market"
         
         # For backtesting: get historical prices
         purchase_price = None
@@ -377,6 +701,12 @@ def execute_trade_on_token(token_id: str, headline: str, buffHeadline: str, trad
             # Convert trade_date to timestamp
             trade_timestamp = int(datetime.fromisoformat(trade_date).timestamp())
             
+            # One bulk fetch covering both lookups below (served locally on re-runs)
+            try:
+                price_store.ensure_range(token_id, trade_timestamp - 3600, trade_timestamp + 86400 + 3600)
+            except Exception as e:
+                print(f"Error prefetching price history for {token_id}: {e}")
+            
             # Get price at purchase time (within 1 hour window)
             purchase_price = get_historical_price(token_id, trade_timestamp - 3600, trade_timestamp + 3600)
             
@@ -411,26 +741,31 @@ def execute_trade_on_token(token_id: str, headline: str, buffHeadline: str, trad
             print(f"{color} P&L: {profit_loss:+.2f}%")
         print(f"{'='*80}\n")
         
-        # Store in database with enhanced schema
-        cursor.execute(
-            """
-            INSERT INTO BOUGHT (TokenID, Tweet, ContextHeadline, Event, Date, PurchasePrice, CurrentPrice, ProfitLoss)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (TokenID) DO UPDATE SET
-                Tweet = EXCLUDED.Tweet,
-                ContextHeadline = EXCLUDED.ContextHeadline,
-                Event = EXCLUDED.Event,
-                Date = EXCLUDED.Date,
-                PurchasePrice = EXCLUDED.PurchasePrice,
-                CurrentPrice = EXCLUDED.CurrentPrice,
-                ProfitLoss = EXCLUDED.ProfitLoss
-            """,
-            (token_id, headline, buffHeadline, text, trade_date, purchase_price, current_price, profit_loss)
-        )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Store in database with enhanced schema (skipped when replaying a backtest offline)
+        if not cassette.offline:
+            print(f"[execute_trade_on_token] Connecting to PostgreSQL")
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO BOUGHT (TokenID, Tweet, ContextHeadline, Event, Date, PurchasePrice, CurrentPrice, ProfitLoss)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (TokenID) DO UPDATE SET
+                    Tweet = EXCLUDED.Tweet,
+                    ContextHeadline = EXCLUDED.ContextHeadline,
+                    Event = EXCLUDED.Event,
+                    Date = EXCLUDED.Date,
+                    PurchasePrice = EXCLUDED.PurchasePrice,
+                    CurrentPrice = EXCLUDED.CurrentPrice,
+                    ProfitLoss = EXCLUDED.ProfitLoss
+                """,
+                (token_id, headline, buffHeadline, text, trade_date, purchase_price, current_price, profit_loss)
+            )
+
+            conn.commit()
+            cursor.close()
+            conn.close()
+
         
         # Note: CSV writing is now handled in trade_step() to avoid duplicates
         
@@ -453,6 +788,67 @@ class GraphState(TypedDict):
     token_id: str
     date: str
     enriched_date: str  # Added for date enrichment
+    relevance_score: float
+    skip_reason: str
+    started_at: float
+    account: str  # tweet author, for per-account P&L breakdowns
+
+# 🚦 STEP 0: Relevance Gate
+# Embeds the raw tweet and checks the best market match before any Tavily/LLM work.
+# RELEVANCE_THRESHOLD is a cosine similarity in [0, 1]; 0 disables the gate.
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.25"))
+
+relevance_stats = {
+    "checked": 0,
+    "filtered": 0,
+    "passed_runs": 0,
+    "passed_seconds": 0.0,   # wall time of full pipeline runs that passed the gate
+    "gate_seconds": 0.0,
+}
+_relevance_lock = threading.Lock()
+
+def distance_to_similarity(distance: float) -> float:
+    """Chroma's default L2 (squared) distance on unit vectors -> cosine similarity"""
+    return 1.0 - distance / 2.0
+
+def relevance_gate(state: GraphState):
+    started = time.perf_counter()
+    tweet_text = clean_tweet_text(state["headline"], limit=None)
+    hits = get_top_k_markets(tweet_text, k=1, as_of=state.get("date")) if RELEVANCE_THRESHOLD > 0 else []
+    score = distance_to_similarity(hits[0][1]) if hits and hits[0][1] is not None else 0.0
+    with _relevance_lock:
+        relevance_stats["checked"] += 1
+        relevance_stats["gate_seconds"] += time.perf_counter() - started
+    print(f"[relevance_gate] Best market similarity {score:.3f} (threshold {RELEVANCE_THRESHOLD})")
+    return {"relevance_score": score, "started_at": started}
+
+def route_after_gate(state: GraphState):
+    if RELEVANCE_THRESHOLD > 0 and state.get("relevance_score", 0.0) < RELEVANCE_THRESHOLD:
+        return "skip"
+    return "continue"
+
+def skip_irrelevant(state: GraphState):
+    with _relevance_lock:
+        relevance_stats["filtered"] += 1
+    return {"skip_reason": f"No related market (similarity {state.get('relevance_score', 0.0):.2f} < {RELEVANCE_THRESHOLD})"}
+
+def record_pipeline_time(state: dict):
+    """Track full-pipeline wall time for tweets that passed the gate (used to estimate time saved)"""
+    if state.get("started_at") is None or state.get("skip_reason"):
+        return
+    with _relevance_lock:
+        relevance_stats["passed_runs"] += 1
+        relevance_stats["passed_seconds"] += time.perf_counter() - state["started_at"]
+
+def relevance_gate_report() -> dict:
+    """Filtered fraction and estimated time saved by the relevance gate"""
+    with _relevance_lock:
+        stats = dict(relevance_stats)
+    avg_full = stats["passed_seconds"] / stats["passed_runs"] if stats["passed_runs"] else 0.0
+    avg_gate = stats["gate_seconds"] / stats["checked"] if stats["checked"] else 0.0
+    stats["filtered_fraction"] = stats["filtered"] / stats["checked"] if stats["checked"] else 0.0
+    stats["est_seconds_saved"] = stats["filtered"] * max(avg_full - avg_gate, 0.0)
+    return stats
 
 # 🔍 STEP 1: Search + Enrich Headline
 
@@ -484,7 +880,8 @@ def enrich_headline(state: GraphState):
 # 📈 STEP 2: Embed + Search
 
 def embed_and_search(state: GraphState):
-    top_k = get_top_k_markets(state["enriched_headline"])
+    top_k = get_top_k_markets(state["enriched_headline"], k=TOP_K, as_of=state.get("date"))
+    prefetch_candidates([doc.id for doc, _ in top_k])  # runs while decide_market waits on the LLM
     return {"top_k": top_k}
 
 # 🧠 STEP 3: LLM Market Decision + Structured Output
@@ -497,24 +894,21 @@ def decide_market(state: GraphState):
     ))
     selected_index = structured.selected_number - 1
     # Get the selected document from ChromaDB search results
-    selected_doc = state["top_k"][selected_index][0]
+    if not 0 <= selected_index < len(state["top_k"]):
+        print(f"LLM picked out-of-range market {structured.selected_number}, defaulting to 1")
+        selected_index = 0
+    selected_doc = state["top_k"][selected_index][0] if state["top_k"] else None
     
-    # The market ID is stored as the ChromaDB document ID, need to get it from the collection
-    # For now, we'll use a workaround since ChromaDB similarity_search doesn't return IDs
-    print(f"Selected document metadata: {selected_doc.metadata}")
-    print(f"Selected document content: {selected_doc.page_content}")
+    # The market ID is the ChromaDB document ID, returned by MarketRetriever with the search hit
+    if selected_doc is not None:
+        print(f"Selected document metadata: {selected_doc.metadata}")
+        print(f"Selected document content: {selected_doc.page_content}")
     
-    # Try to find the market ID by searching the collection again
-    search_results = vectorstore.get(
-        where={"name": selected_doc.metadata.get("name")},
-        limit=1
-    )
-    
-    if search_results and search_results.get("ids"):
-        market_id = search_results["ids"][0]
+    if selected_doc is not None and selected_doc.id:
+        market_id = selected_doc.id
         print(f"Found market ID: {market_id}")
     else:
-        print(f"Could not find market ID for: {selected_doc.metadata.get('name')}")
+        print(f"Could not find market ID for option {selected_index + 1}")
         market_id = f"unknown_market_{selected_index}"
     return {
         "selected_id": market_id,
@@ -524,38 +918,20 @@ def decide_market(state: GraphState):
 # 🎯 STEP 4: Token Selection
 
 def get_token_to_trade(state: GraphState):
-    tokens = get_market_tokens(state["selected_id"])
+    tokens = get_candidate(state)["tokens"]
     token_key = decide_token_to_trade(state["structured_output"],state["enriched_headline"], tokens)
     return {"token_id": token_key}
 
 # 🔍 STEP 5: Significance Check
-
-def check_significance(state: GraphState):
-    """Check if the tweet will significantly impact the market odds"""
-    tokens = get_market_tokens(state["selected_id"])
-    if len(tokens) < 2:
-        return "skip"
-    
-    # Get market name for context
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM markets WHERE id = %s", (state["selected_id"],))
-        market_row = cursor.fetchone()
-        market_name = market_row[0] if market_row else "Unknown Market"
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"Error getting market name: {e}")
-        market_name = "Unknown Market"
-    
-    prompt = f"""
+# Prompt variants are selectable (SIGNIFICANCE_PROMPT env / configure_pipeline) so sweeps can compare them
+SIGNIFICANCE_PROMPTS = {
+    "v1": """
 You are an expert market analyst evaluating whether news will significantly impact prediction market odds.
-The Date is {state["date"]} take this into consideration and act accordingly.
-Tweet: "{state["headline"]}"
-Context: "{state["enriched_headline"]}"
-Market: "{market_name}"
-Reasoning from previous analysis: "{state["structured_output"].reasoning}"
+The Date is {date} take this into consideration and act accordingly.
+Tweet: "{headline}"
+Context: "{context}"
+Market: "{market}"
+Reasoning from previous analysis: "{reasoning}"
 
 Will this tweet cause a SIGNIFICANT change in the market odds (>5% price movement)?
 
@@ -566,17 +942,53 @@ Consider:
 - Would traders immediately react to this news?
 
 Respond with exactly one word: "significant" or "insignificant"
-"""
-    
-    result = llm.invoke(prompt).content.strip().lower()
-    if "significant" in result:
-        return "execute"
-    else:
+""",
+    "terse": """
+Date: {date}
+Tweet: "{headline}"
+Context: "{context}"
+Market: "{market}"
+
+Would this tweet move the market's odds by more than 5%?
+Respond with exactly one word: "significant" or "insignificant"
+""",
+}
+SIGNIFICANCE_PROMPT = os.getenv("SIGNIFICANCE_PROMPT", "v1")
+
+def check_significance(state: GraphState):
+    """Check if the tweet will significantly impact the market odds"""
+    candidate = get_candidate(state)
+    if len(candidate["tokens"]) < 2:
         return "skip"
+    
+    # Get market name for context
+    try:
+        market_name = candidate["title"] or "Unknown Market"
+    except Exception as e:
+        print(f"Error getting market name: {e}")
+        market_name = "Unknown Market"
+    
+    prompt = SIGNIFICANCE_PROMPTS[SIGNIFICANCE_PROMPT].format(
+        date=state["date"],
+        headline=state["headline"],
+        context=state["enriched_headline"],
+        market=market_name,
+        reasoning=state["structured_output"].reasoning
+    ) + CONFIDENCE_INSTRUCTION
+    
+    def attempt(model):
+        answer, confidence = split_confidence(invoke_llm(prompt, model=model))
+        answer = answer.lower()
+        # "insignificant" contains "significant", so check the negative first
+        return ("skip" if "insignificant" in answer or "significant" not in answer else "execute"), confidence
+    
+    # A call that would place a trade is high stakes: confirm it with the larger model
+    return run_cascade("significance", attempt, high_stakes=lambda answer: ESCALATE_TRADES and answer == "execute")
 
 # 💸 STEP 6: Trade
 
 async def trade_step(state: GraphState):
+    record_pipeline_time(state)
     execute_trade_on_token(state["token_id"], state["headline"], state["enriched_headline"], state.get("date"))
     
     # Write trade to CSV using modular function
@@ -584,25 +996,18 @@ async def trade_step(state: GraphState):
     
     # Broadcast trade executed event
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT t.name, m.title 
-            FROM tokens t 
-            JOIN markets m ON t.market_id = m.id 
-            WHERE t.id = %s
-        """, (state["token_id"],))
-        
-        result = cursor.fetchone()
-        if result:
-            token_name, market_name = result
+        candidate = get_candidate(state)
+        token = next((t for t in candidate["tokens"] if t["id"] == state["token_id"]), None)
+        market_name = candidate["title"]
+        if token and market_name:
             await broadcast_trade_event("trade_executed", {
                 "token_id": state["token_id"],
-                "token_name": token_name,
-                "market_name": market_name
+                "token_name": token["name"],
+                "market_name": market_name,
+                "bid": token["bid"],
+                "ask": token["ask"],
+                "quote_source": token.get("quote_source")
             })
-        cursor.close()
-        conn.close()
     except Exception as e:
         print(f"Error broadcasting trade: {e}")
     
@@ -611,60 +1016,176 @@ async def trade_step(state: GraphState):
 # 🚫 STEP 6: Skip Trade
 
 async def skip_trade_step(state: GraphState):
-    print(f"Skipping trade - tweet not significant enough for market impact")
+    record_pipeline_time(state)
+    print(f"Skipping trade - {state.get('skip_reason') or 'tweet not significant enough for market impact'}")
     
     # Write skip to CSV using modular function
     write_action_to_csv('SKIP', state)
     
     # Broadcast trade skipped event
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT title FROM markets WHERE id = %s", (state["selected_id"],))
-        result = cursor.fetchone()
-        market_name = result[0] if result else "Unknown Market"
+        market_name = market_catalog.get_title(state["selected_id"]) or "Unknown Market"
         
         await broadcast_trade_event("trade_skipped", {
-            "reason": "Low market impact - tweet not significant enough",
+            "reason": state.get("skip_reason") or "Low market impact - tweet not significant enough",
             "market_name": market_name
         })
-        
-        cursor.close()
-        conn.close()
     except Exception as e:
         print(f"Error broadcasting skip: {e}")
     
     return {}
 
 
-# 🧱 LANGGRAPH CONSTRUCTION
-workflow = StateGraph(GraphState)
-workflow.add_node("enrich_headline", enrich_headline)
-workflow.add_node("embed_and_search", embed_and_search)
-workflow.add_node("decide_market", decide_market)
-workflow.add_node("get_token_to_trade", get_token_to_trade)
-workflow.add_node("trade_step", trade_step)
-workflow.add_node("skip_trade_step", skip_trade_step)
-
-workflow.set_entry_point("enrich_headline")
-workflow.add_edge("enrich_headline", "embed_and_search")
-workflow.add_edge("embed_and_search", "decide_market")
-workflow.add_edge("decide_market", "get_token_to_trade")
-
-# Add conditional edge for significance check
-workflow.add_conditional_edges(
-    "get_token_to_trade",
-    check_significance,
-    {
-        "execute": "trade_step",
-        "skip": "skip_trade_step"
+# ⚙️ PIPELINE CONFIG
+# Tunable parameters in one place - read by the nodes at call time, hashed into stage-cache keys
+def pipeline_config() -> dict:
+    return {
+        "top_k": TOP_K,
+        "relevance_threshold": RELEVANCE_THRESHOLD,
+        "small_model": MODEL_TIERS["small"],
+        "large_model": MODEL_TIERS["large"],
+        "confidence_threshold": CONFIDENCE_THRESHOLD,
+        "escalate_trades": ESCALATE_TRADES,
+        "significance_prompt": SIGNIFICANCE_PROMPT,
+        "point_in_time": POINT_IN_TIME,
+    }
+
+def configure_pipeline(**overrides):
+    """Override pipeline parameters in this process (used by sweeps); returns the resulting config"""
+    global TOP_K, RELEVANCE_THRESHOLD, CONFIDENCE_THRESHOLD, ESCALATE_TRADES, SIGNIFICANCE_PROMPT, POINT_IN_TIME
+    unknown = set(overrides) - set(pipeline_config())
+    if unknown:
+        raise ValueError(f"Unknown pipeline parameters: {', '.join(sorted(unknown))}")
+    if overrides.get("significance_prompt", SIGNIFICANCE_PROMPT) not in SIGNIFICANCE_PROMPTS:
+        raise ValueError(f"Unknown significance prompt '{overrides['significance_prompt']}' "
+                         f"(expected one of {', '.join(SIGNIFICANCE_PROMPTS)})")
+    TOP_K = int(overrides.get("top_k", TOP_K))
+    RELEVANCE_THRESHOLD = float(overrides.get("relevance_threshold", RELEVANCE_THRESHOLD))
+    MODEL_TIERS["small"] = overrides.get("small_model", MODEL_TIERS["small"])
+    MODEL_TIERS["large"] = overrides.get("large_model", MODEL_TIERS["large"])
+    CONFIDENCE_THRESHOLD = float(overrides.get("confidence_threshold", CONFIDENCE_THRESHOLD))
+    ESCALATE_TRADES = bool(overrides.get("escalate_trades", ESCALATE_TRADES))
+    SIGNIFICANCE_PROMPT = overrides.get("significance_prompt", SIGNIFICANCE_PROMPT)
+    POINT_IN_TIME = bool(overrides.get("point_in_time", POINT_IN_TIME))
+    return pipeline_config()
+
+_LLM_CONFIG = ("small_model", "large_model", "confidence_threshold")
+_LLM_CODE = (run_cascade, split_confidence, CONFIDENCE_INSTRUCTION)
+
+def memoized(name: str, fn, inputs, config=(), code=(), context=None):
+    return stage_cache.node(name, fn, inputs, config, code, get_config=pipeline_config, context=context)
+
+def retrieval_context() -> dict:
+    """What retrieval reads besides state: a re-ingest or backend switch must not reuse old hits"""
+    market_catalog.ensure_loaded()
+    return {
+        "embedding_backend": os.getenv("EMBEDDING_BACKEND", "torch").lower(),
+        "collection_count": get_vectorstore()._collection.count(),
+        "catalog_watermark": str(market_catalog.watermark),
     }
-)
 
-workflow.add_edge("trade_step", END)
-workflow.add_edge("skip_trade_step", END)
+# 🧱 LANGGRAPH CONSTRUCTION
+def build_graph():
+    """Assemble and compile the pipeline graph"""
+    workflow = StateGraph(GraphState)
+    workflow.add_node("relevance_gate", relevance_gate)
+    workflow.add_node("skip_irrelevant", skip_irrelevant)
+    # Pure (side-effect free) stages are memoized when the stage cache is enabled; the gate
+    # (timing stats) and the trade/skip steps (DB, CSV, broadcasts) always run
+    workflow.add_node("enrich_headline", memoized(
+        "enrich_headline", enrich_headline, ("headline", "date"), ("small_model",),
+        (search_web_context, summarize_headline_with_context, run_cascade)))
+    workflow.add_node("embed_and_search", memoized(
+        "embed_and_search", embed_and_search, ("enriched_headline", "date"), ("top_k", "point_in_time"),
+        context=retrieval_context))
+    workflow.add_node("decide_market", memoized(
+        "decide_market", decide_market, ("headline", "top_k", "search_results"), _LLM_CONFIG,
+        (make_llm_structured_decision, format_market_choices) + _LLM_CODE))
+    workflow.add_node("get_token_to_trade", memoized(
+        "get_token_to_trade", get_token_to_trade, ("selected_id", "structured_output", "enriched_headline"), _LLM_CONFIG,
+        (decide_token_to_trade,) + _LLM_CODE))
+    workflow.add_node("trade_step", trade_step)
+    workflow.add_node("skip_trade_step", skip_trade_step)
+
+    workflow.set_entry_point("relevance_gate")
+    workflow.add_conditional_edges(
+        "relevance_gate",
+        route_after_gate,
+        {
+            "continue": "enrich_headline",
+            "skip": "skip_irrelevant"
+        }
+    )
+    workflow.add_edge("skip_irrelevant", "skip_trade_step")
+    workflow.add_edge("enrich_headline", "embed_and_search")
+    workflow.add_edge("embed_and_search", "decide_market")
+    workflow.add_edge("decide_market", "get_token_to_trade")
+
+    # Add conditional edge for significance check
+    workflow.add_conditional_edges(
+        "get_token_to_trade",
+        memoized("check_significance", check_significance,
+                 ("date", "headline", "enriched_headline", "structured_output", "selected_id"),
+                 _LLM_CONFIG + ("escalate_trades", "significance_prompt"),
+                 _LLM_CODE + (json.dumps(SIGNIFICANCE_PROMPTS, sort_keys=True),)),
+        {
+            "execute": "trade_step",
+            "skip": "skip_trade_step"
+        }
+    )
+
+    workflow.add_edge("trade_step", END)
+    workflow.add_edge("skip_trade_step", END)
+    return workflow.compile()
+
+def get_graph():
+    return _resource("graph", build_graph)
+
+_LAZY_ATTRIBUTES = {
+    "embedding_model": get_embedding_model,
+    "vectorstore": get_vectorstore,
+    "market_retriever": get_market_retriever,
+    "llm": get_llm,
+    "model_with_structure": get_structured_llm,
+    "graph": get_graph,
+}
+
+def __getattr__(name):
+    # Keeps `from langgraphPipe import graph` (and friends) working while staying lazy
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Warm-up ---
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+def warmup():
+    """Load every lazy resource and run one embedding and one tiny LLM prompt"""
+    started = time.perf_counter()
+    steps = [
+        ("embedding", lambda: get_embedding_model().embed_query("warm up")),
+        ("vector store", lambda: get_market_retriever().search("warm up", k=1)),
+        ("market catalog", market_catalog.ensure_loaded),
+        ("llm", lambda: get_llm().invoke("Reply with OK.")),  # bypasses the cache on purpose: loads the model into Ollama
+        ("graph", get_graph),
+    ]
+    for name, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"[warmup] {name} failed: {e}")
+    print(f"[warmup] Pipeline warm in {time.perf_counter() - started:.2f}s")
+
+def start_warmup():
+    """Run warmup() once in a background thread; safe to call repeatedly"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warmup, name="pipeline-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
 
-graph = workflow.compile()
 initial_state = {
     "headline": "Apple announces Tim Cook will retire next year.",
     "enriched_headline": "",
@@ -1,10 +1,10 @@
-from langgraphPipe import graph  # Make sure prediction_agent.py is in same directory
+from langgraphPipe import get_graph  # Make sure prediction_agent.py is in same directory
 from pprint import pprint
 from datetime import datetime
 
-# 🟡 Provide a headline to test the pipeline
-async def runcom(tweet):
-    initial_state = {
+def make_initial_state(tweet, date=None, account=''):
+    """Pipeline input for one tweet; date defaults to now"""
+    return {
         "headline": f"{tweet}",
         "enriched_headline": "",
         "search_results": "",
@@ -12,14 +12,19 @@ async def runcom(tweet):
         "structured_output": {},
         "selected_id": "",
         "token_id": "",
-        "date": datetime.now().isoformat()
+        "date": date or datetime.now().isoformat(),
+        "account": account or ''
     }
 
+# 🟡 Provide a headline to test the pipeline
+async def runcom(tweet):
+    initial_state = make_initial_state(tweet)
+
     # ▶️ Run full graph asynchronously
     print("\n🚀 Running LangGraph...\n")
     print(f"🔍 Initial state: {initial_state}")
     try:
-        final_result = await graph.ainvoke(initial_state)
+        final_result = await get_graph().ainvoke(initial_state)
         print(f"✅ LangGraph completed successfully!")
         print(f"🔍 Final result: {final_result}")
     except Exception as e:
@@ -0,0 +1,72 @@
+# llmCache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+
+
+class LLMCache:
+    """Content-addressed, disk-backed cache for deterministic (temperature=0) LLM calls.
+
+    Keys are sha256(model + kind + prompt). `kind` separates plain text completions
+    from structured outputs (e.g. "MarketChoice") so the same prompt can be cached
+    under both without collisions.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # One shared connection guarded by a lock - pipeline nodes run in worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, kind: str = "text") -> str:
+        digest = hashlib.sha256()
+        for part in (model, kind, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, model: str, prompt: str, kind: str = "text"):
+        key = self.make_key(model, prompt, kind)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, model: str, prompt: str, response: str, kind: str = "text"):
+        key = self.make_key(model, prompt, kind)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, kind, response, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, kind, response, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
@@ -0,0 +1,202 @@
+# marketCatalog.py
+
+import os
+import threading
+import time
+import psycopg2
+from dotenv import load_dotenv
+from cassette import cassette
+
+
+def _connect():
+    load_dotenv()
+    return psycopg2.connect(
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+        dbname=os.getenv("POSTGRES_DB")
+    )
+
+
+class MarketCatalog:
+    """In-memory copy of the markets/tokens tables, indexed by market id and token id.
+
+    Loaded once on first use (live markets only), then kept current incrementally:
+      - refresh() polls markets.updated_at, which ingestion and catalogRefresher bump on every
+        write: changed markets are reloaded with their tokens, pruned ones are evicted
+      - a lookup miss loads that single market from Postgres and caches it
+
+    Ingestion runs in its own process, so the table is the only channel between them.
+    The catalog is read-only: the columns it relies on (updated_at, pruned_at) are
+    migrated by ingestion (create_tables_async), never from here.
+    """
+
+    # Rows committed slightly after a newer updated_at was read are caught by re-reading this margin
+    REFRESH_OVERLAP_SECONDS = 300
+
+    def __init__(self, connect=_connect, refresh_interval: float = None):
+        self._connect = connect
+        self.refresh_interval = refresh_interval if refresh_interval is not None \
+            else float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.watermark = None       # newest markets.updated_at seen
+        self.markets = {}           # market_id -> {"id", "title", "expiry_date"}
+        self.tokens = {}            # token_id -> {"id", "name", "market_id"}
+        self.tokens_by_market = {}  # market_id -> [token, ...]
+
+    # --- Loading ---
+    def _query(self, sql: str, params=None):
+        """Run a read query (recorded/replayed by the cassette in backtests)"""
+        def fetch():
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+                cursor.close()
+                return rows
+            finally:
+                conn.close()
+        return cassette.call("postgres", {"sql": sql, "params": params}, fetch)
+
+    def load(self):
+        """Full load of markets and tokens"""
+        watermark = self._query("SELECT MAX(updated_at) FROM markets")[0][0]
+        market_rows = self._query("SELECT id, title, expiry_date FROM markets WHERE pruned_at IS NULL")
+        token_rows = self._query("""
+            SELECT t.id, t.market_id, t.name FROM tokens t
+            JOIN markets m ON m.id = t.market_id WHERE m.pruned_at IS NULL
+        """)
+
+        with self._lock:
+            self.markets = {}
+            self.tokens = {}
+            self.tokens_by_market = {}
+            self.apply_batch(market_rows, token_rows)
+            self.watermark = watermark
+            self.loaded = True
+            self.loaded_at = time.time()
+        print(f"[MarketCatalog] Loaded {len(self.markets)} markets, {len(self.tokens)} tokens")
+
+    def ensure_loaded(self):
+        if self.loaded:
+            if self._stale():
+                with self._lock:
+                    if self._stale():  # another thread may have refreshed while we waited
+                        self.refresh()
+            return
+        with self._lock:
+            if not self.loaded:
+                self.load()
+
+    def _stale(self) -> bool:
+        return bool(self.refresh_interval) and not cassette.offline and time.time() - self.loaded_at > self.refresh_interval
+
+    def refresh(self):
+        """Incremental refresh: reload markets written since the watermark and evict pruned ones"""
+        with self._lock:  # the watermark is read and advanced by one refresh at a time
+            if self.watermark is None:
+                rows = self._query("SELECT id, pruned_at, updated_at FROM markets WHERE updated_at IS NOT NULL")
+            else:
+                rows = self._query(
+                    "SELECT id, pruned_at, updated_at FROM markets WHERE updated_at > %s - make_interval(secs => %s)",
+                    (self.watermark, self.REFRESH_OVERLAP_SECONDS)
+                )
+            pruned = [row[0] for row in rows if row[1] is not None]
+            changed = [row[0] for row in rows if row[1] is None]
+            if changed:
+                self._load_markets(changed)
+            if pruned:
+                self.evict(pruned)
+            if rows:
+                newest = max(row[2] for row in rows)
+                self.watermark = newest if self.watermark is None else max(self.watermark, newest)
+            if changed or pruned:
+                print(f"[MarketCatalog] Refreshed {len(changed)} changed markets, evicted {len(pruned)} pruned")
+            self.loaded_at = time.time()
+
+    def _load_markets(self, market_ids):
+        """(Re)load markets with their current token set, replacing what is cached for them"""
+        market_ids = sorted(market_ids)
+        market_rows = self._query("SELECT id, title, expiry_date FROM markets WHERE id = ANY(%s)", (market_ids,))
+        token_rows = self._query("SELECT id, market_id, name FROM tokens WHERE market_id = ANY(%s)", (market_ids,))
+        with self._lock:
+            self._drop_tokens(market_ids)
+            self.apply_batch(market_rows, token_rows)
+
+    def _drop_tokens(self, market_ids):
+        for market_id in market_ids:
+            for token in self.tokens_by_market.pop(market_id, []):
+                self.tokens.pop(token["id"], None)
+
+    def evict(self, market_ids):
+        """Forget markets (and their tokens), e.g. after catalogRefresher pruned them"""
+        with self._lock:
+            self._drop_tokens(market_ids)
+            for market_id in market_ids:
+                self.markets.pop(market_id, None)
+
+    def apply_batch(self, market_rows, token_rows):
+        """Merge (id, title, expiry_date) market rows and (id, market_id, name, ...) token rows"""
+        with self._lock:
+            for market_id, title, expiry_date in market_rows:
+                self.markets[market_id] = {"id": market_id, "title": title, "expiry_date": expiry_date}
+            for token_row in token_rows:
+                token_id, market_id, name = token_row[:3]
+                token = {"id": token_id, "name": name, "market_id": market_id}
+                previous = self.tokens.get(token_id)
+                self.tokens[token_id] = token
+                siblings = self.tokens_by_market.setdefault(market_id, [])
+                if previous is not None and previous in siblings:
+                    siblings[siblings.index(previous)] = token
+                else:
+                    siblings.append(token)
+
+    # --- Lookups ---
+    def get_market(self, market_id: str):
+        self.ensure_loaded()
+        market = self.markets.get(market_id)
+        if market is None and market_id:
+            self._load_markets([market_id])
+            market = self.markets.get(market_id)
+        return market
+
+    def get_title(self, market_id: str):
+        market = self.get_market(market_id)
+        return market["title"] if market else None
+
+    def get_tokens(self, market_id: str):
+        if self.get_market(market_id) is None:
+            return []
+        return list(self.tokens_by_market.get(market_id, []))
+
+    def get_last_quotes(self, market_ids):
+        """{token_id: (bid, ask)} for these markets as stored by the last ingestion run (not live)"""
+        rows = self._query(
+            "SELECT id, bid_price, ask_price FROM tokens WHERE market_id = ANY(%s)", (sorted(market_ids),)
+        )
+        return {
+            token_id: (float(bid) if bid is not None else None, float(ask) if ask is not None else None)
+            for token_id, bid, ask in rows
+        }
+
+    def get_market_lifetimes(self):
+        """[(id, title, listed_at, expiry_date)] for every stored market, pruned ones included (backtests)"""
+        return self._query("SELECT id, title, listed_at, expiry_date FROM markets ORDER BY id")
+
+    def get_token(self, token_id: str):
+        self.ensure_loaded()
+        token = self.tokens.get(token_id)
+        if token is None and token_id:
+            rows = self._query("SELECT market_id FROM tokens WHERE id = %s", (token_id,))
+            if rows:
+                self._load_markets([rows[0][0]])
+                token = self.tokens.get(token_id)
+        return token
+
+
+# Process-wide catalog shared by the pipeline and the ingestion job
+catalog = MarketCatalog()
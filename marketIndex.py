@@ -0,0 +1,152 @@
+# marketIndex.py
+
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from langchain_core.documents import Document
+from marketCatalog import catalog
+
+DEFAULT_PERIOD_SECONDS = 7 * 86400
+
+
+def to_timestamp(value):
+    """datetime / ISO string / epoch -> epoch seconds (naive datetimes are UTC, like the markets table)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class PointInTimeMarketIndex:
+    """Vector index over every market ever ingested, queryable "as of" a past timestamp.
+
+    Lifetimes come from the markets table (listed_at, expiry_date); embeddings are read
+    back from the Chroma events collection (titles missing there are embedded once).
+    The timeline is cut into fixed periods and each period keeps a contiguous slice of
+    the embedding matrix holding only markets live at some point in it, so a query
+    scores one small slice and applies the exact listed_at <= t < expiry check there.
+
+    Markets without listed_at (rows ingested before the column existed) count as listed
+    since the beginning; markets without an expiry never close.
+    """
+
+    def __init__(self, store, embeddings, period_seconds: int = DEFAULT_PERIOD_SECONDS):
+        self.store = store
+        self.embeddings = embeddings
+        self.period_seconds = period_seconds
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._slices = {}
+        self.loaded = False
+
+    # --- Loading ---
+    def load(self):
+        rows = catalog.get_market_lifetimes()
+        ids = [row[0] for row in rows]
+        titles = {row[0]: row[1] or "" for row in rows}
+        stored = self.store._collection.get(ids=ids, include=["embeddings", "metadatas"]) if ids else {}
+        vectors = {}
+        metadatas = {}
+        stored_ids = stored.get("ids") or []
+        stored_embeddings = stored.get("embeddings")
+        stored_metadatas = stored.get("metadatas") or [None] * len(stored_ids)
+        for market_id, vector, metadata in zip(stored_ids, stored_embeddings if stored_embeddings is not None else [], stored_metadatas):
+            vectors[market_id] = vector
+            metadatas[market_id] = metadata or {}
+        missing = [market_id for market_id in ids if market_id not in vectors]
+        if missing:
+            print(f"[PointInTimeMarketIndex] Embedding {len(missing)} markets missing from Chroma")
+            for market_id, vector in zip(missing, self.embeddings.embed_documents([titles[m] for m in missing])):
+                vectors[market_id] = vector
+
+        self.ids = ids
+        self.metadatas = [metadatas.get(market_id) or {"name": titles[market_id]} for market_id in ids]
+        self.titles = [titles[market_id] for market_id in ids]
+        self.matrix = np.asarray([vectors[market_id] for market_id in ids], dtype=np.float32).reshape(len(ids), -1)
+        self.sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        listed = [to_timestamp(row[2]) for row in rows]
+        expiry = [to_timestamp(row[3]) for row in rows]
+        self.listed = np.array([-np.inf if t is None else t for t in listed], dtype=np.float64)
+        self.expiry = np.array([np.inf if t is None else t for t in expiry], dtype=np.float64)
+        slices = self._build_slices()
+        with self._lock:
+            self._slices = slices
+        self.loaded = True
+        print(f"[PointInTimeMarketIndex] Indexed {len(ids)} markets in {len(slices)} period slices")
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+
+    # --- Slices ---
+    def _build_slice(self, period: int):
+        """(row indices, embedding rows, squared norms) for markets live during `period`"""
+        start = period * self.period_seconds
+        end = start + self.period_seconds
+        rows = np.flatnonzero((self.listed < end) & (self.expiry > start))
+        return rows, np.ascontiguousarray(self.matrix[rows]), self.sq_norms[rows]
+
+    def _build_slices(self) -> dict:
+        """Every period from the earliest listing/expiry to now, built up front"""
+        bounds = np.concatenate([self.listed[np.isfinite(self.listed)], self.expiry[np.isfinite(self.expiry)]])
+        now = time.time()
+        first = int((bounds.min() if bounds.size else now) // self.period_seconds)
+        last = int(max(bounds.max() if bounds.size else now, now) // self.period_seconds)
+        return {period: self._build_slice(period) for period in range(first, last + 1)}
+
+    def _slice(self, period: int):
+        with self._lock:
+            cached = self._slices.get(period)
+        if cached is not None:
+            return cached
+        cached = self._build_slice(period)  # outside the precomputed range (e.g. a future as-of)
+        with self._lock:
+            self._slices[period] = cached
+        return cached
+
+    def live_count(self, as_of) -> int:
+        self.ensure_loaded()
+        t = to_timestamp(as_of)
+        return int(np.count_nonzero((self.listed <= t) & (self.expiry > t)))
+
+    # --- Search ---
+    def search(self, query: str, as_of, k: int = 5):
+        """Top-k (Document, distance) among markets live at `as_of`, same shape as MarketRetriever.search"""
+        self.ensure_loaded()
+        t = to_timestamp(as_of)
+        rows, vectors, sq_norms = self._slice(int(t // self.period_seconds))
+        live = (self.listed[rows] <= t) & (self.expiry[rows] > t)
+        if not live.any():
+            return []
+        q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        # Squared L2, the metric the Chroma collection uses, so relevance thresholds carry over
+        distances = sq_norms + float(q @ q) - 2.0 * (vectors @ q)
+        distances = np.where(live, distances, np.inf)
+        k = min(k, int(live.sum()))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        results = []
+        for position in top:
+            row = rows[position]
+            results.append((
+                Document(id=self.ids[row], page_content=self.titles[row], metadata=self.metadatas[row]),
+                float(distances[position])
+            ))
+        return results
+
+    def report(self) -> dict:
+        with self._lock:
+            slices = list(self._slices.values())
+        return {
+            "markets": len(self.ids) if self.loaded else 0,
+            "slices": len(slices),
+            "avg_slice_size": sum(len(rows) for rows, _, _ in slices) / len(slices) if slices else 0.0,
+        }
@@ -1,5 +1,5 @@
 import asyncio
-from newfile import get_asyncpg_connection, fetch_active_markets
+from newfile import get_asyncpg_pool, close_asyncpg_pool, fetch_active_markets
 from py_clob_client.client import ClobClient
 import os
 from dotenv import load_dotenv
@@ -7,14 +7,13 @@ from websocketPoly import WebSocketOrderBook, createMarketWS
 
 
 async def subscribeToAll():
-    conn = await get_asyncpg_connection()
-    try:
+    pool = await get_asyncpg_pool()
+    # Release the connection before subscribing; the websocket handlers acquire their own
+    async with pool.acquire() as conn:
         rows = await conn.fetch("SELECT id FROM tokens;")
-        asset_ids = [row['id'] for row in rows]
-        MarketWS = createMarketWS(asset_ids, None, True)
-        await MarketWS.run()
-    finally:
-        await conn.close()
+    asset_ids = [row['id'] for row in rows]
+    MarketWS = createMarketWS(asset_ids, None, True)
+    await MarketWS.run()
 
 def connect():
     load_dotenv()
@@ -24,29 +23,33 @@ def connect():
     POLYMARKET_PROXY_ADDRESS: str = os.getenv("POLY_ADDRESS")  # Loaded from .env
 
 async def run_all():
-        # Scrape all markets and store in DB
-    await fetch_active_markets()
-        # After scraping, subscribe to all
-    await subscribeToAll()
+    pool = await get_asyncpg_pool()
+    try:
+            # Scrape all markets and store in DB
+        await fetch_active_markets(pool=pool)
+            # After scraping, subscribe to all
+        await subscribeToAll()
+    finally:
+        await close_asyncpg_pool()
 
 
-async def load_or_fetch_markets(conn):
+async def load_or_fetch_markets(pool):
     """Load markets from DB, or fetch if none exist."""
     # Check if any markets exist
-    result = await conn.fetchrow("SELECT COUNT(*) AS count FROM markets;")
+    result = await pool.fetchrow("SELECT COUNT(*) AS count FROM markets;")
     if result and result['count'] == 0:
         print("No markets found in DB. Fetching from API...")
-        await fetch_active_markets(conn=conn)
+        await fetch_active_markets(pool=pool)
     else:
         print(f"Markets found in DB: {result['count']}")
     # Load all markets
-    rows = await conn.fetch("SELECT id, title FROM markets;")
+    rows = await pool.fetch("SELECT id, title FROM markets;")
     return rows
 
 async def main():
-    conn = await get_asyncpg_connection()
+    pool = await get_asyncpg_pool()
     try:
-        markets = await load_or_fetch_markets(conn)
+        markets = await load_or_fetch_markets(pool)
         print(f"Loaded {len(markets)} markets.")
         connect()
         # Loop through markets and (for now) do nothing in the loop
@@ -57,7 +60,7 @@ async def main():
             # e.g., await subscribe_to_market_ws(market_id)
             # pass
     finally:
-        await conn.close()
+        await close_asyncpg_pool()
 
 # For testing, you can run this file directly
 if __name__ == "__main__":
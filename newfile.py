@@ -2,20 +2,38 @@
 
 import os
 import json
+import hashlib
 import httpx
 import asyncio
 from dotenv import load_dotenv
 from dbConnect import get_db_connection, create_markets_and_tokens_tables, create_tables_async  # Import connection function
 from datetime import datetime, timezone
+from decimal import Decimal
 import asyncpg
 from py_clob_client.client import ClobClient
 from py_clob_client.clob_types import BookParams
+from fetchEngine import RateLimitedFetcher
+import rateLimit
 
 # Load environment variables
 load_dotenv()
 host = "https://clob.polymarket.com"
 gamma_host = "https://gamma-api.polymarket.com"
 
+# Crawl limits (requests/s, burst) per API; override with INGEST_RATE_LIMITS="gamma=5:10,clob=10" or --rate
+DEFAULT_INGEST_RATES = {"gamma": (10.0, 20.0), "clob": (10.0, 20.0)}
+FETCH_CONCURRENCY = int(os.getenv("INGEST_FETCH_CONCURRENCY", "16"))
+
+def configure_ingest_rates(specs=None):
+    """Install token buckets for the crawl; explicit specs override INGEST_RATE_LIMITS and the defaults"""
+    rates = dict(DEFAULT_INGEST_RATES)
+    rates.update(rateLimit.parse_rate_specs(os.getenv("INGEST_RATE_LIMITS", "").split(",") if os.getenv("INGEST_RATE_LIMITS") else []))
+    rates.update(rateLimit.parse_rate_specs(specs))
+    for service, (rate, burst) in rates.items():
+        if rateLimit.get_limiter(service) is None or specs:
+            rateLimit.configure(service, rate, burst)
+    return rates
+
 def connect_clob_client():
     load_dotenv()
 
@@ -36,51 +54,307 @@ def get_db_config():
         "database": os.getenv('POSTGRES_DB')
     }
 
+def parse_listed_at(value):
+    """Gamma startDate/creationDate -> timezone-naive UTC datetime (None if missing or unparseable)"""
+    if not value:
+        return None
+    try:
+        listed_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if listed_at.tzinfo is not None:
+        listed_at = listed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return listed_at
+
+# --- Price fetching ---
+# py_clob_client is synchronous: /prices requests run in worker threads so the event loop keeps
+# serving other batches' HTTP and DB work. Params are chunked to keep each request a safe size.
+PRICE_CHUNK_SIZE = int(os.getenv("PRICE_CHUNK_SIZE", "100"))     # BookParams per /prices request
+PRICE_CONCURRENCY = int(os.getenv("PRICE_CONCURRENCY", "4"))     # /prices requests in flight across all batches
+_price_slots = {}
+
+def _price_semaphore():
+    # One semaphore per event loop, shared by every concurrent batch in it
+    loop = asyncio.get_running_loop()
+    if loop not in _price_slots:
+        _price_slots.clear()
+        _price_slots[loop] = asyncio.Semaphore(PRICE_CONCURRENCY)
+    return _price_slots[loop]
+
+async def fetch_prices_async(clob_client, price_params, chunk_size=None):
+    """-> ({token_id: {"BUY": price, "SELL": price}}, token ids whose chunk failed)
+
+    Params are chunked by token, so both sides of a token always share a request: a failed
+    chunk loses whole tokens (kept at their stored quotes) rather than one side of them.
+    """
+    chunk_size = chunk_size or PRICE_CHUNK_SIZE
+    by_token = {}
+    for param in price_params:
+        by_token.setdefault(param.token_id, []).append(param)
+    token_params = list(by_token.values())
+    tokens_per_chunk = max(1, chunk_size // 2)  # BUY + SELL
+    chunks = [
+        [param for params in token_params[i:i + tokens_per_chunk] for param in params]
+        for i in range(0, len(token_params), tokens_per_chunk)
+    ]
+    slots = _price_semaphore()
+
+    async def fetch_chunk(chunk):
+        async with slots:
+            await rateLimit.acquire_async("clob")
+            return await asyncio.to_thread(clob_client.get_prices, params=chunk)
+
+    results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    prices = {}
+    failed = set()
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            print(f"WARNING: Price request for {len(chunk)} params failed: {result}")
+            failed.update(param.token_id for param in chunk)
+            continue
+        for token_id, sides in (result or {}).items():
+            prices.setdefault(token_id, {}).update(sides)
+    return prices, failed
+
+# --- Bulk loading ---
+# Rows are streamed with COPY into per-session TEMP staging tables (not WAL-logged, private to the
+# connection, emptied on commit), then merged with a single INSERT ... SELECT ... ON CONFLICT.
+def _decimal(value):
+    return Decimal(str(value)) if value is not None and value != "" else None
+
+async def bulk_upsert_markets(conn, rows):
+    """rows: (id, title, expiry_date, listed_at, content_hash) -> ids inserted or changed"""
+    async with conn.transaction():
+        await conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS markets_staging (
+                id TEXT, title TEXT, expiry_date TIMESTAMP, listed_at TIMESTAMP, content_hash TEXT
+            ) ON COMMIT DELETE ROWS;
+        """)
+        await conn.copy_records_to_table(
+            "markets_staging", records=rows,
+            columns=["id", "title", "expiry_date", "listed_at", "content_hash"]
+        )
+        written = await conn.fetch("""
+            INSERT INTO markets (id, title, expiry_date, listed_at, content_hash, updated_at)
+            SELECT DISTINCT ON (id) id, title, expiry_date, listed_at, content_hash, now() AT TIME ZONE 'utc'
+            FROM markets_staging
+            ORDER BY id
+            ON CONFLICT (id) DO UPDATE SET
+                title = EXCLUDED.title,
+                expiry_date = EXCLUDED.expiry_date,
+                listed_at = COALESCE(markets.listed_at, EXCLUDED.listed_at),
+                content_hash = EXCLUDED.content_hash,
+                pruned_at = NULL,
+                updated_at = EXCLUDED.updated_at
+            WHERE markets.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+               OR markets.pruned_at IS NOT NULL  -- pruned as closed but listed again: restore it
+            RETURNING id;
+        """)
+    return [record['id'] for record in written]
+
+async def bulk_upsert_tokens(conn, rows):
+    """rows: (id, market_id, name, bid_price, ask_price) -> ids inserted or repriced"""
+    records = [(token_id, market_id, name, _decimal(bid), _decimal(ask)) for token_id, market_id, name, bid, ask in rows]
+    async with conn.transaction():
+        await conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS tokens_staging (
+                id TEXT, market_id TEXT, name TEXT, bid_price DECIMAL, ask_price DECIMAL
+            ) ON COMMIT DELETE ROWS;
+        """)
+        await conn.copy_records_to_table(
+            "tokens_staging", records=records,
+            columns=["id", "market_id", "name", "bid_price", "ask_price"]
+        )
+        written = await conn.fetch("""
+            INSERT INTO tokens (id, market_id, name, bid_price, ask_price)
+            SELECT DISTINCT ON (id) id, market_id, name, bid_price, ask_price
+            FROM tokens_staging
+            ORDER BY id
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name,
+                bid_price = EXCLUDED.bid_price,
+                ask_price = EXCLUDED.ask_price
+            WHERE (tokens.name, tokens.bid_price, tokens.ask_price)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.bid_price, EXCLUDED.ask_price)
+            RETURNING id;
+        """)
+    return [record['id'] for record in written]
+
+# --- Incremental sync ---
+SYNC_NAME = "gamma_events"
+
+def event_content_hash(event) -> str:
+    """Hash of the event fields ingestion stores (ignores volume/liquidity churn)"""
+    fields = {
+        "id": event.get("id"),
+        "title": event.get("title"),
+        "end_date": event.get("endDate") or event.get("end_date"),
+        "start_date": event.get("startDate") or event.get("creationDate"),
+        "active": event.get("active", True),
+        "closed": event.get("closed", False),
+        "markets": sorted(
+            (str(market.get("conditionId")), str(market.get("clobTokenIds")), str(market.get("outcomes")))
+            for market in event.get("markets") or []
+        ),
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+async def load_unchanged_events(conn, events):
+    """{event_id: [token, ...]} for events whose stored content hash still matches (tokens read from Postgres)"""
+    hashes = {str(event.get('id')): event_content_hash(event) for event in events}
+    rows = await conn.fetch(
+        "SELECT id, content_hash FROM markets WHERE id = ANY($1::text[]) AND pruned_at IS NULL", list(hashes)
+    )
+    unchanged = [row['id'] for row in rows if row['content_hash'] and row['content_hash'] == hashes.get(row['id'])]
+    if not unchanged:
+        return {}
+    tokens = {market_id: [] for market_id in unchanged}
+    for row in await conn.fetch("SELECT id, market_id, name FROM tokens WHERE market_id = ANY($1::text[])", unchanged):
+        tokens[row['market_id']].append({"token_id": row['id'], "outcome": row['name']})
+    # A market stored without tokens is looked up again, whatever its hash says
+    return {market_id: stored for market_id, stored in tokens.items() if stored}
+
+async def load_sync_watermark(conn):
+    row = await conn.fetchrow("SELECT last_synced_at FROM sync_state WHERE name = $1", SYNC_NAME)
+    return row['last_synced_at'] if row else None
+
+async def save_sync_watermark(conn, synced_at, stats):
+    await conn.execute("""
+        INSERT INTO sync_state (name, last_synced_at, events_seen, markets_changed, tokens_updated)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (name) DO UPDATE SET
+            last_synced_at = EXCLUDED.last_synced_at,
+            events_seen = EXCLUDED.events_seen,
+            markets_changed = EXCLUDED.markets_changed,
+            tokens_updated = EXCLUDED.tokens_updated;
+    """, SYNC_NAME, synced_at, stats["processed"], stats["markets_changed"], stats["tokens_updated"])
+
 async def get_asyncpg_connection():
     """Create and return an asyncpg connection using environment variables."""
     config = get_db_config()
     return await asyncpg.connect(**config)
 
-async def fetch_active_events_optimized(limit=None, batch_size=50, conn=None, clob_client=None):
-    """Fetch active events using Gamma API with server-side filtering for better performance."""
+# --- Connection pool ---
+# asyncpg connections run one operation at a time, so concurrent batches and websocket handlers
+# each acquire their own connection from a shared pool (PG_POOL_SIZE connections at most).
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "10"))
+_pools = {}
+
+async def create_asyncpg_pool(min_size=1, max_size=None):
+    """Create an asyncpg pool using the same settings as get_asyncpg_connection."""
+    return await asyncpg.create_pool(**get_db_config(), min_size=min_size, max_size=max_size or PG_POOL_SIZE)
+
+async def get_asyncpg_pool():
+    """Process-wide pool for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    pending = _pools.get(loop)
+    if pending is None:
+        pending = _pools[loop] = loop.create_task(create_asyncpg_pool())
+    try:
+        return await pending
+    except Exception:
+        _pools.pop(loop, None)  # let the next caller retry
+        raise
+
+async def close_asyncpg_pool():
+    pending = _pools.pop(asyncio.get_running_loop(), None)
+    if pending is not None and pending.done() and not pending.exception():
+        await pending.result().close()
+
+async def build_market_record(event, fetcher, stored_tokens=None):
+    """Gamma event -> market-like record with its tokens (None on error).
+
+    stored_tokens (from an incremental sync) skips the per-event CLOB markets lookup.
+    """
+    try:
+        # Convert event to market-like structure
+        market_data = {
+            'condition_id': event.get('id'),
+            'question': event.get('title', ''),
+            # Gamma returns camelCase endDate; end_date is kept for older payloads
+            'end_date_iso': event.get('endDate') or event.get('end_date'),
+            'start_date_iso': event.get('startDate') or event.get('creationDate'),
+            'active': event.get('active', True),
+            'closed': event.get('closed', False),
+            'content_hash': None,  # only set once tokens are known, so a failed lookup is retried next sync
+            'tokens': []
+        }
+        
+        if stored_tokens:
+            market_data['tokens'] = stored_tokens
+            market_data['content_hash'] = event_content_hash(event)
+            return market_data
+        
+        # Get markets for this event to populate tokens
+        markets_url = f"{host}/markets?event_id={event.get('id')}"
+        markets_resp = await fetcher.get(markets_url, "clob")
+        
+        if markets_resp.status_code == 200:
+            markets_data = markets_resp.json()
+            if markets_data.get('data'):
+                first_market = markets_data['data'][0]
+                market_data['tokens'] = first_market.get('tokens', [])
+        if market_data['tokens']:
+            market_data['content_hash'] = event_content_hash(event)
+            
+        return market_data
+    except Exception as e:
+        print(f"ERROR: Error processing event {event.get('id')}: {e}")
+        return None
+
+async def fetch_active_events_optimized(limit=None, batch_size=50, pool=None, clob_client=None, incremental=False):
+    """Fetch active events using Gamma API with server-side filtering for better performance.
+
+    With incremental=True, events whose content hash matches the stored one skip the
+    per-event CLOB lookup and reuse their stored tokens; only their prices are refreshed.
+    """
     print("Starting fetch_active_events_optimized...")
     stored = 0
     skipped = 0
     processed = 0
-    close_conn = False
+    sync_stats = {"markets_changed": 0, "tokens_updated": 0, "events_unchanged": 0, "batch_errors": 0}
+    sync_failed = False
+    active_ids = set()  # every active event seen, so callers can detect markets that closed
     
     # Use asyncpg for better async database performance
-    print("Setting up database connection...")
-    if conn is None:
-        conn = await get_asyncpg_connection()
-        close_conn = True
-        print("Database connection established")
+    print("Setting up database connection pool...")
+    if pool is None:
+        pool = await get_asyncpg_pool()
+        print(f"Database pool ready (up to {pool.get_max_size()} connections)")
     if clob_client is None:
         clob_client = connect_clob_client()
         print("CLOB client connected")
     
     # Create tables if they don't exist
     print("Creating database tables if they don't exist...")
-    await create_tables_async(conn)
+    async with pool.acquire() as conn:
+        await create_tables_async(conn)
     print("Database tables ready")
     
     # Use Gamma API for better filtering - get active events that end in the future
     now = datetime.now(timezone.utc)
     print(f"Current time: {now.isoformat()}")
+    if incremental:
+        async with pool.acquire() as conn:
+            watermark = await load_sync_watermark(conn)
+        print(f"Incremental sync - last successful sync: {watermark.isoformat() if watermark else 'never'}")
     
     limit_param = min(limit, batch_size) if limit else batch_size
+    configure_ingest_rates()
+    
+    def page_url(offset):
+        return f"{gamma_host}/events?active=true&closed=false&limit={limit_param}&offset={offset}"
     
     async with httpx.AsyncClient(timeout=30.0, verify=False) as client:
+        # All crawl requests share one concurrency cap and the per-API token buckets
+        fetcher = RateLimitedFetcher(client, concurrency=FETCH_CONCURRENCY)
         offset = 0
+        print(f"Making API request to: {page_url(offset)}")
+        next_page = asyncio.create_task(fetcher.get_json(page_url(offset), "gamma"))
         while True:
             try:
-                url = f"{gamma_host}/events?active=true&closed=false&limit={limit_param}&offset={offset}"
-                print(f"Making API request to: {url}")
-                resp = await client.get(url)
-                print(f"API response status: {resp.status_code}")
-                resp.raise_for_status()
-                
-                payload = resp.json()
+                payload = await next_page
+                next_page = None
                 # API returns list directly, not wrapped in 'data'
                 events = payload if isinstance(payload, list) else payload.get("data", [])
                 
@@ -89,6 +363,12 @@ async def fetch_active_events_optimized(limit=None, batch_size=50, conn=None, cl
                     break
                 
                 print(f"Received {len(events)} active events (offset: {offset})")
+                
+                # Pipelining: request the next page now so it downloads while this one is processed
+                has_more = len(events) >= limit_param and not (limit and processed + len(events) >= limit)
+                if has_more:
+                    print(f"Prefetching next page: {page_url(offset + len(events))}")
+                    next_page = asyncio.create_task(fetcher.get_json(page_url(offset + len(events)), "gamma"))
                 print(f"Processing events...")
                 
                 # Filter and prepare events for concurrent processing
@@ -100,39 +380,20 @@ async def fetch_active_events_optimized(limit=None, batch_size=50, conn=None, cl
                         skipped += 1
                         continue
                     active_events.append(event)
+                    active_ids.add(str(event.get('id')))
                 
                 print(f"Processing {len(active_events)} active events concurrently...")
                 
-                # Process events concurrently
-                async def process_single_event(event):
-                    try:
-                        # Convert event to market-like structure
-                        market_data = {
-                            'condition_id': event.get('id'),
-                            'question': event.get('title', ''),
-                            'end_date_iso': event.get('end_date'),
-                            'active': event.get('active', True),
-                            'closed': event.get('closed', False),
-                            'tokens': []
-                        }
-                        
-                        # Get markets for this event to populate tokens
-                        markets_url = f"{host}/markets?event_id={event.get('id')}"
-                        markets_resp = await client.get(markets_url)
-                        
-                        if markets_resp.status_code == 200:
-                            markets_data = markets_resp.json()
-                            if markets_data.get('data'):
-                                first_market = markets_data['data'][0]
-                                market_data['tokens'] = first_market.get('tokens', [])
-                            
-                        return market_data
-                    except Exception as e:
-                        print(f"ERROR: Error processing event {event.get('id')}: {e}")
-                        return None
+                # Unchanged events (same content hash as stored) keep their stored tokens
+                unchanged_tokens = {}
+                if incremental and active_events:
+                    async with pool.acquire() as conn:
+                        unchanged_tokens = await load_unchanged_events(conn, active_events)
+                sync_stats["events_unchanged"] += len(unchanged_tokens)
                 
                 # Run all event processing concurrently
-                event_tasks = [process_single_event(event) for event in active_events]
+                event_tasks = [build_market_record(event, fetcher, unchanged_tokens.get(str(event.get('id'))))
+                               for event in active_events]
                 event_results = await asyncio.gather(*event_tasks, return_exceptions=True)
                 
                 # Filter out None results and exceptions
@@ -148,12 +409,14 @@ async def fetch_active_events_optimized(limit=None, batch_size=50, conn=None, cl
                     # Process in parallel batches for better performance
                     concurrent_batches = [valid_events[i:i+batch_size] for i in range(0, len(valid_events), batch_size)]
                     print(f"Split into {len(concurrent_batches)} batches for processing")
-                    batch_tasks = [process_market_batch(batch, conn, clob_client) for batch in concurrent_batches]
+                    # Each batch acquires its own pooled connection, so their DB writes run in parallel
+                    batch_tasks = [process_market_batch(batch, pool, clob_client, sync_stats) for batch in concurrent_batches]
                     batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
                     
                     for i, result in enumerate(batch_results):
                         if isinstance(result, Exception):
                             print(f"ERROR: Batch {i+1} processing error: {result}")
+                            sync_failed = True
                         else:
                             print(f"Batch {i+1} completed: {result} events processed")
                             stored += result
@@ -163,33 +426,44 @@ async def fetch_active_events_optimized(limit=None, batch_size=50, conn=None, cl
                 if limit and processed >= limit:
                     break
                 
-                # Pagination - move to next batch
+                # Pagination - move to the (already requested) next batch
                 offset += len(events)
-                if len(events) < batch_size:
+                if next_page is None:
                     break  # No more results
                     
             except Exception as e:
                 print(f"ERROR: Error fetching events: {e}")
                 print(f"Exception details: {type(e).__name__}: {str(e)}")
+                sync_failed = True
                 break
+        
+        if next_page is not None:
+            next_page.cancel()  # stopped early (limit or error) with a page still in flight
+        crawl = fetcher.report()
+        print(f"Crawl: {crawl['requests']} requests, {crawl['retries']} retries, {crawl['throttled']} throttled, "
+              f"{crawl['failed']} failed | avg {crawl['avg_seconds']:.2f}s per request")
     
-    if close_conn:
-        print("Closing database connection...")
-        await conn.close()
-        print("Database connection closed")
+    # Watermark only moves forward after a complete, error-free pass
+    complete = not sync_failed and not sync_stats["batch_errors"] and not limit
+    if complete:
+        async with pool.acquire() as conn:
+            await save_sync_watermark(conn, now.replace(tzinfo=None), dict(sync_stats, processed=processed))
     
     print("\nFinal Summary:")
     print(f"Processed: {processed}")
     print(f"Stored: {stored}")
     print(f"Skipped: {skipped}")
-    return {"processed": processed, "stored": stored, "skipped": skipped}
+    print(f"Unchanged events: {sync_stats['events_unchanged']} | Markets written: {sync_stats['markets_changed']} | "
+          f"Token prices updated: {sync_stats['tokens_updated']}")
+    return {"processed": processed, "stored": stored, "skipped": skipped, **sync_stats,
+            "complete": complete, "active_ids": active_ids}
 
-async def fetch_active_markets(limit=None, batch_size=50, conn=None, clob_client=None):
+async def fetch_active_markets(limit=None, batch_size=50, pool=None, clob_client=None, incremental=False):
     """Wrapper to maintain backward compatibility - uses optimized event fetching."""
-    return await fetch_active_events_optimized(limit, batch_size, conn, clob_client)
+    return await fetch_active_events_optimized(limit, batch_size, pool, clob_client, incremental)
 
-async def process_market_batch(markets, conn, clob_client):
-    """Process a batch of markets concurrently"""
+def filter_markets(markets):
+    """-> [(market, expiry_date)] for active, unexpired markets with a condition id"""
     now = datetime.now(timezone.utc)
     valid_markets = []
     
@@ -250,137 +524,138 @@ async def process_market_batch(markets, conn, clob_client):
         print(f"   - Expired: {expired_count}, Invalid dates: {invalid_date_count}")
         print(f"   - Inactive/closed: {inactive_count}, Missing condition_id: {missing_condition_count}")
     
+    return valid_markets
+
+async def price_markets(valid_markets, clob_client):
+    """-> (market rows, token rows with current bid/ask, {market_id: content_hash})"""
+    # Prepare batch data
+    market_data = []
+    token_data = []
+    price_params = []
+    token_id_to_info = {}
+    market_hashes = {}
+    for market, expiry_date in valid_markets:
+        condition_id = market.get("condition_id")
+        market_hashes[condition_id] = market.get("content_hash")
+        title = market.get("question", "")
+        tokens = market.get("tokens", [])
+        listed_at = parse_listed_at(market.get("start_date_iso"))
+        market_data.append((condition_id, title, expiry_date, listed_at))
+        for token in tokens:
+            token_id = token.get("token_id")
+            token_name = token.get("outcome")
+            if token_id:
+                price_params.append(BookParams(token_id=token_id, side="BUY"))
+                price_params.append(BookParams(token_id=token_id, side="SELL"))
+                token_id_to_info[token_id] = (condition_id, token_name)
+    # Fetch prices for all tokens in the batch (chunked, off the event loop)
+    if price_params:
+        resp, failed_tokens = await fetch_prices_async(clob_client, price_params)
+        # resp: {token_id: {"BUY": price, "SELL": price}}
+        for token_id, (condition_id, token_name) in token_id_to_info.items():
+            if token_id in failed_tokens and token_id not in resp:
+                continue  # keep the stored quote rather than overwrite it with nothing
+            prices = resp.get(token_id, {})
+            bid_price = prices.get("BUY")
+            ask_price = prices.get("SELL")
+            token_data.append((token_id, condition_id, token_name, bid_price, ask_price))
+    return market_data, token_data, market_hashes
+
+async def push_markets_to_chromadb(markets, client=None, failed=None):
+    """POST (market_id, name) pairs to the webhook's /poly endpoint -> number newly stored
+
+    Ids whose push failed are appended to `failed` when a list is given.
+    """
+    poly_url = os.getenv("WEBHOOK_URL", "http://twitter-webhook:8000") + "/poly"
+    successful_pushes = 0
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(timeout=30.0, verify=False)
+    try:
+        for market_id, market_name in markets:
+            try:
+                payload = {"id": str(market_id), "name": str(market_name)}
+                resp = await client.post(poly_url, json=payload)
+                if resp.status_code == 200:
+                    result = resp.json()
+                    if result.get("status") == "already_exists":
+                        continue  # Skip already existing
+                    else:
+                        successful_pushes += 1
+                else:
+                    print(f"ERROR: ChromaDB push failed for {market_id}: HTTP {resp.status_code}")
+                    if failed is not None:
+                        failed.append(market_id)
+            except Exception as e:
+                print(f"ERROR: ChromaDB exception for {market_id}: {e}")
+                if failed is not None:
+                    failed.append(market_id)
+                continue
+    finally:
+        if own_client:
+            await client.aclose()
+    return successful_pushes
+
+async def process_market_batch(markets, pool, clob_client, sync_stats=None):
+    """Process a batch of markets concurrently"""
+    valid_markets = filter_markets(markets)
     if not valid_markets:
         return 0
     
     try:
-        # Prepare batch data
-        market_data = []
-        token_data = []
-        price_params = []
-        token_id_to_info = {}
-        for market, expiry_date in valid_markets:
-            condition_id = market.get("condition_id")
-            title = market.get("question", "")
-            tokens = market.get("tokens", [])
-            market_data.append((condition_id, title, expiry_date))
-            for token in tokens:
-                token_id = token.get("token_id")
-                token_name = token.get("outcome")
-                if token_id:
-                    price_params.append(BookParams(token_id=token_id, side="BUY"))
-                    price_params.append(BookParams(token_id=token_id, side="SELL"))
-                    token_id_to_info[token_id] = (condition_id, token_name)
-        # Fetch prices for all tokens in the batch
-        if price_params:
-            resp = clob_client.get_prices(params=price_params)
-            # resp: {token_id: {"BUY": price, "SELL": price}}
-            for token_id, (condition_id, token_name) in token_id_to_info.items():
-                prices = resp.get(token_id, {})
-                bid_price = prices.get("BUY")
-                ask_price = prices.get("SELL")
-                token_data.append((token_id, condition_id, token_name, bid_price, ask_price))
-        # Optimize database operations with concurrent processing
+        market_data, token_data, market_hashes = await price_markets(valid_markets, clob_client)
+        # Bulk load: COPY rows into session staging tables, then one set-based upsert per table.
+        # Unchanged rows are filtered by the upsert itself, which returns the ids it wrote.
+        changed_market_ids = []
         if market_data:
-            # Concurrent database operations for better performance
-            db_tasks = []
-            
-            # Task 1: Check existing markets in PostgreSQL
-            async def check_existing_markets():
-                if not market_data:
-                    return set()
-                market_ids = [market_id for market_id, _, _ in market_data]
-                placeholders = ','.join(['$' + str(i+1) for i in range(len(market_ids))])
-                check_query = f"SELECT id FROM markets WHERE id IN ({placeholders})"
-                existing_records = await conn.fetch(check_query, *market_ids)
-                return {record['id'] for record in existing_records}
-            
-            # Task 2: Push to ChromaDB sequentially (simpler, more reliable)
-            async def push_to_chromadb():
-                poly_url = os.getenv("WEBHOOK_URL", "http://twitter-webhook:8000") + "/poly"
-                successful_pushes = 0
-                
-                async with httpx.AsyncClient(timeout=30.0, verify=False) as client:
-                    for market_id, market_name, _ in market_data:
-                        try:
-                            payload = {"id": str(market_id), "name": str(market_name)}
-                            resp = await client.post(poly_url, json=payload)
-                            if resp.status_code == 200:
-                                result = await resp.json()
-                                if result.get("status") == "already_exists":
-                                    continue  # Skip already existing
-                                else:
-                                    successful_pushes += 1
-                            else:
-                                print(f"ERROR: ChromaDB push failed for {market_id}: HTTP {resp.status_code}")
-                        except Exception as e:
-                            print(f"ERROR: ChromaDB exception for {market_id}: {e}")
-                            continue
-                
-                print(f"ChromaDB: {successful_pushes}/{len(market_data)} new events stored")
-            
-            # Execute database check and ChromaDB push concurrently
-            existing_market_ids, _ = await asyncio.gather(
-                check_existing_markets(),
-                push_to_chromadb(),
-                return_exceptions=True
-            )
-            
-            # Handle potential errors from gather
-            if isinstance(existing_market_ids, Exception):
-                print(f"ERROR: Error checking existing markets: {existing_market_ids}")
-                existing_market_ids = set()
-            
-            # Filter out existing markets and insert new ones
-            new_market_data = [(market_id, title, expiry_date) 
-                              for market_id, title, expiry_date in market_data 
-                              if market_id not in existing_market_ids]
-            
-            # Batch insert new markets to PostgreSQL
-            if new_market_data:
-                await conn.executemany("""
-                    INSERT INTO markets (id, title, expiry_date)
-                    VALUES ($1, $2, $3)
-                    ON CONFLICT (id) DO UPDATE SET 
-                        title = EXCLUDED.title,
-                        expiry_date = EXCLUDED.expiry_date;
-                """, new_market_data)
-                print(f"[PostgreSQL] Inserted {len(new_market_data)} new markets")
+            async with pool.acquire() as conn:
+                changed_market_ids = await bulk_upsert_markets(conn, [
+                    (market_id, title, expiry_date, listed_at, market_hashes.get(market_id))
+                    for market_id, title, expiry_date, listed_at in market_data
+                ])
+            if changed_market_ids:
+                print(f"[PostgreSQL] Upserted {len(changed_market_ids)} new/changed markets")
             else:
-                print(f"[PostgreSQL] All {len(market_data)} markets already exist")
-        # Check for duplicates in tokens table before inserting
-        if token_data:
-            # Check existing tokens in PostgreSQL
-            existing_token_ids = set()
-            if token_data:
-                token_ids = [token_id for token_id, _, _, _, _ in token_data]
-                placeholders = ','.join(['$' + str(i+1) for i in range(len(token_ids))])
-                check_query = f"SELECT id FROM tokens WHERE id IN ({placeholders})"
-                existing_records = await conn.fetch(check_query, *token_ids)
-                existing_token_ids = {record['id'] for record in existing_records}
-            
-            # Filter out existing tokens
-            new_token_data = [(token_id, market_id, name, bid_price, ask_price) 
-                             for token_id, market_id, name, bid_price, ask_price in token_data 
-                             if token_id not in existing_token_ids]
-            
-            # Batch insert new tokens with prices
-            if new_token_data:
-                await conn.executemany("""
-                    INSERT INTO tokens (id, market_id, name, bid_price, ask_price)
-                    VALUES ($1, $2, $3, $4, $5)
-                    ON CONFLICT (id) DO UPDATE SET
-                        bid_price = EXCLUDED.bid_price,
-                        ask_price = EXCLUDED.ask_price;
-                """, new_token_data)
-                print(f"[PostgreSQL] Inserted {len(new_token_data)} new tokens")
+                print(f"[PostgreSQL] All {len(market_data)} markets unchanged")
+            if sync_stats is not None:
+                sync_stats["markets_changed"] += len(changed_market_ids)
+        
+        # Tokens that are new or whose bid/ask moved (existing rows are refreshed, not skipped)
+        async def upsert_tokens():
+            if not token_data:
+                return
+            async with pool.acquire() as conn:
+                changed_token_ids = await bulk_upsert_tokens(conn, token_data)
+            if changed_token_ids:
+                print(f"[PostgreSQL] Upserted {len(changed_token_ids)} new/repriced tokens")
             else:
-                print(f"[PostgreSQL] All {len(token_data)} tokens already exist")
+                print(f"[PostgreSQL] All {len(token_data)} token prices unchanged")
+            if sync_stats is not None:
+                sync_stats["tokens_updated"] += len(changed_token_ids)
+        
+        # Push new/changed markets to ChromaDB sequentially (simpler, more reliable)
+        async def push_to_chromadb():
+            if not changed_market_ids:
+                return
+            changed = set(changed_market_ids)
+            successful_pushes = await push_markets_to_chromadb(
+                [(market_id, market_name) for market_id, market_name, _, _ in market_data if market_id in changed]
+            )
+            print(f"ChromaDB: {successful_pushes}/{len(changed_market_ids)} new events stored")
+        
+        # Token upsert (DB) and ChromaDB push (HTTP) overlap
+        token_result, push_result = await asyncio.gather(upsert_tokens(), push_to_chromadb(), return_exceptions=True)
+        if isinstance(push_result, Exception):
+            print(f"ERROR: Error pushing to ChromaDB: {push_result}")
+        if isinstance(token_result, Exception):
+            raise token_result
         
         print(f"Batch processed: {len(valid_markets)} markets | {len(token_data)} tokens")
         return len(valid_markets)
     except Exception as e:
         print(f"WARNING: Error storing batch: {e}")
+        if sync_stats is not None:
+            sync_stats["batch_errors"] += 1
         return 0
 
 def main():
@@ -389,8 +664,30 @@ def main():
     parser = argparse.ArgumentParser(description="Fetch and store active Polymarket markets.")
     parser.add_argument('--limit', type=int, default=None, help='Limit the number of markets to process')
     parser.add_argument('--batch-size', type=int, default=50, help='Batch size for DB inserts')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Skip events unchanged since the last sync; only refresh their token prices')
+    parser.add_argument('--rate', action='append', default=[], metavar='API=PER_SEC[:BURST]',
+                        help='Crawl rate limit for gamma or clob; repeatable')
+    parser.add_argument('--pool-size', type=int, default=None, help=f'Max pooled DB connections (default PG_POOL_SIZE={PG_POOL_SIZE})')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Run fetch/enrich/price/sql/vector as independent stages connected by bounded queues')
+    parser.add_argument('--stage-concurrency', action='append', default=[], metavar='STAGE=WORKERS',
+                        help='Workers for a streaming stage (enrich, price, sql, vector); repeatable')
     args = parser.parse_args()
-    asyncio.run(fetch_active_markets(limit=args.limit, batch_size=args.batch_size))
+    configure_ingest_rates(args.rate)
+
+    async def run():
+        pool = await create_asyncpg_pool(max_size=args.pool_size)
+        try:
+            if args.streaming:
+                from ingestPipeline import stream_active_events, parse_stage_concurrency
+                await stream_active_events(limit=args.limit, batch_size=args.batch_size, pool=pool, incremental=args.incremental,
+                                           concurrency=parse_stage_concurrency(args.stage_concurrency))
+            else:
+                await fetch_active_markets(limit=args.limit, batch_size=args.batch_size, pool=pool, incremental=args.incremental)
+        finally:
+            await pool.close()
+    asyncio.run(run())
 
 if __name__ == "__main__":
     main()
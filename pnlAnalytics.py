@@ -0,0 +1,169 @@
+# pnlAnalytics.py
+
+import glob
+import os
+import time
+import numpy as np
+import pandas as pd
+from priceStore import PriceHistoryStore, DEFAULT_STORE_DIR
+
+HORIZONS = {"5m": 300, "1h": 3600, "6h": 6 * 3600, "24h": 86400, "7d": 7 * 86400}
+PRICE_TOLERANCE = 3600  # a price older than this before the target time counts as missing
+
+
+def parse_horizons(spec: str) -> dict:
+    """'5m,1h,24h' -> {'5m': 300, '1h': 3600, '24h': 86400}"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    horizons = {}
+    for label in (part.strip() for part in spec.split(",")):
+        if label:
+            horizons[label] = int(float(label[:-1]) * units[label[-1]])
+    return horizons
+
+
+def load_decisions(path: str) -> pd.DataFrame:
+    """BUY decisions with a token id from trades.csv or a Parquet decision-log directory"""
+    if os.path.isdir(path):
+        parts = sorted(glob.glob(os.path.join(path, "*.parquet")))
+        decisions = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True) if parts else pd.DataFrame()
+    else:
+        decisions = pd.read_csv(path, dtype=str, keep_default_na=False)
+    if decisions.empty or "token_id" not in decisions:
+        return pd.DataFrame(columns=["date", "token_id", "account", "market_name", "token_name", "ts"])
+    trades = decisions[(decisions["action"] == "BUY") & decisions["token_id"].fillna("").ne("")].copy()
+    if "account" not in trades:
+        trades["account"] = ""
+    trades["account"] = trades["account"].fillna("").replace("", "unknown")
+    stamps = pd.to_datetime(trades["date"], utc=True, format="ISO8601", errors="coerce")
+    trades = trades[stamps.notna()]
+    trades["ts"] = stamps[stamps.notna()].astype("int64") // 10**9
+    return trades.sort_values("ts", kind="stable").reset_index(drop=True)
+
+
+def load_prices(trades: pd.DataFrame, horizons: dict, store: PriceHistoryStore, fetch_missing: bool = True) -> pd.DataFrame:
+    """(token_id, ts, price) rows covering every trade window, read from the local price store.
+
+    With fetch_missing the store backfills uncovered windows once, one request per
+    chunk_seconds slice; later evaluations of the same run are served entirely from disk.
+    """
+    longest = max(horizons.values())
+    frames = []
+    windows = trades.groupby("token_id")["ts"].agg(["min", "max"])
+    for token_id, (start_ts, end_ts) in windows.iterrows():
+        series = store.series(token_id, int(start_ts) - PRICE_TOLERANCE, int(end_ts) + longest, fetch_missing=fetch_missing)
+        if series:
+            frame = pd.DataFrame(series, columns=["ts", "price"])
+            frame["token_id"] = token_id
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame({"token_id": pd.Series(dtype=str), "ts": pd.Series(dtype="int64"), "price": pd.Series(dtype=float)})
+    return pd.concat(frames, ignore_index=True)
+
+
+def compute_returns(trades: pd.DataFrame, prices: pd.DataFrame, horizons: dict,
+                    tolerance: int = PRICE_TOLERANCE) -> pd.DataFrame:
+    """Add entry_price and ret_<horizon> columns for all trades in one vectorized pass per horizon.
+
+    Prices are as-of lookups (last point at or before the target time, at most `tolerance`
+    seconds old), so entries never peek past the trade time. Every (token, ts) is packed
+    into one sorted int64 key so a single np.searchsorted resolves all trades at once.
+    """
+    result = trades.copy()
+    codes = {token_id: code for code, token_id in enumerate(pd.unique(prices["token_id"]))}
+    price_codes = prices["token_id"].map(codes).to_numpy(dtype=np.int64)
+    price_ts = prices["ts"].to_numpy(dtype=np.int64)
+    order = np.lexsort((price_ts, price_codes))
+    price_codes, price_ts = price_codes[order], price_ts[order]
+    price_values = prices["price"].to_numpy(dtype=np.float64)[order]
+    span = np.int64(1) << 40  # larger than any epoch-second timestamp
+    keys = price_codes * span + price_ts
+
+    trade_codes = result["token_id"].map(codes).fillna(-1).to_numpy(dtype=np.int64)
+    trade_ts = result["ts"].to_numpy(dtype=np.int64)
+
+    def as_of(targets):
+        if not len(keys):
+            return np.full(len(targets), np.nan)
+        positions = np.searchsorted(keys, trade_codes * span + targets, side="right") - 1
+        safe = np.clip(positions, 0, None)
+        found = (positions >= 0) & (price_codes[safe] == trade_codes) & (targets - price_ts[safe] <= tolerance)
+        return np.where(found, price_values[safe], np.nan)
+
+    entry = as_of(trade_ts)
+    result["entry_price"] = entry
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for label, seconds in horizons.items():
+            exit_price = as_of(trade_ts + seconds)
+            result[f"ret_{label}"] = np.where(entry > 0, exit_price / entry - 1.0, np.nan)
+    return result
+
+
+def max_drawdown(returns: np.ndarray) -> float:
+    """Largest peak-to-trough drop of the equal-stake cumulative return curve"""
+    if len(returns) == 0:
+        return 0.0
+    equity = np.cumsum(returns)
+    peaks = np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:]
+    return float(np.max(peaks - equity))
+
+
+def summarize(returns: pd.DataFrame, horizons: dict, by: str = None) -> pd.DataFrame:
+    """Trades, mean/median return, hit rate, total and max drawdown per horizon (optionally per `by` group)"""
+    groups = returns.groupby(by, sort=True) if by else [("all", returns)]
+    rows = []
+    for group, frame in groups:
+        for label in horizons:
+            values = frame[f"ret_{label}"].to_numpy(dtype=np.float64)
+            values = values[~np.isnan(values)]  # frame is already in trade-time order
+            rows.append({
+                (by or "scope"): group,
+                "horizon": label,
+                "trades": len(values),
+                "mean_return": float(values.mean()) if len(values) else np.nan,
+                "median_return": float(np.median(values)) if len(values) else np.nan,
+                "hit_rate": float((values > 0).mean()) if len(values) else np.nan,
+                "total_return": float(values.sum()),
+                "max_drawdown": max_drawdown(values),
+            })
+    return pd.DataFrame(rows)
+
+
+def evaluate(trades_path: str = "trades.csv", horizons: dict = None, store: PriceHistoryStore = None,
+             fetch_missing: bool = True):
+    """Returns per trade plus overall and per-account summaries for a backtest decision log"""
+    horizons = horizons or HORIZONS
+    store = store or PriceHistoryStore(os.getenv("PRICE_STORE_DIR", DEFAULT_STORE_DIR))
+    trades = load_decisions(trades_path)
+    prices = load_prices(trades, horizons, store, fetch_missing)
+    returns = compute_returns(trades, prices, horizons)
+    return returns, summarize(returns, horizons), summarize(returns, horizons, by="account")
+
+
+def main():
+    """CLI entrypoint: multi-horizon P&L for a backtest's decision log."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Vectorized multi-horizon P&L for backtest trades.")
+    parser.add_argument('--trades', default=os.getenv("TRADE_LOG_CSV", "trades.csv"),
+                        help='Decision log CSV or Parquet directory')
+    parser.add_argument('--horizons', default=",".join(HORIZONS), help='Comma-separated horizons, e.g. 5m,1h,24h,7d')
+    parser.add_argument('--no-fetch', action='store_true', help='Use only locally stored prices (no API calls)')
+    parser.add_argument('--out', default=None, help='Write per-trade returns to this CSV')
+    args = parser.parse_args()
+
+    horizons = parse_horizons(args.horizons)
+    started = time.perf_counter()
+    returns, overall, per_account = evaluate(args.trades, horizons, fetch_missing=not args.no_fetch)
+    elapsed = time.perf_counter() - started
+
+    pd.set_option("display.width", 160)
+    print(f"📈 {len(returns)} trades evaluated at {len(horizons)} horizons in {elapsed:.2f}s\n")
+    print(overall.drop(columns="scope").to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print("\n👤 Per account")
+    print(per_account.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    if args.out:
+        returns.to_csv(args.out, index=False)
+        print(f"\n💾 Per-trade returns written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# priceStore.py
+
+import os
+import sqlite3
+import threading
+import time
+import requests
+import rateLimit
+from cassette import cassette
+
+PRICES_HISTORY_URL = "https://clob.polymarket.com/prices-history"
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "price_history")
+
+
+def parse_price_history(payload):
+    """Normalize a /prices-history response to a sorted list of (timestamp, price)"""
+    points = payload.get("history", []) if isinstance(payload, dict) else (payload or [])
+    series = []
+    for point in points:
+        ts = point.get("t", point.get("timestamp"))
+        price = point.get("p", point.get("price"))
+        if ts is None or price is None:
+            continue
+        series.append((int(ts), float(price)))
+    series.sort()
+    return series
+
+
+class PriceHistoryStore:
+    """Local time-series cache for Polymarket price history - one SQLite file per token.
+
+    Each token file holds `prices(ts PRIMARY KEY, price)` plus a `coverage` table of
+    [start_ts, end_ts] windows already fetched. Missing ranges are widened to whole
+    chunks, fetched one chunk per request, and overlapping windows are merged, so point-in-time
+    queries are a single B-tree lookup (O(log n)) once a range has been seen.
+
+    The cassette wraps whole queries (price_at, series): a record run captures every
+    answer, local or fetched, and a replay is served without touching the store.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR, chunk_seconds: int = 86400, fidelity: int = 1, fetch=None):
+        self.root = root
+        self.chunk_seconds = chunk_seconds
+        self.fidelity = fidelity
+        self._fetch = fetch or self._fetch_remote
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self.remote_fetches = 0
+        os.makedirs(root, exist_ok=True)
+
+    # --- Storage ---
+    def _path(self, token_id: str) -> str:
+        return os.path.join(self.root, f"{token_id}.sqlite")
+
+    def _connect(self, token_id: str):
+        conn = sqlite3.connect(self._path(token_id))
+        conn.execute("CREATE TABLE IF NOT EXISTS prices (ts INTEGER PRIMARY KEY, price REAL NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS coverage (start_ts INTEGER NOT NULL, end_ts INTEGER NOT NULL)")
+        return conn
+
+    def _lock(self, token_id: str):
+        with self._locks_guard:
+            return self._locks.setdefault(token_id, threading.Lock())
+
+    # --- Remote ---
+    def _fetch_remote(self, token_id: str, start_ts: int, end_ts: int):
+        params = {
+            "market": token_id,
+            "startTs": start_ts,
+            "endTs": end_ts,
+            "fidelity": self.fidelity
+        }
+        rateLimit.acquire("polymarket")
+        response = requests.get(PRICES_HISTORY_URL, params=params, timeout=10)
+        response.raise_for_status()
+        return parse_price_history(response.json())
+
+    # --- Coverage ---
+    @staticmethod
+    def _missing(intervals, start_ts: int, end_ts: int):
+        gaps = []
+        cursor = start_ts
+        for covered_start, covered_end in intervals:
+            if covered_end < cursor:
+                continue
+            if covered_start > end_ts:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start - 1))
+            cursor = max(cursor, covered_end + 1)
+            if cursor > end_ts:
+                break
+        if cursor <= end_ts:
+            gaps.append((cursor, end_ts))
+        return gaps
+
+    @staticmethod
+    def _merge(intervals):
+        merged = []
+        for start_ts, end_ts in sorted(intervals):
+            if merged and start_ts <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end_ts))
+            else:
+                merged.append((start_ts, end_ts))
+        return merged
+
+    def ensure_range(self, token_id: str, start_ts: int, end_ts: int):
+        """Make sure [start_ts, end_ts] is stored locally, fetching only the missing chunks"""
+        if cassette.offline:
+            return  # replayed queries never read the store
+        with self._lock(token_id):
+            conn = self._connect(token_id)
+            try:
+                intervals = conn.execute("SELECT start_ts, end_ts FROM coverage ORDER BY start_ts").fetchall()
+                gaps = self._missing(intervals, start_ts, end_ts)
+                if not gaps:
+                    return
+                # Widen each gap to whole chunks so neighbouring queries are served locally,
+                # but never mark the future (or the last few minutes) as covered
+                horizon = int(time.time()) - 300
+                fetched = []
+                error = None
+                for gap_start, gap_end in gaps:
+                    fetch_start = gap_start - gap_start % self.chunk_seconds
+                    fetch_end = min(gap_end - gap_end % self.chunk_seconds + self.chunk_seconds - 1, horizon)
+                    if fetch_end < fetch_start:
+                        fetch_end = gap_end
+                    # One request per chunk keeps every response small enough not to be truncated;
+                    # a chunk that fails stays uncovered and is fetched again next time
+                    for chunk_start in range(fetch_start, fetch_end + 1, self.chunk_seconds):
+                        chunk_end = min(chunk_start + self.chunk_seconds - 1, fetch_end)
+                        try:
+                            series = self._fetch(token_id, chunk_start, chunk_end)
+                        except Exception as e:
+                            error = error or e
+                            continue
+                        self.remote_fetches += 1
+                        conn.executemany("INSERT OR REPLACE INTO prices (ts, price) VALUES (?, ?)", series)
+                        if chunk_end <= horizon:
+                            fetched.append((chunk_start, chunk_end))
+                merged = self._merge(list(intervals) + fetched)
+                conn.execute("DELETE FROM coverage")
+                conn.executemany("INSERT INTO coverage (start_ts, end_ts) VALUES (?, ?)", merged)
+                conn.commit()
+            finally:
+                conn.close()
+        if error is not None:
+            raise error  # chunks that did come back are already stored
+
+    # --- Queries ---
+    def price_at(self, token_id: str, start_ts: int, end_ts: int):
+        """Last recorded price in [start_ts, end_ts], or None"""
+        def query():
+            self.ensure_range(token_id, start_ts, end_ts)
+            conn = self._connect(token_id)
+            try:
+                row = conn.execute(
+                    "SELECT price FROM prices WHERE ts BETWEEN ? AND ? ORDER BY ts DESC LIMIT 1",
+                    (start_ts, end_ts)
+                ).fetchone()
+                return row[0] if row else None
+            finally:
+                conn.close()
+        request = {"op": "price_at", "token_id": token_id, "start_ts": start_ts, "end_ts": end_ts}
+        return cassette.call("price_store", request, query)
+
+    def series(self, token_id: str, start_ts: int, end_ts: int, fetch_missing: bool = True):
+        """All (ts, price) points in [start_ts, end_ts]"""
+        def query():
+            if fetch_missing:
+                self.ensure_range(token_id, start_ts, end_ts)
+            elif not os.path.exists(self._path(token_id)):
+                return []
+            conn = self._connect(token_id)
+            try:
+                return conn.execute(
+                    "SELECT ts, price FROM prices WHERE ts BETWEEN ? AND ? ORDER BY ts",
+                    (start_ts, end_ts)
+                ).fetchall()
+            finally:
+                conn.close()
+        request = {"op": "series", "token_id": token_id, "start_ts": start_ts, "end_ts": end_ts,
+                   "fetch_missing": fetch_missing}
+        return [tuple(point) for point in cassette.call("price_store", request, query)]
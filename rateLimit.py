@@ -0,0 +1,84 @@
+# rateLimit.py
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Token-bucket rate limiter usable from threads (acquire) and coroutines (acquire_async).
+
+    `rate` tokens are added per second up to `burst`; each call takes one token.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float = 1.0) -> float:
+        """Take `tokens` now and return how long the caller must wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Drain the bucket so nothing goes out for `seconds` (e.g. after a 429 Retry-After)"""
+        with self._lock:
+            self._updated = time.monotonic()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+# Per-service limits for external calls ("tavily", "ollama", "polymarket", ...).
+# Unconfigured services are unlimited.
+_limits = {}
+_limits_lock = threading.Lock()
+
+
+def configure(service: str, rate: float, burst: float = None):
+    with _limits_lock:
+        if rate and rate > 0:
+            _limits[service] = TokenBucket(rate, burst)
+        else:
+            _limits.pop(service, None)
+
+
+def get_limiter(service: str):
+    return _limits.get(service)
+
+
+def acquire(service: str):
+    limiter = _limits.get(service)
+    if limiter is not None:
+        limiter.acquire()
+
+
+async def acquire_async(service: str):
+    limiter = _limits.get(service)
+    if limiter is not None:
+        await limiter.acquire_async()
+
+
+def parse_rate_specs(specs):
+    """['tavily=2', 'ollama=5:10'] -> {'tavily': (2.0, None), 'ollama': (5.0, 10.0)}"""
+    parsed = {}
+    for spec in specs or []:
+        service, _, value = spec.partition("=")
+        rate, _, burst = value.partition(":")
+        parsed[service.strip()] = (float(rate), float(burst) if burst else None)
+    return parsed
@@ -0,0 +1,151 @@
+# stageCache.py
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.documents import Document
+from cassette import cassette
+
+DEFAULT_STAGE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_cache.sqlite")
+
+
+class StageCache:
+    """Memoizes pipeline node outputs for parameter sweeps.
+
+    A node's key is sha256 of its name, a hash of its source (plus the helpers that
+    hold its prompts), the config values it depends on and the state fields it reads.
+    Upstream changes flow in through those state fields, so changing e.g. top_k reuses
+    enrichment but recomputes retrieval and everything after it. Nodes that read outside
+    state (retrieval reads the vector index) add a `context` callable whose values -
+    index size, ingest watermark, embedding backend - are part of the key too.
+
+    Disabled unless STAGE_CACHE=1 or enable() is called (live runs always recompute).
+    Also bypassed while the cassette records or replays: a hit would skip the node's
+    external calls, leaving them out of the recording.
+    """
+
+    def __init__(self, path: str = DEFAULT_STAGE_CACHE_PATH, enabled: bool = False):
+        self.path = path
+        self.enabled = enabled
+        self.models = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def register_model(self, cls):
+        """Allow a pydantic model class in node outputs (stored as model_dump, rebuilt on load)"""
+        self.models[cls.__name__] = cls
+        return cls
+
+    def _connection(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS stage_cache (
+                            key TEXT PRIMARY KEY,
+                            node TEXT NOT NULL,
+                            value TEXT NOT NULL,
+                            created_at REAL NOT NULL
+                        )
+                    """)
+                    conn.commit()
+                    self._conn = conn
+        return self._conn
+
+    # --- Encoding ---
+    def _encode(self, value):
+        if isinstance(value, Document):
+            return {"__document__": {"id": value.id, "page_content": value.page_content, "metadata": value.metadata}}
+        if hasattr(value, "model_dump") and type(value).__name__ in self.models:
+            return {"__model__": type(value).__name__, "data": value.model_dump()}
+        if isinstance(value, dict):
+            return {key: self._encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._encode(item) for item in value]
+        return value
+
+    def _decode(self, obj):
+        if "__document__" in obj:
+            return Document(**obj["__document__"])
+        if "__model__" in obj:
+            return self.models[obj["__model__"]].model_validate(obj["data"])
+        return obj
+
+    def dumps(self, value) -> str:
+        return json.dumps(self._encode(value), sort_keys=True, default=str)
+
+    def loads(self, payload: str):
+        return json.loads(payload, object_hook=self._decode)
+
+    # --- Keys ---
+    @staticmethod
+    def code_version(parts) -> str:
+        """Hash of functions' source and any literal prompt text"""
+        source = "".join(part if isinstance(part, str) else inspect.getsource(part) for part in parts)
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+    def make_key(self, node: str, code: str, config: dict, inputs: dict) -> str:
+        raw = self.dumps({"node": node, "code": code, "config": config, "inputs": inputs})
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _count(self, node: str, field: str):
+        with self._lock:
+            node_stats = self.stats.setdefault(node, {"hits": 0, "misses": 0})
+            node_stats[field] += 1
+
+    def report(self) -> dict:
+        with self._lock:
+            return {node: dict(stats) for node, stats in self.stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {}
+
+    # --- Nodes ---
+    def node(self, name: str, fn, inputs, config=(), code=(), get_config=None, context=None):
+        """Wrap a sync node (or routing function) so its output is memoized.
+
+        inputs     - state fields the node reads
+        config     - names of config values it depends on, looked up through get_config()
+        code       - extra functions (prompt builders) or prompt strings that are part of the version
+        context    - callable -> dict of external state the output depends on, read on every call
+        """
+        version = self.code_version([fn, *code])
+
+        @functools.wraps(fn)
+        def memoized(state):
+            if not self.enabled or cassette.mode != "off":
+                return fn(state)
+            current = get_config() if get_config else {}
+            options = {option: current.get(option) for option in config}
+            if context is not None:
+                options["context"] = context()
+            key = self.make_key(name, version, options, {field: state.get(field) for field in inputs})
+            conn = self._connection()
+            with self._lock:
+                row = conn.execute("SELECT value FROM stage_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._count(name, "hits")
+                return self.loads(row[0])
+            self._count(name, "misses")
+            result = fn(state)
+            with self._lock:
+                conn.execute(
+                    "INSERT OR REPLACE INTO stage_cache (key, node, value, created_at) VALUES (?, ?, ?, ?)",
+                    (key, name, self.dumps(result), time.time())
+                )
+                conn.commit()
+            return result
+
+        return memoized
@@ -0,0 +1,128 @@
+# sweep.py
+
+import asyncio
+import csv
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from backtest import configure_run, load_corpus, run_bounded
+from langgraphPipe import stage_cache, decision_log, pipeline_config, configure_pipeline
+import rateLimit
+
+
+def parse_grid(specs) -> dict:
+    """['top_k=3,5,8', 'significance_prompt=v1,terse'] -> {'top_k': [3, 5, 8], 'significance_prompt': ['v1', 'terse']}
+
+    Values are converted to the type of the parameter's current value.
+    """
+    defaults = pipeline_config()
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in defaults:
+            raise ValueError(f"Unknown parameter '{name}' (expected one of {', '.join(defaults)})")
+        kind = type(defaults[name])
+        if kind is bool:
+            convert = lambda value: value.strip().lower() in ("1", "true", "yes", "on")
+        else:
+            convert = lambda value, kind=kind: kind(value.strip())
+        grid[name] = [convert(value) for value in values.split(",") if value.strip()]
+    return grid
+
+
+def expand_grid(grid: dict):
+    """Cartesian product of the grid as a list of override dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def count_actions(csv_path: str) -> dict:
+    counts = {"BUY": 0, "SKIP": 0}
+    if os.path.exists(csv_path):
+        with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                counts[row.get('action')] = counts.get(row.get('action'), 0) + 1
+    return counts
+
+
+async def run_sweep(filename, limit, concurrency, grid, out_dir):
+    """Run every configuration in the grid over the same corpus with node outputs memoized"""
+    stage_cache.enable()
+    account, tweets = load_corpus(filename, limit)
+    base = pipeline_config()
+    runs = expand_grid(grid) or [{}]
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"🧪 Sweep: {len(runs)} configurations x {len(tweets)} tweets -> {out_dir}")
+
+    summary = []
+    for number, overrides in enumerate(runs, start=1):
+        config = configure_pipeline(**dict(base, **overrides))
+        run_dir = os.path.join(out_dir, f"run-{number:03d}")
+        os.makedirs(run_dir, exist_ok=True)
+        trades_path = os.path.join(run_dir, "trades.csv")
+        decision_log.redirect(trades_path, decision_log.parquet_dir and os.path.join(run_dir, "parquet"))
+        stage_cache.reset_stats()
+
+        print(f"\n▶️  Run {number}/{len(runs)}: {json.dumps(overrides)}")
+        started = time.time()
+        results = await run_bounded(tweets, concurrency, account)
+        decision_log.close()
+        elapsed = time.time() - started
+
+        stages = stage_cache.report()
+        row = {
+            "run": number,
+            "overrides": overrides,
+            "config": config,
+            "seconds": round(elapsed, 2),
+            "errors": sum(1 for r in results if isinstance(r, Exception)),
+            "actions": count_actions(trades_path),
+            "stage_cache": stages,
+            "trades_path": trades_path,
+        }
+        summary.append(row)
+        with open(os.path.join(run_dir, "config.json"), 'w', encoding='utf-8') as f:
+            json.dump(row, f, indent=2)
+        reused = sum(stats["hits"] for stats in stages.values())
+        computed = sum(stats["misses"] for stats in stages.values())
+        print(f"✅ Run {number}: {elapsed:.1f}s | {row['actions'].get('BUY', 0)} buys, {row['actions'].get('SKIP', 0)} skips | "
+              f"stages reused {reused}, computed {computed}")
+
+    configure_pipeline(**base)
+    with open(os.path.join(out_dir, "summary.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+
+    print("\n📋 Sweep summary")
+    for row in summary:
+        print(f"  run {row['run']:>3} | {row['seconds']:>7.1f}s | buys {row['actions'].get('BUY', 0):>4} | "
+              f"skips {row['actions'].get('SKIP', 0):>4} | errors {row['errors']:>3} | {json.dumps(row['overrides'])}")
+    print("Evaluate a run with: python pnlAnalytics.py --trades <run-dir>/trades.csv")
+    return summary
+
+
+def main():
+    """CLI entrypoint: run a parameter grid over one tweet corpus, reusing unchanged stages."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Sweep pipeline parameters over a tweet corpus.")
+    parser.add_argument('--file', default='elonmusk_tweets.json', help='Tweets JSON file ({"tweets": [...]})')
+    parser.add_argument('--limit', type=int, default=50, help='Number of tweets per run (0 = all)')
+    parser.add_argument('--concurrency', type=int, default=10, help='Tweets processed concurrently')
+    parser.add_argument('--grid', action='append', default=[], metavar='PARAM=V1,V2,...',
+                        help=f"Parameter values to sweep; repeatable. Parameters: {', '.join(pipeline_config())}")
+    parser.add_argument('--rate', action='append', default=[], metavar='SERVICE=PER_SEC[:BURST]',
+                        help='Rate limit for an external service (tavily, ollama, polymarket); repeatable')
+    parser.add_argument('--io-mode', choices=['off', 'record', 'replay', 'auto'], default=None,
+                        help='Record external responses to a cassette, or replay them with no network')
+    parser.add_argument('--out-dir', default=None, help='Directory for per-run decisions and the summary')
+    args = parser.parse_args()
+
+    configure_run(rateLimit.parse_rate_specs(args.rate), args.io_mode)
+    out_dir = args.out_dir or os.path.join("sweeps", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    asyncio.run(run_sweep(args.file, args.limit, args.concurrency, parse_grid(args.grid), out_dir))
+
+
+if __name__ == "__main__":
+    main()
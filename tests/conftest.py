@@ -0,0 +1,17 @@
+# tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Modules that open caches and logs at import time write into a scratch directory, not the repo
+_scratch = tempfile.mkdtemp(prefix="pipeline-tests-")
+for name, filename in (("LLM_CACHE_PATH", "llm_cache.sqlite"), ("STAGE_CACHE_PATH", "stage_cache.sqlite"),
+                       ("PRICE_STORE_DIR", "price_history"), ("TRADE_LOG_CSV", "trades.csv")):
+    os.environ.setdefault(name, os.path.join(_scratch, filename))
+os.environ.setdefault("IO_MODE", "off")
+os.environ.setdefault("STAGE_CACHE", "0")
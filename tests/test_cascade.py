@@ -0,0 +1,78 @@
+# tests/test_cascade.py
+
+import pytest
+
+pipe = pytest.importorskip("langgraphPipe")
+
+
+# --- Confidence parsing ---
+def test_split_confidence_strips_the_confidence_line():
+    assert pipe.split_confidence("2\nCONFIDENCE: 85") == ("2", 0.85)
+
+
+def test_split_confidence_takes_the_last_line():
+    answer, confidence = pipe.split_confidence("CONFIDENCE: 10\nYes, trade.\nconfidence: 90%")
+    assert confidence == 0.9
+    assert answer == "CONFIDENCE: 10\nYes, trade."
+
+
+def test_split_confidence_ignores_inline_mentions():
+    text = "1 (CONFIDENCE: 82)"
+    assert pipe.split_confidence(text) == (text, None)
+    reasoning = "My confidence: high because of the news"
+    assert pipe.split_confidence(reasoning) == (reasoning, None)
+
+
+def test_normalize_confidence_accepts_percent_and_fraction():
+    assert pipe.normalize_confidence(75) == 0.75
+    assert pipe.normalize_confidence(0.6) == 0.6
+    assert pipe.normalize_confidence(250) == 1.0
+    assert pipe.normalize_confidence(None) is None
+
+
+# --- Token choice ---
+@pytest.mark.parametrize("answer, index", [
+    ("1", 0),
+    ("2", 1),
+    ("Token 2.", 1),
+    ("**2**", 1),
+    ("1 (CONFIDENCE: 82)", 0),
+    ("1, CONFIDENCE: 72", 0),
+    ("2 - CONFIDENCE: 91", 1),
+    ("12", 0),
+    ("", 0),
+])
+def test_parse_token_choice(answer, index):
+    assert pipe.parse_token_choice(answer) == index
+
+
+# --- Cascade ---
+@pytest.fixture
+def cascade(monkeypatch):
+    monkeypatch.setattr(pipe, "MODEL_TIERS", {"small": "small-model", "large": "large-model"})
+    monkeypatch.setattr(pipe, "DECISION_ROUTING", {"choice": ["small", "large"]})
+    monkeypatch.setattr(pipe, "CONFIDENCE_THRESHOLD", 0.7)
+    monkeypatch.setattr(pipe, "cascade_stats", {"decisions": {}, "tiers": {}})
+    return pipe
+
+
+def test_confident_small_answer_is_not_escalated(cascade):
+    calls = []
+    answer = cascade.run_cascade("choice", lambda model: calls.append(model) or ("1", 0.9))
+    assert answer == "1" and calls == ["small-model"]
+    assert cascade.cascade_stats["decisions"]["choice"] == {"calls": 1, "escalated": 0, "failed_escalations": 0}
+
+
+def test_low_confidence_escalates_to_the_large_tier(cascade):
+    answers = {"small-model": ("1", 0.3), "large-model": ("2", 0.95)}
+    assert cascade.run_cascade("choice", lambda model: answers[model]) == "2"
+    assert cascade.cascade_stats["decisions"]["choice"]["escalated"] == 1
+
+
+def test_failed_escalation_keeps_the_small_answer_and_is_counted_separately(cascade):
+    def attempt(model):
+        if model == "large-model":
+            raise RuntimeError("timeout")
+        return "1", 0.3
+    assert cascade.run_cascade("choice", attempt) == "1"
+    assert cascade.cascade_stats["decisions"]["choice"] == {"calls": 1, "escalated": 0, "failed_escalations": 1}
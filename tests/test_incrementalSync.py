@@ -0,0 +1,120 @@
+# tests/test_incrementalSync.py
+
+import asyncio
+import pytest
+
+ingest = pytest.importorskip("newfile")
+
+
+def make_event(event_id="e1", **overrides):
+    event = {
+        "id": event_id,
+        "title": "Will it rain?",
+        "endDate": "2030-01-01T00:00:00Z",
+        "startDate": "2025-01-01T00:00:00Z",
+        "active": True,
+        "closed": False,
+        "volume": 100,
+        "markets": [{"conditionId": "c1", "clobTokenIds": '["t1", "t2"]', "outcomes": '["Yes", "No"]'}],
+    }
+    event.update(overrides)
+    return event
+
+
+class FakeConn:
+    """Answers the two queries load_unchanged_events makes from in-memory markets/tokens rows"""
+
+    def __init__(self, markets, tokens):
+        self.markets = markets  # {market_id: content_hash}
+        self.tokens = tokens    # [(token_id, market_id, name)]
+
+    async def fetch(self, sql, ids):
+        if "FROM tokens" in sql:
+            return [{"id": t, "market_id": m, "name": n} for t, m, n in self.tokens if m in ids]
+        return [{"id": m, "content_hash": h} for m, h in self.markets.items() if m in ids]
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {}
+
+    def json(self):
+        return self._payload
+
+
+class FakeFetcher:
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    async def get(self, url, service):
+        self.calls += 1
+        return self.response
+
+
+# --- Content hash ---
+def test_hash_ignores_volume_churn():
+    assert ingest.event_content_hash(make_event(volume=1)) == ingest.event_content_hash(make_event(volume=999))
+
+
+def test_hash_changes_with_stored_fields():
+    base = ingest.event_content_hash(make_event())
+    assert ingest.event_content_hash(make_event(title="Will it snow?")) != base
+    assert ingest.event_content_hash(make_event(endDate="2031-01-01T00:00:00Z")) != base
+    assert ingest.event_content_hash(make_event(markets=[])) != base
+
+
+def test_hash_ignores_market_order():
+    markets = [{"conditionId": "a"}, {"conditionId": "b"}]
+    assert ingest.event_content_hash(make_event(markets=markets)) == \
+        ingest.event_content_hash(make_event(markets=list(reversed(markets))))
+
+
+# --- Unchanged events ---
+def test_unchanged_events_reuse_stored_tokens():
+    event = make_event("e1")
+    conn = FakeConn({"e1": ingest.event_content_hash(event)}, [("t1", "e1", "Yes"), ("t2", "e1", "No")])
+    unchanged = asyncio.run(ingest.load_unchanged_events(conn, [event]))
+    assert unchanged == {"e1": [{"token_id": "t1", "outcome": "Yes"}, {"token_id": "t2", "outcome": "No"}]}
+
+
+def test_changed_and_unhashed_events_are_refetched():
+    changed, unhashed = make_event("e1"), make_event("e2")
+    conn = FakeConn({"e1": "stale-hash", "e2": None}, [("t1", "e1", "Yes"), ("t2", "e2", "Yes")])
+    assert asyncio.run(ingest.load_unchanged_events(conn, [changed, unhashed])) == {}
+
+
+def test_markets_without_stored_tokens_are_refetched():
+    event = make_event("e1")
+    conn = FakeConn({"e1": ingest.event_content_hash(event)}, [])
+    assert asyncio.run(ingest.load_unchanged_events(conn, [event])) == {}
+
+
+# --- Market records ---
+@pytest.mark.parametrize("response", [
+    FakeResponse(429),
+    FakeResponse(503),
+    FakeResponse(200, {"data": []}),
+    FakeResponse(200, {"data": [{"tokens": []}]}),
+])
+def test_failed_token_lookup_stores_no_hash(response):
+    record = asyncio.run(ingest.build_market_record(make_event(), FakeFetcher(response)))
+    assert record["tokens"] == []
+    assert record["content_hash"] is None
+
+
+def test_successful_token_lookup_stores_the_hash():
+    tokens = [{"token_id": "t1", "outcome": "Yes"}]
+    record = asyncio.run(ingest.build_market_record(make_event(), FakeFetcher(FakeResponse(200, {"data": [{"tokens": tokens}]}))))
+    assert record["tokens"] == tokens
+    assert record["content_hash"] == ingest.event_content_hash(make_event())
+
+
+def test_stored_tokens_skip_the_lookup():
+    fetcher = FakeFetcher(FakeResponse(500))
+    stored = [{"token_id": "t1", "outcome": "Yes"}]
+    record = asyncio.run(ingest.build_market_record(make_event(), fetcher, stored))
+    assert fetcher.calls == 0
+    assert record["tokens"] == stored
+    assert record["content_hash"] == ingest.event_content_hash(make_event())
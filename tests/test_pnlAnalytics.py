@@ -0,0 +1,64 @@
+# tests/test_pnlAnalytics.py
+
+import math
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("numpy")
+pytest.importorskip("requests")
+from pnlAnalytics import compute_returns, parse_horizons
+
+HORIZONS = {"1h": 3600, "24h": 86400}
+
+
+def prices_frame(points):
+    return pd.DataFrame(points, columns=["token_id", "ts", "price"])
+
+
+def test_parse_horizons():
+    assert parse_horizons("5m, 1h,24h,7d") == {"5m": 300, "1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+
+def test_entry_and_exit_are_as_of_lookups():
+    trades = pd.DataFrame({"token_id": ["a"], "ts": [10_000]})
+    prices = prices_frame([
+        ("a", 9_000, 0.40),          # entry: last point at or before the trade
+        ("a", 10_500, 0.90),         # after the trade - must not be used as entry
+        ("a", 10_000 + 3_000, 0.50),  # exit for 1h (as of 13_600)
+    ])
+    result = compute_returns(trades, prices, {"1h": 3600})
+    assert result.loc[0, "entry_price"] == pytest.approx(0.40)
+    assert result.loc[0, "ret_1h"] == pytest.approx(0.50 / 0.40 - 1.0)
+
+
+def test_stale_prices_count_as_missing():
+    trades = pd.DataFrame({"token_id": ["a"], "ts": [100_000]})
+    prices = prices_frame([("a", 100_000 - 7_200, 0.40)])
+    result = compute_returns(trades, prices, HORIZONS, tolerance=3600)
+    assert math.isnan(result.loc[0, "entry_price"])
+    assert math.isnan(result.loc[0, "ret_1h"])
+
+
+def test_prices_never_leak_across_tokens():
+    trades = pd.DataFrame({"token_id": ["a", "b", "c"], "ts": [50_000, 50_000, 50_000]})
+    prices = prices_frame([
+        ("a", 49_000, 0.20), ("a", 53_000, 0.30),
+        ("b", 49_500, 0.80), ("b", 53_500, 0.40),
+    ])
+    result = compute_returns(trades, prices, {"1h": 3600})
+    assert list(result["entry_price"][:2]) == pytest.approx([0.20, 0.80])
+    assert list(result["ret_1h"][:2]) == pytest.approx([0.30 / 0.20 - 1.0, 0.40 / 0.80 - 1.0])
+    assert math.isnan(result.loc[2, "entry_price"])  # no prices for token c
+
+
+def test_zero_entry_price_has_no_return():
+    trades = pd.DataFrame({"token_id": ["a"], "ts": [10_000]})
+    prices = prices_frame([("a", 10_000, 0.0), ("a", 13_600, 0.5)])
+    result = compute_returns(trades, prices, {"1h": 3600})
+    assert math.isnan(result.loc[0, "ret_1h"])
+
+
+def test_empty_price_frame():
+    trades = pd.DataFrame({"token_id": ["a"], "ts": [10_000]})
+    result = compute_returns(trades, prices_frame([]), HORIZONS)
+    assert math.isnan(result.loc[0, "entry_price"])
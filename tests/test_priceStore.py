@@ -0,0 +1,98 @@
+# tests/test_priceStore.py
+
+import sqlite3
+import pytest
+
+pytest.importorskip("requests")
+from priceStore import PriceHistoryStore, parse_price_history
+
+DAY = 86400
+
+
+def coverage(store, token_id):
+    conn = sqlite3.connect(store._path(token_id))
+    try:
+        return conn.execute("SELECT start_ts, end_ts FROM coverage ORDER BY start_ts").fetchall()
+    finally:
+        conn.close()
+
+
+class FakeHistory:
+    """Stands in for /prices-history: one point per requested range, optional failing ranges"""
+
+    def __init__(self, fail_starts=()):
+        self.calls = []
+        self.fail_starts = set(fail_starts)
+
+    def __call__(self, token_id, start_ts, end_ts):
+        self.calls.append((start_ts, end_ts))
+        if start_ts in self.fail_starts:
+            raise RuntimeError(f"HTTP 429 for {start_ts}")
+        return [(start_ts + 10, 0.5)]
+
+
+# --- Coverage intervals ---
+def test_missing_without_coverage_is_the_whole_range():
+    assert PriceHistoryStore._missing([], 100, 200) == [(100, 200)]
+
+
+def test_missing_returns_only_uncovered_gaps():
+    intervals = [(0, 9), (20, 29), (40, 49)]
+    assert PriceHistoryStore._missing(intervals, 5, 45) == [(10, 19), (30, 39)]
+
+
+def test_missing_is_empty_when_covered():
+    assert PriceHistoryStore._missing([(0, 100)], 10, 90) == []
+    assert PriceHistoryStore._missing([(0, 49), (50, 100)], 0, 100) == []
+
+
+def test_missing_tail_after_last_interval():
+    assert PriceHistoryStore._missing([(0, 9)], 5, 20) == [(10, 20)]
+
+
+def test_merge_joins_overlapping_and_adjacent_intervals():
+    assert PriceHistoryStore._merge([(10, 19), (0, 9), (15, 30), (40, 50)]) == [(0, 30), (40, 50)]
+
+
+def test_merge_keeps_disjoint_intervals():
+    assert PriceHistoryStore._merge([(0, 9), (11, 20)]) == [(0, 9), (11, 20)]
+
+
+# --- Fetching ---
+def test_ensure_range_fetches_one_request_per_chunk(tmp_path):
+    fetch = FakeHistory()
+    store = PriceHistoryStore(str(tmp_path), chunk_seconds=DAY, fetch=fetch)
+    store.ensure_range("token", 100, 3 * DAY + 5)
+    assert fetch.calls == [(0, DAY - 1), (DAY, 2 * DAY - 1), (2 * DAY, 3 * DAY - 1), (3 * DAY, 4 * DAY - 1)]
+    assert coverage(store, "token") == [(0, 4 * DAY - 1)]
+
+    store.ensure_range("token", 500, 2 * DAY)
+    assert len(fetch.calls) == 4  # served locally
+
+
+def test_failed_chunk_stays_uncovered_and_is_refetched(tmp_path):
+    fetch = FakeHistory(fail_starts={DAY})
+    store = PriceHistoryStore(str(tmp_path), chunk_seconds=DAY, fetch=fetch)
+    with pytest.raises(RuntimeError):
+        store.ensure_range("token", 0, 3 * DAY - 1)
+    assert coverage(store, "token") == [(0, DAY - 1), (2 * DAY, 3 * DAY - 1)]
+    assert store.series("token", 0, 3 * DAY - 1, fetch_missing=False) == [(10, 0.5), (2 * DAY + 10, 0.5)]
+
+    fetch.fail_starts.clear()
+    fetch.calls.clear()
+    store.ensure_range("token", 0, 3 * DAY - 1)
+    assert fetch.calls == [(DAY, 2 * DAY - 1)]
+    assert coverage(store, "token") == [(0, 3 * DAY - 1)]
+
+
+def test_price_at_returns_last_point_in_window(tmp_path):
+    store = PriceHistoryStore(str(tmp_path), chunk_seconds=DAY,
+                              fetch=lambda token_id, start_ts, end_ts: [(start_ts + 10, 0.4), (start_ts + 20, 0.6)])
+    assert store.price_at("token", 0, 15) == 0.4
+    assert store.price_at("token", 0, 100) == 0.6
+    assert store.price_at("token", 0, 5) is None
+
+
+def test_parse_price_history_sorts_and_skips_incomplete_points():
+    payload = {"history": [{"t": 20, "p": "0.6"}, {"t": 10, "p": 0.5}, {"t": 30}]}
+    assert parse_price_history(payload) == [(10, 0.5), (20, 0.6)]
@@ -0,0 +1,82 @@
+# tests/test_rateLimit.py
+
+import asyncio
+import time
+import pytest
+import rateLimit
+from rateLimit import TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def clean_limits():
+    saved = dict(rateLimit._limits)
+    rateLimit._limits.clear()
+    yield
+    rateLimit._limits.clear()
+    rateLimit._limits.update(saved)
+
+
+def test_burst_is_free_then_calls_wait_one_interval_each():
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket._reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket._reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_default_burst_is_the_rate_but_at_least_one():
+    assert TokenBucket(rate=5).burst == 5
+    assert TokenBucket(rate=0.5).burst == 1
+
+
+def test_tokens_refill_up_to_burst():
+    bucket = TokenBucket(rate=100, burst=2)
+    bucket._reserve(), bucket._reserve()
+    time.sleep(0.05)  # 5 tokens' worth of refill, capped at 2
+    assert [bucket._reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket._reserve() > 0
+
+
+def test_pause_blocks_for_the_given_time():
+    bucket = TokenBucket(rate=10, burst=5)
+    bucket.pause(1.0)
+    assert bucket._reserve() == pytest.approx(1.1, abs=0.02)
+
+
+def test_acquire_paces_calls():
+    bucket = TokenBucket(rate=50, burst=1)
+    started = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - started >= 0.055  # 3 waits of 20ms
+
+
+def test_acquire_async_paces_calls():
+    bucket = TokenBucket(rate=50, burst=1)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire_async() for _ in range(4)))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.055
+
+
+def test_unconfigured_services_are_unlimited():
+    assert rateLimit.get_limiter("tavily") is None
+    started = time.monotonic()
+    for _ in range(100):
+        rateLimit.acquire("tavily")
+    assert time.monotonic() - started < 0.05
+
+
+def test_configure_and_disable():
+    rateLimit.configure("ollama", 5, 10)
+    limiter = rateLimit.get_limiter("ollama")
+    assert (limiter.rate, limiter.burst) == (5, 10)
+    rateLimit.configure("ollama", 0)
+    assert rateLimit.get_limiter("ollama") is None
+
+
+def test_parse_rate_specs():
+    assert rateLimit.parse_rate_specs(["tavily=2", " ollama = 5:10"]) == {"tavily": (2.0, None), "ollama": (5.0, 10.0)}
+    assert rateLimit.parse_rate_specs(None) == {}
@@ -0,0 +1,40 @@
+# tests/test_tradeLog.py
+
+import csv
+import os
+from tradeLog import CSV_FIELDS, DecisionLogWriter, rotate_stale_csv
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+def test_rotate_leaves_missing_and_current_files_alone(tmp_path):
+    path = tmp_path / "trades.csv"
+    assert rotate_stale_csv(str(path)) is None
+    path.write_text(",".join(CSV_FIELDS) + "\n", encoding="utf-8")
+    assert rotate_stale_csv(str(path)) is None
+    assert path.exists()
+
+
+def test_rotate_moves_a_file_with_an_older_header(tmp_path):
+    path = tmp_path / "trades.csv"
+    path.write_text("date,tweet,action\n2025-01-01,hi,SKIP\n", encoding="utf-8")
+    rotated = rotate_stale_csv(str(path))
+    assert rotated is not None and not path.exists()
+    assert os.path.basename(rotated).startswith("trades.") and rotated.endswith(".csv")
+    assert read_rows(rotated)[0] == ["date", "tweet", "action"]
+
+
+def test_writer_starts_a_fresh_file_after_rotation(tmp_path):
+    path = tmp_path / "trades.csv"
+    path.write_text("date,tweet,action\n2025-01-01,hi,SKIP\n", encoding="utf-8")
+    writer = DecisionLogWriter(str(path), flush_interval=0.01)
+    writer.submit({"date": "2025-02-01", "tweet": "hello", "action": "SKIP", "market_name": "m", "account": "acct"})
+    writer.close()
+    rows = read_rows(path)
+    assert rows[0] == CSV_FIELDS
+    assert len(rows) == 2
+    assert dict(zip(CSV_FIELDS, rows[1]))["account"] == "acct"
+    assert len(list(tmp_path.glob("trades.*.csv"))) == 1
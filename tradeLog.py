@@ -0,0 +1,172 @@
+# tradeLog.py
+
+import ast
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+
+# market_id / token_id / account are appended (not interleaved) so older readers keep their column positions
+CSV_FIELDS = ['date', 'tweet', 'market_name', 'token_name', 'action', 'purchase_price', 'price_24h', 'profit_loss_pct', 'reasoning', 'skip_reason',
+              'market_id', 'token_id', 'account']
+
+_STOP = object()
+
+
+def rotate_stale_csv(path: str):
+    """Move aside an existing CSV whose header is not CSV_FIELDS, so appended rows never misalign -> new path or None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+        header = next(csv.reader(csvfile), None)
+    if header is None or header == CSV_FIELDS:
+        return None
+    stem, ext = os.path.splitext(path)
+    rotated = f"{stem}.{time.strftime('%Y%m%d-%H%M%S')}{ext or '.csv'}"
+    os.replace(path, rotated)
+    print(f"[tradeLog] {path} has an outdated header ({len(header)} columns, "
+          f"expected {len(CSV_FIELDS)}); moved it to {rotated}")
+    return rotated
+
+
+def clean_tweet_text(tweet_text, limit=200):
+    """Extract the text of a stringified tweet dict, limited to `limit` chars"""
+    if isinstance(tweet_text, str) and tweet_text.startswith("{'id':"):
+        try:
+            tweet_dict = ast.literal_eval(tweet_text)
+            return tweet_dict.get('text', tweet_text)[:limit]
+        except Exception:
+            pass
+    return tweet_text
+
+
+class DecisionLogWriter:
+    """Single background writer for trade/skip decisions.
+
+    Pipeline nodes call submit(), which only enqueues the raw record. A dedicated
+    thread drains the queue, does the slow parts (tweet parsing, market-name
+    resolution), and appends batches to the CSV and - if pyarrow is available -
+    a Parquet dataset directory, flushing every `flush_interval` seconds or
+    `batch_size` records, whichever comes first.
+    """
+
+    def __init__(self, csv_path: str = 'trades.csv', parquet_dir: str = None,
+                 flush_interval: float = 2.0, batch_size: int = 200, resolve_market_name=None):
+        self.csv_path = csv_path
+        self.parquet_dir = parquet_dir
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.resolve_market_name = resolve_market_name
+        self.written = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._parquet_seq = 0
+        self._header_checked = False
+
+    def submit(self, record: dict):
+        """Enqueue a decision record - never blocks on I/O"""
+        if self._thread is None:
+            self._start()
+        self._queue.put(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="decision-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything still queued and stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def redirect(self, csv_path: str, parquet_dir: str = None):
+        """Flush to the current files, then send further records to new ones (per shard / sweep run)"""
+        self.close()
+        self._thread = None
+        self.csv_path = csv_path
+        self.parquet_dir = parquet_dir
+        self.written = 0
+        self._header_checked = False
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _prepare(self, record: dict) -> dict:
+        row = {field: record.get(field) for field in CSV_FIELDS}
+        row['tweet'] = clean_tweet_text(record.get('tweet', ''))
+        market_id = record.get('market_id')
+        if not row.get('market_name'):
+            if market_id and market_id != 'unknown_market_0':
+                try:
+                    market_title = self.resolve_market_name(market_id) if self.resolve_market_name else None
+                    row['market_name'] = market_title[:100] if market_title else "No matching market found"
+                except Exception as e:
+                    print(f"Error getting market name for CSV: {e}")
+                    row['market_name'] = "Database error"
+            else:
+                row['market_name'] = "No relevant markets found"
+        return row
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        rows = [self._prepare(record) for record in batch]
+        try:
+            if not self._header_checked:
+                rotate_stale_csv(self.csv_path)
+                self._header_checked = True
+            file_exists = os.path.exists(self.csv_path) and os.path.getsize(self.csv_path) > 0
+            with open(self.csv_path, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerows(rows)
+            self.written += len(rows)
+        except Exception as e:
+            print(f"[DecisionLogWriter] CSV flush failed: {e}")
+        if self.parquet_dir:
+            self._flush_parquet(rows)
+
+    def _flush_parquet(self, rows):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("[DecisionLogWriter] pyarrow not installed, skipping Parquet output")
+            self.parquet_dir = None
+            return
+        try:
+            os.makedirs(self.parquet_dir, exist_ok=True)
+            columns = {field: [row.get(field) for row in rows] for field in CSV_FIELDS}
+            for field in ('purchase_price', 'price_24h', 'profit_loss_pct'):
+                columns[field] = [float(value) if value is not None and value != '' else None for value in columns[field]]
+            for field in CSV_FIELDS:
+                if field not in ('purchase_price', 'price_24h', 'profit_loss_pct'):
+                    columns[field] = [str(value) if value is not None else None for value in columns[field]]
+            table = pa.table(columns)
+            self._parquet_seq += 1
+            part = os.path.join(self.parquet_dir, f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._parquet_seq:05d}.parquet")
+            pq.write_table(table, part)
+        except Exception as e:
+            print(f"[DecisionLogWriter] Parquet flush failed: {e}")
@@ -9,6 +9,11 @@ import json
 from datetime import datetime
 from dotenv import load_dotenv
 from langgraphTester import runcom
+from langgraphPipe import start_warmup
+from jobQueue import get_queue_connection, create_job_table, enqueue_job, backlog_stats
+
+# "inline" runs the pipeline inside this process; "queue" hands it to jobQueue.py workers
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "inline")
 
 app = FastAPI()
 
@@ -34,6 +39,18 @@ collection = client.get_or_create_collection(name="tweets")
 
 polymarketCollection = client.get_or_create_collection(name="events")
 
+@app.on_event("startup")
+async def warm_pipeline():
+    """Load the embedding model, Chroma and the LLM in the background so the first tweet is fast"""
+    if PIPELINE_MODE == "queue":
+        conn = await get_queue_connection()
+        try:
+            await create_job_table(conn)
+        finally:
+            await conn.close()
+        return  # workers run the pipeline, nothing to warm here
+    start_warmup()
+
 # Dashboard event system - simple single user
 current_dashboard = None
 
@@ -127,6 +144,24 @@ async def push_markets(request: Request):
     print(f"Stored event: {event_name} (id: {event_id}) in polymarketCollection")
     return {"status": "stored", "id": event_id}
 
+@app.post("/poly/delete")
+async def delete_markets(request: Request):
+    """Bulk-remove markets (expired or closed) from polymarketCollection"""
+    data = await request.json()
+    ids = [str(event_id) for event_id in data.get("ids") or []]
+    if not ids:
+        return {"status": "deleted", "deleted": 0, "count": polymarketCollection.count()}
+    before = polymarketCollection.count()
+    polymarketCollection.delete(ids=ids)  # ids that are not stored are ignored
+    after = polymarketCollection.count()
+    print(f"Removed {before - after} events from polymarketCollection ({after} remaining)")
+    return {"status": "deleted", "deleted": before - after, "count": after}
+
+@app.get("/poly/count")
+def count_markets():
+    """Size of the market vector index"""
+    return {"count": polymarketCollection.count()}
+
 @app.post("/connect")
 async def connect():
     load_dotenv()  # Load environment variables from .env
@@ -145,6 +180,18 @@ async def connect():
         print(f"DB Connection failed: {e}")
         return None
 
+def tweet_date(created_at=None) -> str:
+    """Tweet's created_at as a naive ISO timestamp, or the receive time if missing/unparseable"""
+    if created_at:
+        try:
+            parsed = datetime.fromisoformat(str(created_at).replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)  # same clock as datetime.now()
+            return parsed.isoformat()
+        except ValueError:
+            pass
+    return datetime.now().isoformat()
+
 @app.post("/receive")
 async def receive_tweet(request: Request):
     print("tweet received")
@@ -186,8 +233,19 @@ async def receive_tweet(request: Request):
             "url": tweet_url
         })
         
-        # Only run AI pipeline for new tweets (fire-and-forget to avoid blocking)
-        asyncio.create_task(run_langgraph_async(tweet_text))
+        # Only run AI pipeline for new tweets
+        if PIPELINE_MODE == "queue":
+            conn = await get_queue_connection()
+            try:
+                job_id = await enqueue_job(conn, {
+                    "tweet_text": tweet_text, "tweet_id": tweet_id, "username": username,
+                    "date": tweet_date(data.get("created_at")),
+                })
+                print(f"Queued pipeline job {job_id} for tweet {tweet_id}")
+            finally:
+                await conn.close()
+        else:
+            asyncio.create_task(run_langgraph_async(tweet_text))  # fire-and-forget to avoid blocking
         
         return {"status": "stored", "tweet_id": tweet_id}
         
@@ -200,6 +258,19 @@ async def receive_tweet(request: Request):
             print(f"Error storing tweet: {e}")
             return {"error": f"Failed to store tweet: {str(e)}"}
 
+@app.get("/api/jobs")
+async def get_job_backlog():
+    """Pipeline job queue backlog (counts by status, oldest queued age)"""
+    try:
+        conn = await get_queue_connection()
+        try:
+            return await backlog_stats(conn)
+        finally:
+            await conn.close()
+    except Exception as e:
+        print(f"Error getting job backlog: {e}")
+        return {"error": str(e)}
+
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard():
     with open("static/dashboard.html", "r") as f:
@@ -2,7 +2,7 @@ import asyncio
 import json
 import os
 from dotenv import load_dotenv
-from newfile import get_asyncpg_connection
+from newfile import get_asyncpg_pool
 import websockets
 import logging
 MARKET_CHANNEL = "market"
@@ -74,18 +74,18 @@ class WebSocketOrderBook:
 
         if asset_id and (best_bid is not None or best_ask is not None):
             try:
-                conn = await get_asyncpg_connection()
-                if best_bid is not None:
-                    await conn.execute(
-                        "UPDATE tokens SET bid_price = $1 WHERE id = $2",
-                        best_bid, asset_id
-                    )
-                if best_ask is not None:
-                    await conn.execute(
-                        "UPDATE tokens SET ask_price = $1 WHERE id = $2",
-                        best_ask, asset_id
-                    )
-                await conn.close()
+                pool = await get_asyncpg_pool()
+                async with pool.acquire() as conn:
+                    if best_bid is not None:
+                        await conn.execute(
+                            "UPDATE tokens SET bid_price = $1 WHERE id = $2",
+                            best_bid, asset_id
+                        )
+                    if best_ask is not None:
+                        await conn.execute(
+                            "UPDATE tokens SET ask_price = $1 WHERE id = $2",
+                            best_ask, asset_id
+                        )
             except Exception as e:
                 logging.error(f"DB error while writing book event for {asset_id}: {e}")
 
@@ -133,7 +133,9 @@ class WebSocketOrderBook:
 
 
         try:
-            conn = await get_asyncpg_connection()
+            # Pooled connection: one per event would pay a full connect for every book update
+            pool = await get_asyncpg_pool()
+            conn = await pool.acquire()
             try:
                 if best_bid is not None:
                     await conn.execute(
@@ -173,7 +175,7 @@ class WebSocketOrderBook:
             except Exception as db_exc:
                 logging.error(f"Database error updating best bid/ask for asset_id {asset_id}: {db_exc}")
             finally:
-                await conn.close()
+                await pool.release(conn)
         except Exception as conn_exc:
             logging.error(f"Error getting DB connection for asset_id {asset_id}: {conn_exc}")
 